@@ -2,78 +2,181 @@
 Rutas API del Gemini AI Chatbot.
 """
 
-import base64
-import io
+import json
+import threading
 import time
-from typing import Any, Tuple
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Iterable, Iterator, Optional, Tuple
 
-import bleach
-import PyPDF2
-from flask import Blueprint, current_app, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 
 from app.auth import get_current_user_from_jwt
+from app.core.fair_scheduler import SchedulerTimeoutError, fair_scheduler
+from app.core.metrics import metrics_manager
+from app.services.chat_pipeline import (
+    ChatRequestError,
+    build_generation_kwargs,
+    conversation_memory,
+    is_error_response,
+    model_override,
+    parse_chat_request,
+    queue_timeout,
+    remember_turn,
+    request_deadline,
+    response_cache_ttl,
+)
+from app.services.conversation_memory import ConversationMemory
+from app.services.model_router import RoutingDecision, model_router
 
 api_bp = Blueprint("api_bp", __name__)
 
+# Huecos de concurrencia de /chat/batch por usuario (o IP), compartidos entre sus lotes simultáneos.
+# Referencias débiles: cada lote mantiene vivo su semáforo mientras tiene elementos en curso y la
+# entrada desaparece cuando el usuario deja de tener lotes, así que el diccionario no crece con
+# cada usuario o IP distintos.
+_batch_slots: "weakref.WeakValueDictionary[str, threading.BoundedSemaphore]" = weakref.WeakValueDictionary()
+_batch_slots_lock = threading.Lock()
 
-def extract_text_from_pdf(pdf_base64: str) -> str:
-    """Extract text from a base64 encoded PDF."""
+
+def _parse_chat_request(data: Optional[dict[str, Any]]) -> Tuple[Optional[dict[str, Any]], Optional[Tuple]]:
+    """
+    Valida el cuerpo de una petición de chat (ver `parse_chat_request`).
+
+    Returns:
+        Una tupla (parámetros, respuesta_de_error). Exactamente uno de los dos es None.
+    """
     try:
-        # Decodificar base64 a bytes
-        # Manejar posibles prefijos como "data:application/pdf;base64,"
-        if "," in pdf_base64:
-            pdf_base64 = pdf_base64.split(",")[1]
+        return parse_chat_request(data), None
+    except ChatRequestError as e:
+        return None, (jsonify(e.to_dict()), e.status)
+
+
+def _get_current_identity() -> Tuple[Optional[int], str]:
+    """Devuelve (ID, rol) del usuario autenticado por JWT; las peticiones anónimas son (None, 'guest')."""
+    try:
+        current_user = get_current_user_from_jwt()
+    except Exception:
+        current_user = None
+    if not current_user:
+        return None, "guest"
+    return current_user.id, current_user.role or "user"
+
+
+def _scheduler_owner(user_id: Optional[int]) -> str:
+    """Clave del flujo de un usuario en el planificador (por IP para las peticiones anónimas)."""
+    return f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
+
+
+def _capacity_error() -> Tuple:
+    return jsonify({"message": "El servicio está saturado. Inténtalo de nuevo en unos segundos."}), 503
+
+
+def _model_override(params: dict[str, Any], role: str) -> Optional[str]:
+    """Nivel de modelo impuesto para la petición actual (ver `model_override`)."""
+    return model_override(params, role, request.endpoint)
+
+
+def _request_deadline() -> float:
+    """Plazo de la petición HTTP actual, acortado por sus cabeceras (ver `request_deadline`)."""
+    return request_deadline(headers=request.headers)
+
 
-        pdf_bytes = base64.b64decode(pdf_base64)
-        pdf_file = io.BytesIO(pdf_bytes)
+def _batch_slot(owner: str, limit: int) -> threading.BoundedSemaphore:
+    """Devuelve el semáforo que limita las llamadas simultáneas al modelo de un usuario en /chat/batch."""
+    with _batch_slots_lock:
+        slot = _batch_slots.get(owner)
+        if slot is None:
+            slot = _batch_slots[owner] = threading.BoundedSemaphore(limit)
+        return slot
 
-        # Leer PDF
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = []
 
-        # Extraer texto de todas las páginas
-        for page in pdf_reader.pages:
-            text.append(page.extract_text())
+def _sse_event(event: str, payload: dict[str, Any]) -> str:
+    """Serializa un evento Server-Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-        return "\n".join(text)
+
+def _sse_chunks(stream: Iterable[str], start_time: float, chunks: list[str]) -> Iterator[str]:
+    """Eventos `chunk` con los trozos del modelo (que se acumulan en `chunks`), con métricas de TTFT e intervalo."""
+    last_chunk_time: Optional[float] = None
+    for text in stream:
+        now = time.time()
+        if last_chunk_time is None:
+            metrics_manager.record_timing("stream_ttft", now - start_time)
+        else:
+            metrics_manager.record_timing("stream_chunk_interval", now - last_chunk_time)
+        last_chunk_time = now
+        chunks.append(text)
+        yield _sse_event("chunk", {"text": text})
+
+
+def _sse_chat_events(
+    gemini_service: Any,
+    generation_kwargs: dict[str, Any],
+    routing: RoutingDecision,
+    params: dict[str, Any],
+    memory: Optional[ConversationMemory],
+    identity: Tuple[str, str],
+    start_time: float,
+) -> Iterator[str]:
+    """
+    Generador de eventos SSE de /chat/stream: espera turno en el planificador, emite los trozos
+    del modelo y termina con `done` o `error`.
+
+    Args:
+        identity: (clave del usuario en el planificador, rol).
+    """
+    owner, role = identity
+    session_id = params["session_id"]
+    metrics_manager.increment_counter("stream_requests")
+    try:
+        fair_scheduler.acquire(owner, role, queue_timeout(generation_kwargs["deadline"]))
+    except SchedulerTimeoutError:
+        metrics_manager.increment_counter("stream_errors")
+        yield _sse_event("error", {"message": "El servicio está saturado.", "session_id": session_id})
+        return
+    stream = None
+    chunks: list[str] = []
+    try:
+        stream = gemini_service.generate_response_stream(**generation_kwargs)
+        yield from _sse_chunks(stream, start_time, chunks)
+
+        metrics_manager.increment_counter("stream_chunks", len(chunks))
+        metrics_manager.record_timing("stream_total_latency", time.time() - start_time)
+        model_router.record_outcome(routing, time.time() - start_time, "".join(chunks))
+        remember_turn(memory, params["user_message"], "".join(chunks))
+        done = {"session_id": session_id, "chunks": len(chunks)}
+        if params["image"]:
+            done["image_hash"] = params["image"].digest
+        yield _sse_event("done", done)
+    except TimeoutError:
+        metrics_manager.increment_counter("stream_errors")
+        yield _sse_event("error", {"message": "Se agotó el tiempo de la petición.", "session_id": session_id})
     except Exception as e:
-        current_app.logger.error(f"Error extracting text from PDF: {str(e)}")
-        raise Exception(f"No se pudo leer el PDF: {str(e)}") from e
+        metrics_manager.increment_counter("stream_errors")
+        current_app.logger.exception("Error durante el streaming del chat: %s", str(e))
+        yield _sse_event("error", {"message": f"Error: {str(e)}", "session_id": session_id})
+    finally:
+        # Si el cliente se ha desconectado, el servidor cierra este generador: cerrar también el
+        # del modelo corta la llamada en curso en lugar de dejarla terminar.
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+        fair_scheduler.release(owner)
 
 
 @api_bp.route("/chat/send", methods=["POST"])
-def send_message() -> Tuple:  # noqa: C901
+def send_message() -> Tuple:
     """
     Endpoint para enviar un mensaje al chatbot y recibir una respuesta.
     Soporta contexto de imagen y documentos PDF.
     """
-    data = request.get_json()
-    if not data or not data.get("message"):
-        return jsonify({"message": "El campo 'message' es requerido."}), 400
-
-    # 🔒 SECURITY: Sanitizar entrada del usuario para prevenir XSS/Injection
-    user_message = bleach.clean(data["message"].strip())
-
-    session_id = data.get("session_id", "anonymous")
-    image_context = data.get("image_context", None)
-    pdf_context = data.get("pdf_context", None)
-    history = data.get("history", [])  # Recibir historial
-    language = data.get("language", "es")
-
-    if not user_message:
-        return jsonify({"message": "El mensaje no puede estar vacío."}), 400
-    if len(user_message) > 4000:
-        return (
-            jsonify({"message": "El mensaje excede el límite de 4000 caracteres."}),
-            400,
-        )
+    params, error_response = _parse_chat_request(request.get_json())
+    if error_response:
+        return error_response
 
     # Intentar obtener usuario autenticado
-    try:
-        current_user = get_current_user_from_jwt()
-        user_id = current_user.id if current_user else None
-    except Exception:
-        user_id = None
+    user_id, role = _get_current_identity()
 
     gemini_service = current_app.config.get("GEMINI_SERVICE")
     if not gemini_service:
@@ -83,98 +186,193 @@ def send_message() -> Tuple:  # noqa: C901
         )
 
     try:
-        final_prompt = user_message
-
-        # 1. Manejo de IMÁGENES (Multimodal - Sin historial complejo por ahora)
-        if image_context and image_context.get("has_image"):
-            # ... (Lógica de imagen igual que antes) ...
-            image_name = image_context.get("image_name", "imagen")
-            context_message = image_context.get("context_message", "")
-
-            if language == "en":
-                final_prompt = f"""
-{context_message}
+        start_time = time.time()
+        memory = conversation_memory(params, user_id)
+        generation_kwargs, routing = build_generation_kwargs(params, user_id, _model_override(params, role), memory)
+
+        deadline = _request_deadline()
+        generation_kwargs["deadline"] = deadline
+        cache_ttl = response_cache_ttl(params, request.endpoint)
+        if cache_ttl:
+            generation_kwargs["cache_ttl"] = cache_ttl
+
+        with fair_scheduler.slot(_scheduler_owner(user_id), role, queue_timeout(deadline)):
+            response_text = gemini_service.generate_response(**generation_kwargs)
+        # Sin streaming, el primer carácter llega con la respuesta completa: sirve de referencia para el TTFT.
+        metrics_manager.record_timing("chat_send_latency", time.time() - start_time)
+        model_router.record_outcome(routing, time.time() - start_time, response_text)
+        remember_turn(memory, params["user_message"], response_text)
+        body = {"response": response_text, "session_id": params["session_id"]}
+        if params["image"]:
+            # Los turnos siguientes pueden referirse a la imagen por su hash en lugar de reenviarla.
+            body["image_hash"] = params["image"].digest
+        return jsonify(body), 200
+    except SchedulerTimeoutError:
+        return _capacity_error()
+    except Exception as e:
+        current_app.logger.exception("Error al generar respuesta del chat: %s", str(e))
+        return jsonify({"message": f"Error: {str(e)}"}), 500
 
-Image context:
-- File name: {image_name}
-- User asks: {user_message}
 
-Please analyze the provided image and respond to the user's question in detail and helpfully.
-"""
-            else:
-                final_prompt = f"""
-{context_message}
+@api_bp.route("/chat/stream", methods=["POST"])
+def stream_message() -> Any:
+    """
+    Endpoint para enviar un mensaje y recibir la respuesta en streaming (Server-Sent Events).
 
-Contexto de imagen:
-- Nombre del archivo: {image_name}
-- El usuario pregunta: {user_message}
+    Acepta el mismo cuerpo que /chat/send. Emite eventos `chunk` ({"text": ...}) a medida que
+    llegan del modelo, y termina con un evento `done` o `error`.
+    """
+    params, error_response = _parse_chat_request(request.get_json())
+    if error_response:
+        return error_response
 
-Por favor, analiza la imagen proporcionada y responde a la pregunta del usuario de manera detallada y útil.
-"""
-            current_app.logger.info(f"Processing message with image context: {image_name}")
+    user_id, role = _get_current_identity()
+    owner = _scheduler_owner(user_id)
 
-            # Reset history for image requests to avoid multimodal conflicts
-            history = []
+    gemini_service = current_app.config.get("GEMINI_SERVICE")
+    if not gemini_service:
+        return (
+            jsonify({"message": "El servicio de IA no está disponible en este momento."}),
+            503,
+        )
 
-        # 2. Manejo de PDFs (Contexto inyectado en prompt - Sin historial complejo)
-        elif pdf_context and pdf_context.get("has_pdf"):
-            # ... (Lógica de PDF igual que antes) ...
-            pdf_name = pdf_context.get("pdf_name", "documento.pdf")
-            pdf_data = pdf_context.get("pdf_data")
-            pdf_text = extract_text_from_pdf(pdf_data)
+    # Construir el prompt antes de abrir el stream para que los errores de entrada (p. ej. PDF ilegible)
+    # se devuelvan como una respuesta HTTP normal.
+    try:
+        memory = conversation_memory(params, user_id)
+        generation_kwargs, routing = build_generation_kwargs(params, user_id, _model_override(params, role), memory)
+    except Exception as e:
+        current_app.logger.exception("Error al preparar la petición de streaming: %s", str(e))
+        return jsonify({"message": f"Error: {str(e)}"}), 500
 
-            if len(pdf_text) > 30000:
-                pdf_text = pdf_text[:30000] + "\n...[Texto truncado]..."
+    generation_kwargs["deadline"] = _request_deadline()
+    events = _sse_chat_events(gemini_service, generation_kwargs, routing, params, memory, (owner, role), time.time())
+    response = Response(stream_with_context(events), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Desactivar el buffering de nginx para que cada evento llegue al cliente inmediatamente
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
-            if language == "en":
-                final_prompt = f"""
-Document Context (Extracted from PDF '{pdf_name}'):
----
-{pdf_text}
----
 
-User Question: {user_message}
+class _ChatBatch:
+    """
+    Una petición a /chat/batch: valida sus elementos y los ejecuta en paralelo, con un máximo de
+    BATCH_MAX_CONCURRENCY_PER_USER llamadas simultáneas al modelo por usuario.
+    """
 
-Instructions: Answer the question based strictly on the provided document context.
-"""
+    def __init__(self, items: list[Any], gemini_service: Any) -> None:
+        self.items = items
+        self.gemini_service = gemini_service
+        self.user_id, self.role = _get_current_identity()
+        self.owner = _scheduler_owner(self.user_id)
+        self.concurrency = max(1, int(current_app.config.get("BATCH_MAX_CONCURRENCY_PER_USER", 4)))
+        self.slot = _batch_slot(self.owner, self.concurrency)
+        self.app = current_app._get_current_object()
+        self.deadline = _request_deadline()
+        # Los elementos inválidos se notifican sin llamar al modelo.
+        self.rejected: list[dict[str, Any]] = []
+        self.pending: list[tuple[int, Any, dict[str, Any], Optional[int], Optional[str]]] = []
+        for index, item in enumerate(items):
+            self._parse_item(index, item)
+
+    def _parse_item(self, index: int, item: Any) -> None:
+        item_id = item.get("id", index) if isinstance(item, dict) else index
+        try:
+            params = parse_chat_request(item if isinstance(item, dict) else None)
+        except ChatRequestError as e:
+            self.rejected.append({"index": index, "id": item_id, "status": "error", "error": e.message, "latency_ms": 0})
+            return
+        cache_ttl = response_cache_ttl(params, request.endpoint)
+        self.pending.append((index, item_id, params, cache_ttl, _model_override(params, self.role)))
+
+    def run_item(
+        self, index: int, item_id: Any, params: dict[str, Any], cache_ttl: Optional[int], override: Optional[str]
+    ) -> dict[str, Any]:
+        """Genera la respuesta de un elemento; los fallos del modelo se devuelven con estado `error`."""
+        start = time.time()
+        try:
+            with self.app.app_context():
+                generation_kwargs, routing = build_generation_kwargs(params, self.user_id, override)
+                generation_kwargs["deadline"] = self.deadline
+                if cache_ttl:
+                    generation_kwargs["cache_ttl"] = cache_ttl
+                with self.slot, fair_scheduler.slot(self.owner, self.role, queue_timeout(self.deadline)):
+                    response_text = self.gemini_service.generate_response(**generation_kwargs)
+            # GeminiService no lanza los errores del modelo: devuelve su mensaje de error como texto.
+            if is_error_response(response_text):
+                result = {"index": index, "id": item_id, "status": "error", "error": response_text}
             else:
-                final_prompt = f"""
-Contexto del Documento (Extraído del PDF '{pdf_name}'):
----
-{pdf_text}
----
+                model_router.record_outcome(routing, time.time() - start, response_text)
+                result = {"index": index, "id": item_id, "status": "ok", "response": response_text}
+                if params["image"]:
+                    result["image_hash"] = params["image"].digest
+        except Exception as e:
+            self.app.logger.warning("Error en el elemento %s del lote: %s", item_id, str(e))
+            result = {"index": index, "id": item_id, "status": "error", "error": f"Error: {str(e)}"}
+        latency = time.time() - start
+        metrics_manager.record_timing("chat_batch_item_latency", latency)
+        result["latency_ms"] = round(latency * 1000)
+        return result
+
+    def stream(self) -> Iterator[str]:
+        """Resultados en NDJSON por orden de finalización y una línea final de resumen."""
+        start_time = time.time()
+        metrics_manager.increment_counter("chat_batch_requests")
+        metrics_manager.increment_counter("chat_batch_items", len(self.items))
+        errors = 0
+        for result in self.rejected:
+            errors += 1
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+        workers = min(self.concurrency, len(self.pending)) or 1
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-batch")
+        try:
+            futures = [executor.submit(self.run_item, *item) for item in self.pending]
+            for future in as_completed(futures):
+                result = future.result()
+                errors += result["status"] != "ok"
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Si el cliente se desconecta, los elementos aún no iniciados se cancelan.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        metrics_manager.increment_counter("chat_batch_item_errors", errors)
+        latency_ms = round((time.time() - start_time) * 1000)
+        yield json.dumps({"status": "done", "total": len(self.items), "errors": errors, "latency_ms": latency_ms}) + "\n"
+
+
+@api_bp.route("/chat/batch", methods=["POST"])
+def batch_messages() -> Any:
+    """
+    Endpoint para enviar varios mensajes independientes en una sola petición.
 
-Pregunta del Usuario: {user_message}
+    Recibe {"items": [...]}, donde cada elemento tiene el mismo formato que el cuerpo de /chat/send
+    (más un "id" opcional). Los elementos se procesan en paralelo, con un máximo de
+    BATCH_MAX_CONCURRENCY_PER_USER llamadas simultáneas al modelo por usuario, y los resultados se
+    devuelven como NDJSON en orden de finalización: una línea por elemento con su estado y latencia,
+    y una línea final de resumen.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    max_items = current_app.config.get("BATCH_MAX_ITEMS", 50)
+    if not isinstance(items, list) or not items:
+        return jsonify({"message": "El campo 'items' debe ser una lista no vacía."}), 400
+    if len(items) > max_items:
+        return jsonify({"message": f"El lote excede el límite de {max_items} elementos."}), 400
 
-Instrucciones: Responde a la pregunta basándote estrictamente en el contexto del documento.
-"""
-            current_app.logger.info(f"Processing message with PDF context: {pdf_name}")
-
-            # Reset history for PDF requests
-            history = []
-
-        response_text = gemini_service.generate_response(
-            session_id=session_id,
-            user_id=user_id,
-            prompt=final_prompt,
-            image_data=image_context.get("image_data") if image_context else None,
-            history=history,  # Pasar historial
-            language=language,
+    gemini_service = current_app.config.get("GEMINI_SERVICE")
+    if not gemini_service:
+        return (
+            jsonify({"message": "El servicio de IA no está disponible en este momento."}),
+            503,
         )
-        return jsonify({"response": response_text, "session_id": session_id}), 200
-    except Exception as e:
-        current_app.logger.exception("Error al generar respuesta del chat: %s", str(e))
-        return jsonify({"message": f"Error: {str(e)}"}), 500
 
-
-@api_bp.route("/chat/stream", methods=["POST"])
-def stream_message() -> Tuple:
-    """
-    Endpoint para enviar un mensaje y recibir una respuesta en streaming.
-    """
-    # Implementación del streaming (más compleja, se deja como ejemplo conceptual)
-    # Se necesitaría una función que devuelva un generador y una Response con `mimetype='text/event-stream'`.
-    return jsonify({"message": "Endpoint de streaming no implementado aún."}), 501
+    # Validar todos los elementos antes de abrir el stream.
+    batch = _ChatBatch(items, gemini_service)
+    response = Response(stream_with_context(batch.stream()), mimetype="application/x-ndjson")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @api_bp.route("/health", methods=["GET"])
@@ -3,7 +3,7 @@
 import logging
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
 
 db = SQLAlchemy()
@@ -29,6 +29,44 @@ def init_db(app) -> None:
         raise
 
 
+def add_missing_columns(database: SQLAlchemy) -> list[str]:
+    """
+    Añade a las tablas existentes las columnas nuevas de los modelos.
+
+    `create_all` crea las tablas que faltan pero no modifica las que ya existen: sin este paso, una
+    base de datos creada antes de añadir una columna falla en cada consulta del modelo. Sólo se
+    añaden columnas que admiten NULL (el caso seguro con datos existentes); las demás se registran
+    como aviso para migrarlas a mano. Debe llamarse dentro de un contexto de aplicación, después
+    de `create_all`.
+
+    Returns:
+        Las columnas añadidas, como 'tabla.columna'.
+    """
+    engine = database.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as connection:
+        for table in database.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    logger.warning(f"⚠️ Falta la columna obligatoria {table.name}.{column.name}; requiere una migración manual.")
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                preparer = engine.dialect.identifier_preparer
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"
+                )
+                added.append(f"{table.name}.{column.name}")
+                logger.info(f"✅ Columna añadida: {table.name}.{column.name}")
+    return added
+
+
 def reset_db(app) -> None:
     """
     Resetear la base de datos (eliminar y recrear todas las tablas).
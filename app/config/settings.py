@@ -39,6 +39,78 @@ class Config:
     # Modelo de visión de Gemini.
     GEMINI_VISION_MODEL: str = os.environ.get("GEMINI_VISION_MODEL")
 
+    # Caché de respuestas exactas (opt-in). Sólo se cachean peticiones sin imagen ni PDF.
+    RESPONSE_CACHE_ENABLED: bool = os.environ.get("RESPONSE_CACHE_ENABLED", "False").lower() == "true"
+    # Respuestas máximas en memoria (LRU); las claves salen de los prompts, así que debe estar acotada.
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+    # TTL (segundos) de la caché de respuestas por endpoint; los endpoints ausentes no se cachean.
+    RESPONSE_CACHE_TTLS: dict[str, int] = {
+        "api_bp.send_message": int(os.environ.get("RESPONSE_CACHE_TTL_CHAT", "600")),
+    }
+
+    # Historial en el servidor (opt-in): para usuarios autenticados, /chat/send y /chat/stream leen el
+    # historial de la sesión guardada (con el resumen incremental de los turnos antiguos, ver
+    # CHAT_COMPACTION_*) en lugar del que envía el cliente, y guardan cada turno.
+    CHAT_SERVER_HISTORY_ENABLED: bool = os.environ.get("CHAT_SERVER_HISTORY_ENABLED", "False").lower() == "true"
+
+    # Pool de credenciales: varias API keys (separadas por comas) y proyectos de Vertex AI
+    # ('proyecto:región', separados por comas) entre los que se reparten las peticiones.
+    GEMINI_API_KEYS: str = os.environ.get("GEMINI_API_KEYS", "")
+    VERTEX_AI_PROJECTS: str = os.environ.get("VERTEX_AI_PROJECTS", "")
+    CLIENT_POOL_RPM_PER_KEY: int = int(os.environ.get("CLIENT_POOL_RPM_PER_KEY", "60"))
+    CLIENT_POOL_COOLDOWN_SECONDS: float = float(os.environ.get("CLIENT_POOL_COOLDOWN_SECONDS", "60"))
+
+    # Planificador de llamadas al modelo: concurrencia total, por usuario y espera máxima en cola. La
+    # concurrencia por defecto es la mitad de GUNICORN_THREADS, para que haya hilos esperando en la
+    # cola con prioridad por rol (ver app.core.fair_scheduler.default_max_concurrency).
+    SCHEDULER_MAX_CONCURRENCY: int = int(
+        os.environ.get("SCHEDULER_MAX_CONCURRENCY") or max(1, int(os.environ.get("GUNICORN_THREADS", "4")) // 2)
+    )
+    SCHEDULER_MAX_PER_USER: int = int(os.environ.get("SCHEDULER_MAX_PER_USER", "4"))
+    SCHEDULER_QUEUE_TIMEOUT_SECONDS: float = float(os.environ.get("SCHEDULER_QUEUE_TIMEOUT_SECONDS", "30"))
+
+    # /api/chat/batch: elementos máximos por lote y llamadas simultáneas al modelo por usuario.
+    BATCH_MAX_ITEMS: int = int(os.environ.get("BATCH_MAX_ITEMS", "50"))
+    BATCH_MAX_CONCURRENCY_PER_USER: int = int(os.environ.get("BATCH_MAX_CONCURRENCY_PER_USER", "4"))
+
+    # Caché de contexto del proveedor para la instrucción de sistema y los PDF (opt-in). Los
+    # prefijos por debajo del mínimo de tokens se siguen enviando en línea.
+    CONTEXT_CACHE_ENABLED: bool = os.environ.get("CONTEXT_CACHE_ENABLED", "False").lower() == "true"
+    CONTEXT_CACHE_TTL_SECONDS: int = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+    CONTEXT_CACHE_MAX_ENTRIES: int = int(os.environ.get("CONTEXT_CACHE_MAX_ENTRIES", "32"))
+    CONTEXT_CACHE_MIN_TOKENS: int = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", "4096"))
+
+    # Almacén de imágenes por hash de contenido: los turnos siguientes envían `image_hash` en lugar
+    # de la imagen. Presupuesto en bytes procesados, número de imágenes y vida desde el último uso.
+    IMAGE_STORE_MAX_BYTES: int = int(os.environ.get("IMAGE_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+    IMAGE_STORE_MAX_ENTRIES: int = int(os.environ.get("IMAGE_STORE_MAX_ENTRIES", "512"))
+    IMAGE_STORE_TTL_SECONDS: float = float(os.environ.get("IMAGE_STORE_TTL_SECONDS", "3600"))
+
+    # Descripciones de texto de las imágenes (opt-in): tras la primera respuesta sobre una imagen se
+    # describe en segundo plano y los turnos siguientes van sólo con texto y con historial, salvo
+    # que el usuario pida un detalle visual o el cliente envíe `image_context.force_image`.
+    IMAGE_CAPTIONS_ENABLED: bool = os.environ.get("IMAGE_CAPTIONS_ENABLED", "False").lower() == "true"
+    IMAGE_CAPTIONS_MAX_ENTRIES: int = int(os.environ.get("IMAGE_CAPTIONS_MAX_ENTRIES", "4096"))
+    IMAGE_CAPTIONS_TTL_SECONDS: float = float(os.environ.get("IMAGE_CAPTIONS_TTL_SECONDS", "86400"))
+
+    # Enrutador de modelos por complejidad (basic / fast / pro). Desactivado, las decisiones sólo se
+    # registran en métricas (modo sombra). Las excepciones por endpoint se escriben como
+    # "api_bp.batch_messages=basic,api_bp.send_message=pro".
+    MODEL_ROUTER_ENABLED: bool = os.environ.get("MODEL_ROUTER_ENABLED", "False").lower() == "true"
+    MODEL_ROUTER_OVERRIDES: dict[str, str] = dict(
+        item.strip().split("=", 1) for item in os.environ.get("MODEL_ROUTER_OVERRIDES", "").split(",") if "=" in item
+    )
+
+    # Chat por Socket.IO: paquetes pendientes de envío por conexión antes de pausar la generación y
+    # espera máxima a un cliente lento antes de cancelarla.
+    SOCKETIO_MAX_PENDING_PACKETS: int = int(os.environ.get("SOCKETIO_MAX_PENDING_PACKETS", "32"))
+    SOCKETIO_SLOW_CLIENT_TIMEOUT_SECONDS: float = float(os.environ.get("SOCKETIO_SLOW_CLIENT_TIMEOUT_SECONDS", "10"))
+
+    # Plazo máximo de una petición de chat (los clientes pueden acortarlo con X-Request-Deadline o
+    # X-Request-Timeout). Debe quedar por debajo de GUNICORN_TIMEOUT para cortar antes la llamada al modelo.
+    REQUEST_DEADLINE_SECONDS: float = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "110"))
+
     # Límites de tasa de solicitudes por defecto.
     RATE_LIMIT_DEFAULT: str = os.environ.get("RATE_LIMIT_DEFAULT", "200 per day;50 per hour")
 
@@ -34,6 +34,7 @@ class VertexAIConfig:
                 "description": "Rápido y económico para tareas de alta frecuencia y escala.",
                 "cost_per_1m_tokens": 0.50,
                 "max_tokens": 8192,  # Límite de tokens de salida
+                "context_budget_tokens": 16000,  # Tokens de historial que se envían como contexto
                 "recommended_for": ["chat", "resumen", "clasificación"],
             },
             "pro": {
@@ -41,6 +42,7 @@ class VertexAIConfig:
                 "description": "Modelo avanzado para tareas complejas y razonamiento profundo.",
                 "cost_per_1m_tokens": 3.50,
                 "max_tokens": 8192,
+                "context_budget_tokens": 64000,
                 "recommended_for": [
                     "análisis de datos",
                     "razonamiento complejo",
@@ -52,6 +54,7 @@ class VertexAIConfig:
                 "description": "Modelo base, rápido y económico para tareas generales.",
                 "cost_per_1m_tokens": 0.25,
                 "max_tokens": 2048,
+                "context_budget_tokens": 4000,
                 "recommended_for": ["chat básico", "preguntas y respuestas simples"],
             },
         }
@@ -69,10 +72,45 @@ class VertexAIConfig:
         self.fallback_config: Dict[str, bool | int | float] = {
             "enabled": True,
             "max_retries": 3,
-            "retry_delay": 1.5,  # Segundos
+            "retry_delay": 1.5,  # Segundos (tope de la espera "full jitter" del primer reintento)
+            "retry_budget_ratio": float(os.getenv("RETRY_BUDGET_RATIO", "0.1")),  # reintentos / peticiones
             "use_gemini_api": True,
         }
 
+        # Umbrales de los circuit breakers de cada backend (modelos de Vertex AI y Gemini API).
+        self.circuit_breaker_config: Dict[str, int | float] = {
+            "failure_rate_threshold": float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5")),
+            "slow_call_seconds": float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_SECONDS", "20")),
+            "slow_call_rate_threshold": float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_RATE", "0.8")),
+            "minimum_calls": int(os.getenv("CIRCUIT_BREAKER_MINIMUM_CALLS", "5")),
+            "window_size": int(os.getenv("CIRCUIT_BREAKER_WINDOW_SIZE", "20")),
+            "open_seconds": float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "30")),
+        }
+
+        # Limitador adaptativo (AIMD) de la concurrencia hacia el proveedor; los techos de
+        # peticiones por minuto y por día se toman de `limits`.
+        self.adaptive_limit_config: Dict[str, int | float] = {
+            "initial_limit": int(os.getenv("ADAPTIVE_LIMIT_INITIAL", "8")),
+            "min_limit": int(os.getenv("ADAPTIVE_LIMIT_MIN", "1")),
+            "max_limit": int(os.getenv("ADAPTIVE_LIMIT_MAX", "64")),
+            "backoff_factor": float(os.getenv("ADAPTIVE_LIMIT_BACKOFF", "0.5")),
+            "latency_tolerance": float(os.getenv("ADAPTIVE_LIMIT_LATENCY_TOLERANCE", "2.0")),
+        }
+
+        # Peticiones "hedged": si el backend principal no responde dentro del percentil indicado
+        # de su latencia reciente, se lanza la misma petición al secundario y gana la primera.
+        self.hedging_config: Dict[str, bool | int | float] = {
+            "enabled": os.getenv("HEDGING_ENABLED", "False").lower() == "true",
+            "percentile": int(os.getenv("HEDGING_PERCENTILE", "95")),  # 50, 95 o 99
+            "budget": float(os.getenv("HEDGING_BUDGET", "0.05")),  # fracción máxima de llamadas extra
+            "min_samples": int(os.getenv("HEDGING_MIN_SAMPLES", "20")),
+            "min_delay_seconds": float(os.getenv("HEDGING_MIN_DELAY_SECONDS", "0.2")),
+            # Hedges que se permiten por encima del presupuesto, para poder empezar sin historial.
+            "burst": float(os.getenv("HEDGING_BURST", "1")),
+            # Cada cuántos segundos se recalcula el percentil de latencia que dispara el hedge.
+            "refresh_seconds": float(os.getenv("HEDGING_REFRESH_SECONDS", "5")),
+        }
+
     def validate_config(self) -> tuple[bool, str]:
         """
         Valida que la configuración esencial para Vertex AI esté presente y sea correcta.
@@ -160,6 +198,16 @@ class VertexAIConfig:
         """
         return self.models.get(model_type)
 
+    def get_context_budget(self, model_type: str = "fast") -> int:
+        """
+        Devuelve el presupuesto de tokens de contexto (historial) para un tipo de modelo.
+
+        Args:
+            model_type: El tipo de modelo; si no existe se usa el de 'fast'.
+        """
+        model_info = self.get_model_info(model_type) or self.models["fast"]
+        return int(model_info.get("context_budget_tokens", 16000))
+
     def get_model_endpoint(self, model_type: str = "fast") -> Any:
         """
         Construye el nombre completo del endpoint para un modelo de Vertex AI.
@@ -1,8 +1,11 @@
 """Cliente para Google Cloud Vertex AI con soporte para fallback a Gemini API."""
 
+import asyncio
+import hashlib
 import logging
 import os
 import time
+from collections import deque
 from datetime import datetime
 from typing import Any, Dict, Optional, Tuple
 
@@ -25,10 +28,44 @@ except ImportError:
         "⚠️ Google Generative AI SDK no está instalado. Para usar el fallback, ejecute: pip install google-generativeai"
     )
 
+from app.core.adaptive_limiter import LimitExceededError, upstream_limiter
+from app.core.async_runner import loop_runner
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.core.metrics import metrics_manager
+from app.core.retry_policy import retry_policy
+from app.core.singleflight import AsyncSingleFlight
+from app.services.client_pool import GEMINI_API, VERTEX_AI, client_pool
+from app.services.fake_gemini import FakeGenerativeModel, fake_backend_enabled
+from app.services.response_cache import build_cache_key
+from app.services.tokenizer import token_counter, usage_from_response
+
 from .vertex_ai import vertex_config
 
 logger = logging.getLogger(__name__)
 
+GEMINI_BACKEND = "gemini_api"
+
+# Tokens que Gemini cobra por imagen (o por tesela de 768 px) para las comprobaciones previas.
+IMAGE_PART_TOKENS = 258
+
+
+def _parts_digest(parts: Any) -> str:
+    """Resumen estable de las partes binarias de una petición (para la clave de coalescencia)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        inline = getattr(part, "inline_data", None)
+        digest.update(inline.mime_type.encode() + inline.data if inline is not None else repr(part).encode())
+    return digest.hexdigest()
+
+
+def _gemini_parts(parts: Any) -> list[Any]:
+    """Convierte `Part` de Vertex AI al formato {'mime_type', 'data'} del SDK de Gemini."""
+    converted: list[Any] = []
+    for part in parts:
+        inline = getattr(part, "inline_data", None)
+        converted.append({"mime_type": inline.mime_type, "data": inline.data} if inline is not None else part)
+    return converted
+
 
 class VertexAIClient:
     """
@@ -58,6 +95,43 @@ class VertexAIClient:
         self.health_check_interval: int = 300  # 5 minutos
         self.is_healthy: bool = False
 
+        # Peticiones idénticas simultáneas comparten una única llamada al modelo.
+        self.singleflight = AsyncSingleFlight("vertex_client")
+
+        # Pool de API keys / proyectos compartido con GeminiService. Si está vacío se usan el
+        # proyecto de `vertex_config` y la key de GEMINI_API_KEY.
+        self.client_pool = client_pool
+
+        # Un circuit breaker por backend ('vertex:<model_type>' y 'gemini_api'). La recuperación
+        # (sondas y reinicialización) se hace en tareas de fondo, nunca dentro de una petición.
+        self.breaker_settings: Dict[str, Any] = dict(self.config.circuit_breaker_config)
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # Concurrencia y techos rpm/rpd hacia el proveedor, compartidos con GeminiService.
+        self.limiter = upstream_limiter
+        self.limiter.configure_from_limits(self.config.limits, self.config.adaptive_limit_config)
+        # Reintentos de la llamada final a Gemini API, con presupuesto compartido con GeminiService.
+        self.retry_policy = retry_policy
+        self.retry_policy.configure(
+            max_attempts=self.config.fallback_config.get("max_retries"),
+            base_delay=self.config.fallback_config.get("retry_delay"),
+            budget_ratio=self.config.fallback_config.get("retry_budget_ratio"),
+        )
+        self.probe_timeout: float = 15.0
+        self.reinitialize_interval: float = 60.0
+        self._init_attempted: bool = False
+        self._last_init_attempt: float = time.monotonic()
+        self._reinitializing: bool = False
+        self._background_tasks: set[asyncio.Task] = set()
+
+        # Hedging opcional hacia la API de Gemini cuando Vertex AI tarda más de lo habitual.
+        self.hedging_settings: Dict[str, Any] = dict(self.config.hedging_config)
+        # Últimas llamadas candidatas a hedge (True si se lanzó la secundaria), para el presupuesto.
+        self._hedge_window: deque[bool] = deque(maxlen=1000)
+        self._hedges_in_window: int = 0
+        # Espera de hedge por backend y cuándo se calculó: ordenar el historial de latencias en cada
+        # petición es caro y ocupa el lock global de métricas.
+        self._hedge_delays: Dict[str, tuple[Optional[float], float]] = {}
+
     async def initialize(self) -> bool:
         """
         Inicializa el cliente, intentando primero Vertex AI y luego el fallback a Gemini API.
@@ -75,10 +149,22 @@ class VertexAIClient:
             True si al menos uno de los clientes (Vertex AI o Gemini API) se inicializó con éxito.
         """
         logger.info("🚀 Iniciando cliente de IA...")
+        self._init_attempted = True
+        self._last_init_attempt = time.monotonic()
+
+        if fake_backend_enabled():
+            return self._initialize_fake_backend()
+
+        if not self.client_pool.size():
+            self.client_pool.configure_from_env()
 
         # 1. Intentar inicializar Vertex AI
         if VERTEX_AI_AVAILABLE and self.config.enabled:
             if self._initialize_vertex_ai():
+                # La API de Gemini queda preparada como reserva para que la conmutación por
+                # error no tenga que inicializar nada dentro de una petición.
+                if self.config.fallback_config.get("use_gemini_api", True) and GEMINI_API_AVAILABLE:
+                    self._initialize_gemini_api()
                 self.initialized = True
                 self.is_healthy = True
                 self.fallback_active = False
@@ -98,16 +184,36 @@ class VertexAIClient:
         logger.error("❌ No se pudo inicializar ningún cliente de IA. Todas las funciones estarán desactivadas.")
         return False
 
+    def _initialize_fake_backend(self) -> bool:
+        """
+        Usa el backend simulado (FAKE_GEMINI_ENABLED) en lugar de Vertex AI y la API de Gemini.
+
+        Los modelos simulados sustituyen a los de Vertex AI y a la reserva de Gemini API, así los
+        circuit breakers, el hedging y el fallback funcionan igual que con el proveedor real. Sin el
+        SDK de Vertex AI se arranca directamente en modo fallback.
+        """
+        self.models = {
+            model_type: FakeGenerativeModel(model_info["name"]) for model_type, model_info in self.config.models.items()
+        }
+        self.gemini_client = FakeGenerativeModel("gemini-flash-latest")
+        self.initialized = True
+        self.is_healthy = True
+        self.fallback_active = not VERTEX_AI_AVAILABLE
+        logger.warning("🧪 Cliente de IA inicializado con el backend simulado (FAKE_GEMINI_ENABLED).")
+        return True
+
     def _initialize_vertex_ai(self) -> bool:
         """Inicializa los modelos de Vertex AI."""
         try:
             if not self.config.initialize():
                 return False
 
-            self.models = {}
+            # Se construye aparte y se asigna al final: la reinicialización en segundo plano no
+            # debe dejar a las peticiones en curso sin modelos.
+            models: Dict[str, GenerativeModel] = {}
             for model_type, model_info in self.config.models.items():
                 try:
-                    self.models[model_type] = GenerativeModel(model_info["name"])
+                    models[model_type] = GenerativeModel(model_info["name"])
                     logger.debug(
                         "✅ Modelo Vertex AI '%s' (%s) cargado.",
                         model_type,
@@ -116,10 +222,11 @@ class VertexAIClient:
                 except Exception:
                     logger.exception("⚠️ No se pudo cargar el modelo de Vertex AI: %s", model_type)
 
-            if not self.models:
+            if not models:
                 logger.error("❌ No se pudo cargar ningún modelo de Vertex AI, la inicialización falló.")
                 return False
 
+            self.models = models
             return True
         except Exception:
             logger.exception("❌ Fallo crítico al inicializar Vertex AI.")
@@ -129,6 +236,10 @@ class VertexAIClient:
         """Inicializa el cliente de la API de Gemini."""
         try:
             api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+            if not api_key and self.client_pool.size(GEMINI_API):
+                # Las llamadas usarán las keys del pool, que no necesitan la configuración global.
+                logger.info("✅ Cliente de Gemini API configurado con el pool de credenciales.")
+                return True
             if not api_key:
                 logger.warning("⚠️ No se encontró la API key para Gemini (GEMINI_API_KEY o GOOGLE_API_KEY).")
                 return False
@@ -187,15 +298,30 @@ class VertexAIClient:
     def _estimate_tokens(self, text: str) -> int:
         """Estimar número de tokens en un texto.
 
+        Usa el tokenizador local calibrado con los recuentos reales de respuestas anteriores. Sólo
+        se usa para las comprobaciones previas; el coste final sale del `usage_metadata`.
+
         Args:
             text: Texto a analizar
 
         Returns:
             int: Número estimado de tokens
         """
-        # Estimación simple: ~1.3 tokens por palabra
-        words = len(text.split())
-        return int(words * 1.3)
+        return token_counter.count(text)
+
+    def _count_tokens(self, prompt: str, response: Any, response_text: str, calibrate: bool = True) -> Tuple[int, int]:
+        """
+        Tokens reales (entrada, salida) de una respuesta, o una estimación si no los trae.
+
+        Con `calibrate=False` (peticiones con imágenes) el recuento real no se usa para calibrar
+        el tokenizador de texto, porque incluye los tokens de las imágenes.
+        """
+        usage = usage_from_response(response)
+        if usage is None:
+            return self._estimate_tokens(prompt), self._estimate_tokens(response_text)
+        if calibrate:
+            token_counter.calibrate([prompt], usage[0])
+        return usage
 
     def _update_metrics(
         self,
@@ -274,17 +400,25 @@ class VertexAIClient:
             top_k=kwargs.get("top_k", 40),
         )
 
+        # Las partes adicionales (imágenes) van detrás del texto
+        parts = kwargs.get("parts") or []
+        contents = [prompt, *parts] if parts else prompt
+
         # Generar respuesta
         start_time = time.time()
-        response = await model.generate_content_async(prompt, generation_config=generation_config)
+        if self.client_pool.size(VERTEX_AI):
+            with self.client_pool.lease(VERTEX_AI) as credential:
+                pooled_model = self.client_pool.vertex_model(credential, model_info["name"])
+                response = await pooled_model.generate_content_async(contents, generation_config=generation_config)
+        else:
+            response = await model.generate_content_async(contents, generation_config=generation_config)
         response_time = time.time() - start_time
 
         # Procesar respuesta
         response_text = response.text if response.text else ""
 
         # Calcular métricas
-        input_tokens = self._estimate_tokens(prompt)
-        output_tokens = self._estimate_tokens(response_text)
+        input_tokens, output_tokens = self._count_tokens(prompt, response, response_text, calibrate=not parts)
         cost = self.config.estimate_cost(input_tokens, output_tokens, model_type)
 
         return {
@@ -314,7 +448,8 @@ class VertexAIClient:
         Returns:
             Dict con la respuesta y metadatos
         """
-        if not self.gemini_client:
+        use_pool = bool(self.client_pool.size(GEMINI_API))
+        if not self.gemini_client and not use_pool:
             raise Exception("Gemini API no disponible")
 
         # Configurar generación
@@ -323,17 +458,24 @@ class VertexAIClient:
             "temperature": temperature,
         }
 
+        parts = kwargs.get("parts") or []
+        contents = [prompt, *_gemini_parts(parts)] if parts else prompt
+
         # Generar respuesta
         start_time = time.time()
-        response = await self.gemini_client.generate_content_async(prompt, generation_config=generation_config)
+        if use_pool:
+            with self.client_pool.lease(GEMINI_API) as credential:
+                model = await self.client_pool.gemini_model_async(credential, "gemini-flash-latest")
+                response = await model.generate_content_async(contents, generation_config=generation_config)
+        else:
+            response = await self.gemini_client.generate_content_async(contents, generation_config=generation_config)
         response_time = time.time() - start_time
 
         # Procesar respuesta
         response_text = response.text if response.text else ""
 
-        # Calcular métricas (estimación para Gemini API)
-        input_tokens = self._estimate_tokens(prompt)
-        output_tokens = self._estimate_tokens(response_text)
+        # Calcular métricas
+        input_tokens, output_tokens = self._count_tokens(prompt, response, response_text, calibrate=not parts)
         cost = 0.0  # Gemini API gratuita
 
         return {
@@ -359,24 +501,56 @@ class VertexAIClient:
     ) -> Dict[str, Any]:
         """Generar respuesta con fallback automático.
 
+        Las llamadas idénticas (mismo prompt, modelo y parámetros) que coinciden en el tiempo se
+        coalescen: sólo la primera llega al modelo y todas comparten su resultado o su error.
+
         Args:
             prompt: Texto de entrada
             model_type: Tipo de modelo ('fast', 'pro', 'basic')
             max_tokens: Máximo de tokens de salida
             temperature: Temperatura de generación (0.0-1.0)
-            **kwargs: Parámetros adicionales
+            **kwargs: Parámetros adicionales; `parts` admite una lista de `Part` (p. ej. imágenes)
+                que se envían detrás del prompt.
 
         Returns:
             Dict con la respuesta y metadatos
         """
-        if not self.is_healthy:
+        key_params = {k: repr(v) for k, v in kwargs.items() if k != "parts"}
+        if kwargs.get("parts"):
+            key_params["parts"] = _parts_digest(kwargs["parts"])
+        key = build_cache_key(
+            prompt,
+            None,
+            "",
+            model_type,
+            {"max_tokens": max_tokens, "temperature": temperature, **key_params},
+        )
+        result = await self.singleflight.do(
+            key, lambda: self._generate_response_uncoalesced(prompt, model_type, max_tokens, temperature, **kwargs)
+        )
+        # Cada llamador recibe su propia copia para que nadie modifique el resultado compartido.
+        return dict(result)
+
+    async def _generate_response_uncoalesced(
+        self,
+        prompt: str,
+        model_type: str = "fast",
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Implementación de generate_response sin coalescencia (ver generate_response)."""
+        if not self.is_healthy and not self._init_attempted:
+            # Primera petición del proceso: todavía no hay ningún cliente que usar.
             await self.initialize()
 
+        self._schedule_recovery()
+
         if not self.is_healthy:
             raise Exception("No hay clientes de IA disponibles")
 
         # Estimar tokens y verificar límites
-        estimated_tokens = self._estimate_tokens(prompt) + max_tokens
+        estimated_tokens = self._estimate_tokens(prompt) + max_tokens + IMAGE_PART_TOKENS * len(kwargs.get("parts") or [])
         can_proceed, reason = self._check_limits(estimated_tokens, model_type)
 
         if not can_proceed:
@@ -384,14 +558,20 @@ class VertexAIClient:
             # Si es por límites de costo, intentar con fallback
             if "costo" in reason.lower() and not self.fallback_active:
                 logger.info("🔄 Intentando con Gemini API por límites de costo")
-                return await self._generate_with_gemini_api(prompt, max_tokens, temperature, **kwargs)
+                return await self._call_with_breaker(
+                    self._breaker(GEMINI_BACKEND),
+                    self._generate_with_gemini_api(prompt, max_tokens, temperature, **kwargs),
+                )
             else:
                 raise ValueError(f"Solicitud rechazada: {reason}")
 
-        # Intentar con Vertex AI primero
-        if self.initialized and not self.fallback_active:
+        # Intentar con Vertex AI primero, salvo que su circuito esté abierto
+        vertex_breaker = self._breaker(f"vertex:{model_type}")
+        if self.initialized and not self.fallback_active and vertex_breaker.allow_request():
             try:
-                result = await self._generate_with_vertex_ai(prompt, model_type, max_tokens, temperature, **kwargs)
+                result = await self._generate_vertex_with_hedging(
+                    vertex_breaker, prompt, model_type, max_tokens, temperature, **kwargs
+                )
                 self._update_metrics(
                     result["input_tokens"],
                     result["output_tokens"],
@@ -403,13 +583,20 @@ class VertexAIClient:
 
             except Exception as e:
                 logger.error(f"❌ Error en Vertex AI: {e}")
-                logger.info("🔄 Cambiando a Gemini API")
-                self.fallback_active = True
+                logger.info("🔄 Usando Gemini API para esta petición")
 
         # Usar Gemini API como fallback
-        if self.gemini_client:
+        if self.gemini_client or self.client_pool.size(GEMINI_API):
+            gemini_breaker = self._breaker(GEMINI_BACKEND)
+            if not gemini_breaker.allow_request():
+                self._update_metrics(0, 0, 0, 0, False)
+                raise CircuitOpenError("Todos los clientes fallaron: el circuito de Gemini API está abierto")
             try:
-                result = await self._generate_with_gemini_api(prompt, max_tokens, temperature, **kwargs)
+                result = await self.retry_policy.call_async(
+                    lambda: self._call_with_breaker(
+                        gemini_breaker, self._generate_with_gemini_api(prompt, max_tokens, temperature, **kwargs)
+                    )
+                )
                 self._update_metrics(
                     result["input_tokens"],
                     result["output_tokens"],
@@ -426,36 +613,213 @@ class VertexAIClient:
 
         raise Exception("No hay clientes disponibles")
 
+    def _breaker(self, backend: str) -> CircuitBreaker:
+        """Devuelve (creándolo si hace falta) el circuit breaker de un backend."""
+        breaker = self.breakers.get(backend)
+        if breaker is None:
+            breaker = CircuitBreaker(backend, **self.breaker_settings)
+            self.breakers[backend] = breaker
+        return breaker
+
+    async def _call_with_breaker(self, breaker: CircuitBreaker, coro: Any) -> Dict[str, Any]:
+        """
+        Espera una llamada al backend y registra su resultado y duración en el circuito y en el
+        limitador adaptativo. Si el limitador la rechaza, la llamada no se hace ni cuenta como fallo
+        del backend.
+        """
+        try:
+            self.limiter.acquire()
+        except LimitExceededError:
+            coro.close()
+            raise
+        start = time.monotonic()
+        try:
+            result = await coro
+        except BaseException as e:
+            self.limiter.release(error=e)
+            if isinstance(e, Exception):
+                breaker.record_failure(e, time.monotonic() - start)
+            raise
+        duration = time.monotonic() - start
+        self.limiter.release(latency=duration)
+        breaker.record_success(duration)
+        metrics_manager.record_timing(self._latency_metric(breaker.name), duration)
+        return result
+
+    @staticmethod
+    def _latency_metric(backend: str) -> str:
+        return "vertex_client_latency_" + backend.replace(":", "_")
+
+    def _hedge_delay(self, backend: str) -> Optional[float]:
+        """
+        Espera antes de lanzar el hedge: el percentil configurado de la latencia reciente del backend.
+
+        El percentil se recalcula como mucho cada `refresh_seconds`; entre medias se usa el último.
+
+        Returns:
+            None si aún no hay muestras suficientes para estimarlo.
+        """
+        now = time.monotonic()
+        cached = self._hedge_delays.get(backend)
+        if cached is not None and now - cached[1] < self.hedging_settings.get("refresh_seconds", 5.0):
+            return cached[0]
+
+        stats = metrics_manager.get_timing_stats(self._latency_metric(backend))
+        delay: Optional[float] = None
+        if stats.get("count", 0) >= self.hedging_settings.get("min_samples", 20):
+            percentile = stats[f"p{self.hedging_settings.get('percentile', 95)}_seconds"]
+            delay = max(percentile, self.hedging_settings.get("min_delay_seconds", 0.0))
+        self._hedge_delays[backend] = (delay, now)
+        return delay
+
+    def _record_hedge_candidate(self, hedged: bool) -> None:
+        if len(self._hedge_window) == self._hedge_window.maxlen and self._hedge_window[0]:
+            self._hedges_in_window -= 1
+        self._hedge_window.append(hedged)
+        self._hedges_in_window += int(hedged)
+
+    def _hedge_budget_allows(self) -> bool:
+        """
+        Indica si lanzar otro hedge mantiene las llamadas extra por debajo del presupuesto.
+
+        Se admiten `burst` hedges por encima de la fracción de la ventana, para que el hedging
+        pueda empezar sin esperar a acumular candidatos.
+        """
+        budget = self.hedging_settings.get("budget", 0.05)
+        burst = self.hedging_settings.get("burst", 1.0)
+        return self._hedges_in_window + 1 <= budget * len(self._hedge_window) + burst
+
+    async def _generate_vertex_with_hedging(
+        self,
+        vertex_breaker: CircuitBreaker,
+        prompt: str,
+        model_type: str,
+        max_tokens: int,
+        temperature: float,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Genera con Vertex AI y, si el hedging está activo y Vertex tarda más que el percentil
+        configurado de su latencia reciente, lanza la misma petición a la API de Gemini.
+
+        Gana la primera respuesta correcta y la otra llamada se cancela. Si Vertex falla antes de
+        que se lance el hedge, la excepción se propaga y se aplica el fallback normal.
+        """
+        primary = asyncio.ensure_future(
+            self._call_with_breaker(
+                vertex_breaker, self._generate_with_vertex_ai(prompt, model_type, max_tokens, temperature, **kwargs)
+            )
+        )
+        gemini_available = bool(self.gemini_client or self.client_pool.size(GEMINI_API))
+        delay = self._hedge_delay(vertex_breaker.name) if self.hedging_settings.get("enabled") else None
+        if delay is None or not gemini_available:
+            return await primary
+
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                self._record_hedge_candidate(False)
+                return primary.result()
+
+            gemini_breaker = self._breaker(GEMINI_BACKEND)
+            if not self._hedge_budget_allows() or not gemini_breaker.allow_request():
+                self._record_hedge_candidate(False)
+                metrics_manager.increment_counter("vertex_client_hedges_skipped")
+                return await primary
+
+            self._record_hedge_candidate(True)
+            metrics_manager.increment_counter("vertex_client_hedges_fired")
+            logger.info("⏱️ Vertex AI supera %.2fs: lanzando petición de cobertura a Gemini API.", delay)
+            hedge = asyncio.ensure_future(
+                self._call_with_breaker(gemini_breaker, self._generate_with_gemini_api(prompt, max_tokens, temperature, **kwargs))
+            )
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics_manager.increment_counter("vertex_client_hedges_won")
+                        return task.result()
+            # Ambas fallaron: se propaga el error del backend principal.
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _spawn(self, coro: Any) -> None:
+        """Lanza una tarea de fondo en el loop actual conservando una referencia hasta que termine."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _schedule_recovery(self) -> None:
+        """
+        Programa en segundo plano las sondas de los circuitos abiertos y, si Vertex AI no está
+        disponible, su reinicialización. No espera a ninguna de ellas.
+        """
+        for backend, breaker in self.breakers.items():
+            if breaker.try_begin_probe():
+                self._spawn(self._probe(backend, breaker))
+
+        vertex_down = self.fallback_active and VERTEX_AI_AVAILABLE and self.config.enabled
+        if (
+            (vertex_down or not self.is_healthy)
+            and not self._reinitializing
+            and time.monotonic() - self._last_init_attempt >= self.reinitialize_interval
+        ):
+            self._reinitializing = True
+            self._spawn(self._reinitialize())
+
+    async def _reinitialize(self) -> None:
+        """Reinicializa los clientes en un hilo aparte (aiplatform.init y google.auth bloquean)."""
+        try:
+            logger.info("🔁 Reinicializando clientes de IA en segundo plano...")
+            await asyncio.get_running_loop().run_in_executor(None, self.initialize_sync)
+        except Exception:
+            logger.exception("❌ Error al reinicializar los clientes de IA en segundo plano.")
+        finally:
+            self._reinitializing = False
+
+    async def _probe(self, backend: str, breaker: CircuitBreaker) -> None:
+        """Sonda half-open: una generación mínima decide si el circuito se cierra o vuelve a abrirse."""
+        try:
+            if backend == GEMINI_BACKEND:
+                probe = self._generate_with_gemini_api("ping", 1, 0.0)
+            else:
+                probe = self._generate_with_vertex_ai("ping", backend.split(":", 1)[1], 1, 0.0)
+            await asyncio.wait_for(probe, self.probe_timeout)
+        except Exception as e:
+            breaker.probe_failed(e)
+        else:
+            breaker.probe_succeeded()
+
     def generate_response_sync(
         self,
         prompt: str,
         model_type: str = "fast",
         max_tokens: int = 1000,
         temperature: float = 0.7,
+        timeout: Optional[float] = 120,
         **kwargs,
     ) -> Dict[str, Any]:
-        """Versión síncrona de generate_response para compatibilidad."""
-        import asyncio
-        import concurrent.futures
-
-        def run_async():
-            # Crear un nuevo loop de eventos en un hilo separado
-            new_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(new_loop)
-            try:
-                return new_loop.run_until_complete(self.generate_response(prompt, model_type, max_tokens, temperature, **kwargs))
-            except Exception as e:
-                raise e
-            finally:
-                new_loop.close()
+        """Versión síncrona de generate_response para compatibilidad.
 
-        # Ejecutar siempre en un hilo separado para evitar conflictos
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(run_async)
-            try:
-                return future.result(timeout=120)  # 2 minutos de timeout
-            except Exception as e:
-                raise e
+        La corutina se ejecuta en el event loop persistente del proceso (`loop_runner`) en lugar de
+        crear un hilo y un loop nuevos por llamada, de modo que las conexiones del SDK se reutilizan.
+
+        Args:
+            timeout: Plazo máximo en segundos; al vencer, la generación se cancela y se lanza
+                `TimeoutError`. None para esperar indefinidamente.
+        """
+        return loop_runner.run(
+            self.generate_response(prompt, model_type, max_tokens, temperature, **kwargs),
+            timeout=timeout,
+        )
 
     def get_usage_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas de uso.
@@ -484,6 +848,14 @@ class VertexAIClient:
                 "fallback_active": self.fallback_active,
                 "healthy": self.is_healthy,
             },
+            "circuit_breakers": {backend: breaker.get_stats() for backend, breaker in self.breakers.items()},
+            "adaptive_limiter": self.limiter.get_stats(),
+            "tokenizer": token_counter.get_stats(),
+            "hedging": {
+                "enabled": bool(self.hedging_settings.get("enabled")),
+                "candidates": len(self._hedge_window),
+                "hedges": self._hedges_in_window,
+            },
             "recent_requests": len(recent_history),
             "avg_response_time": (
                 round(
@@ -0,0 +1,233 @@
+"""
+Limitador adaptativo de las llamadas salientes al proveedor de IA.
+
+Aplica los techos de `VertexAIConfig.limits` (peticiones por minuto y por día, repartidos entre
+los workers de gunicorn) y ajusta la concurrencia con AIMD: sube de forma aditiva mientras las
+llamadas van bien y la reduce a la mitad ante un 429 o cuando la latencia reciente se dispara
+respecto a la habitual. Así cada worker deja de insistir contra la API antes de recibir 429.
+"""
+
+import contextlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from datetime import date
+from typing import Any, Iterator, Optional
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+
+class LimitExceededError(RuntimeError):
+    """La llamada se rechaza localmente por superar un límite (rpm, rpd o concurrencia)."""
+
+    def __init__(self, reason: str, message: str) -> None:
+        super().__init__(message)
+        self.reason = reason
+
+
+def gunicorn_workers() -> int:
+    """
+    Número de workers de gunicorn entre los que se reparten los techos.
+
+    Mismo valor por defecto que deployment/gunicorn.conf.py (2 × núcleos + 1) cuando
+    `GUNICORN_WORKERS` no está definida.
+    """
+    return max(1, int(os.getenv("GUNICORN_WORKERS") or multiprocessing.cpu_count() * 2 + 1))
+
+
+def _is_rate_limit_error(error: BaseException) -> bool:
+    from app.services.client_pool import is_rate_limit_error
+
+    return is_rate_limit_error(error)
+
+
+class AdaptiveLimiter:
+    """Límite de concurrencia AIMD más techos de peticiones por minuto y por día."""
+
+    def __init__(
+        self,
+        name: str = "upstream",
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        requests_per_minute: Optional[int] = None,
+        requests_per_day: Optional[int] = None,
+        backoff_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        cooldown_seconds: float = 1.0,
+        min_latency_samples: int = 10,
+    ) -> None:
+        """
+        Args:
+            name: Nombre del limitador (prefijo de las métricas).
+            initial_limit: Llamadas simultáneas permitidas al arrancar.
+            min_limit: Límite mínimo de concurrencia.
+            max_limit: Límite máximo de concurrencia.
+            requests_per_minute: Techo de peticiones en los últimos 60 s (None = sin techo).
+            requests_per_day: Techo de peticiones en el día natural (None = sin techo).
+            backoff_factor: Factor por el que se multiplica el límite al detectar congestión.
+            latency_tolerance: Se considera congestión si la latencia reciente supera la habitual
+                en este factor.
+            cooldown_seconds: Tiempo mínimo entre dos reducciones (una ráfaga de errores del mismo
+                episodio sólo reduce una vez).
+            min_latency_samples: Muestras necesarias antes de usar la latencia como señal.
+        """
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial_limit)
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.backoff_factor = backoff_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown_seconds = cooldown_seconds
+        self.min_latency_samples = min_latency_samples
+
+        self.inflight = 0
+        self.rejections: dict[str, int] = {"rpm": 0, "rpd": 0, "concurrency": 0}
+        self._minute: deque[float] = deque()
+        self._day = date.today()
+        self._day_count = 0
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._latency_samples = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def configure_from_limits(self, limits: dict[str, Any], settings: Optional[dict[str, Any]] = None) -> None:
+        """
+        Aplica los techos de `VertexAIConfig.limits` y los parámetros de `adaptive_limit_config`.
+
+        Los techos se reparten entre los workers (ver `gunicorn_workers`), ya que cada proceso tiene
+        su propio limitador.
+        """
+        workers = gunicorn_workers()
+        settings = settings or {}
+        with self._lock:
+            rpm = limits.get("requests_per_minute")
+            rpd = limits.get("requests_per_day")
+            self.requests_per_minute = max(1, int(rpm) // workers) if rpm else None
+            self.requests_per_day = max(1, int(rpd) // workers) if rpd else None
+            self.min_limit = settings.get("min_limit", self.min_limit)
+            self.max_limit = settings.get("max_limit", self.max_limit)
+            self.backoff_factor = settings.get("backoff_factor", self.backoff_factor)
+            self.latency_tolerance = settings.get("latency_tolerance", self.latency_tolerance)
+            self.limit = min(max(float(settings.get("initial_limit", self.limit)), self.min_limit), self.max_limit)
+        self._publish_limit()
+
+    def acquire(self) -> None:
+        """
+        Reserva una llamada.
+
+        Raises:
+            LimitExceededError: si se ha alcanzado algún techo o el límite de concurrencia actual.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._minute and now - self._minute[0] >= 60:
+                self._minute.popleft()
+            today = date.today()
+            if today != self._day:
+                self._day, self._day_count = today, 0
+
+            if self.requests_per_minute and len(self._minute) >= self.requests_per_minute:
+                reason, message = "rpm", f"Límite de {self.requests_per_minute} peticiones por minuto alcanzado"
+            elif self.requests_per_day and self._day_count >= self.requests_per_day:
+                reason, message = "rpd", f"Límite de {self.requests_per_day} peticiones diarias alcanzado"
+            elif self.inflight >= int(self.limit):
+                reason, message = "concurrency", f"Límite de {int(self.limit)} llamadas simultáneas alcanzado"
+            else:
+                self.inflight += 1
+                self._minute.append(now)
+                self._day_count += 1
+                return
+            self.rejections[reason] += 1
+
+        metrics_manager.increment_counter(f"limiter_{self.name}_rejected_{reason}")
+        raise LimitExceededError(reason, message)
+
+    def release(self, error: Optional[BaseException] = None, latency: Optional[float] = None) -> None:
+        """
+        Libera una llamada y ajusta el límite con su resultado.
+
+        Args:
+            error: Excepción de la llamada, si falló. Un 429 reduce el límite; otros errores no
+                lo cambian (son cosa del circuit breaker).
+            latency: Duración de la llamada, si es comparable entre llamadas (no en streaming).
+        """
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+            if error is not None:
+                if _is_rate_limit_error(error):
+                    self._decrease("429")
+            elif latency is not None and self._observe_latency(latency):
+                self._decrease("latency")
+            elif self.inflight + 1 >= int(self.limit):
+                # Sólo se sube cuando el límite se está usando: +1 por cada `limit` llamadas correctas.
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self._publish_limit()
+
+    def _observe_latency(self, latency: float) -> bool:
+        """Actualiza las medias móviles de latencia y dice si la reciente está inflada (con el lock)."""
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += 0.3 * (latency - self._short_latency)
+            self._long_latency += 0.02 * (latency - self._long_latency)
+        self._latency_samples += 1
+        return (
+            self._latency_samples >= self.min_latency_samples
+            and self._short_latency > self.latency_tolerance * self._long_latency
+        )
+
+    def _decrease(self, cause: str) -> None:
+        """Reducción multiplicativa, como mucho una por `cooldown_seconds` (con el lock)."""
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_seconds:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+        metrics_manager.increment_counter(f"limiter_{self.name}_decreases")
+        logger.warning("📉 Limitador %s: %.1f → %.1f llamadas simultáneas (%s)", self.name, previous, self.limit, cause)
+
+    def _publish_limit(self) -> None:
+        metrics_manager.set_gauge(f"limiter_{self.name}_limit", self.limit)
+        metrics_manager.set_gauge(f"limiter_{self.name}_inflight", self.inflight)
+
+    @contextlib.contextmanager
+    def lease(self, measure_latency: bool = True) -> Iterator[None]:
+        """Context manager que reserva una llamada y registra su resultado al salir."""
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            # También un GeneratorExit (stream cerrado por el cliente): libera sin ajustar el límite.
+            self.release(error=e)
+            raise
+        self.release(latency=time.monotonic() - start if measure_latency else None)
+
+    def get_stats(self) -> dict[str, Any]:
+        """Límite actual, llamadas en curso, uso de los techos y rechazos por motivo."""
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "inflight": self.inflight,
+                "requests_last_minute": len(self._minute),
+                "requests_per_minute": self.requests_per_minute,
+                "requests_today": self._day_count,
+                "requests_per_day": self.requests_per_day,
+                "rejections": dict(self.rejections),
+                "latency_recent_seconds": self._short_latency,
+                "latency_baseline_seconds": self._long_latency,
+            }
+
+
+# Instancia global: un limitador por proceso compartido por GeminiService y VertexAIClient.
+upstream_limiter = AdaptiveLimiter()
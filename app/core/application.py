@@ -6,6 +6,7 @@ from flask_babel import Babel
 from app.api.admin import admin_bp as admin_blueprint
 from app.api.auth import auth_bp as auth_blueprint
 from app.api.routes import api_bp as api_blueprint
+from app.config.database import add_missing_columns
 from app.config.extensions import db, jwt, migrate, socketio
 from app.config.settings import DevelopmentConfig, ProductionConfig, TestingConfig
 from app.main import main as main_blueprint
@@ -36,6 +37,9 @@ def create_app(config_class=DevelopmentConfig) -> None:
     migrate.init_app(app, db)
     socketio.init_app(app, cors_allowed_origins="*", async_mode="threading")
 
+    # Registrar los manejadores de Socket.IO (chat en tiempo real)
+    from app.main import events  # noqa: F401
+
     def get_locale() -> None:
         # Aquí puedes añadir lógica para seleccionar el idioma, por ejemplo, desde la sesión del usuario
         # o una cabecera HTTP. Por ahora, se fija a 'es'.
@@ -54,19 +58,71 @@ def create_app(config_class=DevelopmentConfig) -> None:
 
     # Inicializar servicio de Gemini - VERSIÓN RESTAURADA
     try:
+        from app.core.fair_scheduler import fair_scheduler
+        from app.services.client_pool import client_pool, parse_api_keys, parse_vertex_projects
+        from app.services.context_cache import ContextCache
         from app.services.gemini_service import GeminiService
+        from app.services.image_captions import image_captions
+        from app.services.image_store import image_store
+        from app.services.response_cache import ResponseCache
+
+        response_cache = (
+            ResponseCache(max_entries=app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+            if app.config.get("RESPONSE_CACHE_ENABLED")
+            else None
+        )
+        context_cache = (
+            ContextCache(
+                max_entries=app.config.get("CONTEXT_CACHE_MAX_ENTRIES", 32),
+                ttl_seconds=app.config.get("CONTEXT_CACHE_TTL_SECONDS", 3600),
+                min_tokens=app.config.get("CONTEXT_CACHE_MIN_TOKENS", 4096),
+            )
+            if app.config.get("CONTEXT_CACHE_ENABLED")
+            else None
+        )
+
+        # El pool global también lo usa VertexAIClient, así ambos comparten el estado de cuota.
+        if app.config.get("GEMINI_API_KEYS") or app.config.get("VERTEX_AI_PROJECTS"):
+            client_pool.configure(
+                api_keys=parse_api_keys(app.config.get("GEMINI_API_KEYS", "")),
+                vertex_projects=parse_vertex_projects(app.config.get("VERTEX_AI_PROJECTS", "")),
+                rpm_limit=app.config.get("CLIENT_POOL_RPM_PER_KEY"),
+                cooldown_seconds=app.config.get("CLIENT_POOL_COOLDOWN_SECONDS"),
+            )
+
+        image_store.configure(
+            max_bytes=app.config.get("IMAGE_STORE_MAX_BYTES"),
+            max_entries=app.config.get("IMAGE_STORE_MAX_ENTRIES"),
+            ttl_seconds=app.config.get("IMAGE_STORE_TTL_SECONDS"),
+        )
+        image_captions.configure(
+            max_entries=app.config.get("IMAGE_CAPTIONS_MAX_ENTRIES"),
+            ttl_seconds=app.config.get("IMAGE_CAPTIONS_TTL_SECONDS"),
+        )
+
+        fair_scheduler.configure(
+            max_concurrency=app.config.get("SCHEDULER_MAX_CONCURRENCY"),
+            max_per_user=app.config.get("SCHEDULER_MAX_PER_USER"),
+            queue_timeout=app.config.get("SCHEDULER_QUEUE_TIMEOUT_SECONDS"),
+        )
 
         # Usar la versión simple que funcionaba antes
         # Usar app.config en lugar de atributo directo para mejor compatibilidad
-        app.config["GEMINI_SERVICE"] = GeminiService()
+        app.config["GEMINI_SERVICE"] = GeminiService(
+            response_cache=response_cache,
+            client_pool=client_pool,
+            context_cache=context_cache,
+            caption_cache=image_captions if app.config.get("IMAGE_CAPTIONS_ENABLED") else None,
+        )
         app.logger.info("Servicio de Gemini inicializado exitosamente.")
     except Exception as e:
         app.logger.warning(f"No se pudo inicializar el servicio de Gemini: {e}")
         app.config["GEMINI_SERVICE"] = None
 
     with app.app_context():
-        # Crea las tablas de la base de datos si no existen
+        # Crea las tablas de la base de datos si no existen y añade las columnas nuevas a las existentes
         db.create_all()
+        add_missing_columns(db)
 
     app.logger.info("Aplicación creada y configurada exitosamente.")
 
@@ -0,0 +1,186 @@
+"""
+Event loop asyncio persistente para ejecutar corutinas desde código síncrono (vistas Flask).
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Coroutine, Optional, TypeVar
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class AsyncLoopRunner:
+    """
+    Hilo de fondo con un único event loop de larga duración por proceso.
+
+    Las vistas síncronas envían corutinas con `run()` o `submit()` en lugar de crear un loop
+    (y un ThreadPoolExecutor) por llamada. Así se evita el coste de arranque por petición y los
+    SDK pueden reutilizar las conexiones HTTP/gRPC que mantienen asociadas al loop.
+
+    El hilo se arranca de forma perezosa y se recrea si el proceso ha hecho fork (workers de
+    gunicorn con `preload_app`), ya que los hilos no sobreviven al fork.
+    """
+
+    def __init__(self, name: str = "gemini-async-loop", lag_probe_interval: float = 0.5) -> None:
+        """
+        Inicializa el runner sin arrancar todavía el hilo.
+
+        Args:
+            name: Nombre del hilo (y prefijo de las métricas).
+            lag_probe_interval: Cada cuántos segundos se mide el retraso del loop.
+        """
+        self.name = name
+        self.lag_probe_interval = lag_probe_interval
+        self._metric_prefix = name.replace("-", "_")
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._pending: int = 0
+        self._last_lag: float = 0.0
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Devuelve el event loop del runner, arrancándolo si es necesario."""
+        return self._ensure_started()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Arranca el hilo del loop si no existe o si pertenece a otro proceso."""
+        loop = self._loop
+        if loop is not None and self._pid == os.getpid() and loop.is_running():
+            return loop
+
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid() and self._loop.is_running():
+                return self._loop
+
+            new_loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run() -> None:
+                asyncio.set_event_loop(new_loop)
+                new_loop.call_soon(ready.set)
+                new_loop.create_task(self._monitor_lag())
+                new_loop.run_forever()
+
+            thread = threading.Thread(target=_run, name=self.name, daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = new_loop
+            self._thread = thread
+            self._pid = os.getpid()
+            self._pending = 0
+            logger.info("🔁 Event loop persistente '%s' iniciado (pid %d).", self.name, self._pid)
+            return new_loop
+
+    async def _monitor_lag(self) -> None:
+        """Mide periódicamente cuánto tarda el loop en despertar respecto a lo previsto."""
+        while True:
+            expected = time.monotonic() + self.lag_probe_interval
+            await asyncio.sleep(self.lag_probe_interval)
+            lag = max(0.0, time.monotonic() - expected)
+            self._last_lag = lag
+            metrics_manager.record_timing(f"{self._metric_prefix}_lag", lag)
+
+    def _on_done(self, _future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            pending = self._pending
+        metrics_manager.set_gauge(f"{self._metric_prefix}_pending", pending)
+
+    def submit(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> "concurrent.futures.Future[T]":
+        """
+        Programa una corutina en el loop y devuelve un Future de `concurrent.futures`.
+
+        Args:
+            coro: La corutina a ejecutar.
+            timeout: Plazo máximo en segundos; al vencer, la corutina se cancela dentro del loop
+                y el Future termina con `TimeoutError`.
+
+        Returns:
+            Un Future cuyo `cancel()` también cancela la tarea en el loop.
+        """
+        loop = self._ensure_started()
+        if timeout is not None:
+            coro = asyncio.wait_for(coro, timeout)
+
+        with self._lock:
+            self._pending += 1
+            pending = self._pending
+        metrics_manager.set_gauge(f"{self._metric_prefix}_pending", pending)
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """
+        Ejecuta una corutina en el loop y bloquea el hilo llamador hasta obtener su resultado.
+
+        Args:
+            coro: La corutina a ejecutar.
+            timeout: Plazo máximo en segundos (ver `submit`).
+
+        Raises:
+            TimeoutError: Si se supera el plazo. La corutina queda cancelada.
+            RuntimeError: Si se llama desde el propio hilo del loop (provocaría un bloqueo mutuo).
+        """
+        if self._thread is threading.current_thread():
+            raise RuntimeError("AsyncLoopRunner.run() no puede llamarse desde el propio event loop.")
+
+        future = self.submit(coro, timeout=timeout)
+        try:
+            # Pequeño margen sobre el plazo interno para que la cancelación ocurra dentro del loop.
+            return future.result(timeout=None if timeout is None else timeout + 1.0)
+        except concurrent.futures.TimeoutError as e:
+            future.cancel()
+            raise TimeoutError(f"La operación superó el plazo de {timeout}s") from e
+        except BaseException:
+            future.cancel()
+            raise
+
+    def get_stats(self) -> dict[str, Any]:
+        """Devuelve el estado del runner: si está activo, tareas pendientes y último retraso medido."""
+        return {
+            "running": self._loop is not None and self._pid == os.getpid() and self._loop.is_running(),
+            "pending": self._pending,
+            "loop_lag_seconds": self._last_lag,
+        }
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene el loop y espera a que termine su hilo."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None or thread is None:
+            return
+
+        async def _cancel_pending() -> None:
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if thread.is_alive():
+            try:
+                asyncio.run_coroutine_threadsafe(_cancel_pending(), loop).result(timeout)
+            except Exception:
+                logger.warning("⚠️ No se pudieron cancelar todas las tareas pendientes de '%s'.", self.name)
+            loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+        logger.info("⏹️ Event loop persistente '%s' detenido.", self.name)
+
+
+# Instancia global: un loop por proceso worker, compartido por todas las vistas síncronas.
+loop_runner = AsyncLoopRunner()
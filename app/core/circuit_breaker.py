@@ -0,0 +1,174 @@
+"""
+Circuit breaker por backend de IA (modelo de Vertex AI, API de Gemini).
+
+Estados:
+    - closed: el tráfico pasa y se cuentan los resultados en una ventana deslizante.
+    - open: el backend falla demasiado (o es demasiado lento); no recibe tráfico de usuarios.
+    - half_open: ha pasado el tiempo de espera y una sonda en segundo plano está comprobando
+      si el backend se ha recuperado. Las peticiones de usuarios siguen sin llegarle.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Optional, Tuple
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito del backend está abierto y la petición no se ha intentado."""
+
+
+class CircuitBreaker:
+    """Circuit breaker con umbrales de tasa de error y de llamadas lentas."""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 20.0,
+        slow_call_rate_threshold: float = 0.8,
+        minimum_calls: int = 5,
+        window_size: int = 20,
+        open_seconds: float = 30.0,
+    ) -> None:
+        """
+        Args:
+            name: Nombre del backend (prefijo de las métricas `circuit_<name>_*`).
+            failure_rate_threshold: Fracción de errores en la ventana que abre el circuito.
+            slow_call_seconds: Duración a partir de la cual una llamada cuenta como lenta.
+            slow_call_rate_threshold: Fracción de llamadas lentas en la ventana que abre el circuito.
+            minimum_calls: Llamadas mínimas en la ventana antes de evaluar los umbrales.
+            window_size: Número de resultados recientes que se tienen en cuenta.
+            open_seconds: Tiempo en estado abierto antes de lanzar la sonda de recuperación.
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self._metric_prefix = "circuit_" + "".join(c if c.isalnum() else "_" for c in name)
+        self._lock = threading.Lock()
+        # (éxito, lenta) de las últimas llamadas.
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._last_error: Optional[str] = None
+        metrics_manager.set_gauge(f"{self._metric_prefix}_state", _STATE_GAUGE[CLOSED])
+
+    @property
+    def state(self) -> str:
+        """Estado actual del circuito."""
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Indica si una petición de usuario puede ir a este backend."""
+        if self._state == CLOSED:
+            return True
+        metrics_manager.increment_counter(f"{self._metric_prefix}_rejected")
+        return False
+
+    def record_success(self, duration: float = 0.0) -> None:
+        """Registra una llamada correcta (una llamada lenta cuenta para el umbral de latencia)."""
+        with self._lock:
+            if self._state != CLOSED:
+                return
+            self._window.append((True, duration >= self.slow_call_seconds))
+            self._evaluate()
+
+    def record_failure(self, error: Optional[BaseException] = None, duration: float = 0.0) -> None:
+        """Registra una llamada fallida."""
+        with self._lock:
+            if error is not None:
+                self._last_error = str(error)
+            if self._state != CLOSED:
+                return
+            self._window.append((False, duration >= self.slow_call_seconds))
+            self._evaluate()
+
+    def _evaluate(self) -> None:
+        calls = len(self._window)
+        if calls < self.minimum_calls:
+            return
+        failure_rate = sum(1 for ok, _ in self._window if not ok) / calls
+        slow_rate = sum(1 for _, slow in self._window if slow) / calls
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            logger.warning(
+                "🔌 Circuito '%s' abierto (errores %.0f%%, lentas %.0f%%).",
+                self.name,
+                failure_rate * 100,
+                slow_rate * 100,
+            )
+            self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            metrics_manager.increment_counter(f"{self._metric_prefix}_opened")
+        elif state == CLOSED:
+            self._window.clear()
+        metrics_manager.set_gauge(f"{self._metric_prefix}_state", _STATE_GAUGE[state])
+
+    def trip(self, error: Optional[BaseException] = None) -> None:
+        """Abre el circuito de inmediato (p. ej. si el backend no se pudo inicializar)."""
+        with self._lock:
+            if error is not None:
+                self._last_error = str(error)
+            if self._state != OPEN:
+                self._transition(OPEN)
+
+    def try_begin_probe(self) -> bool:
+        """
+        Pasa a half_open si el circuito lleva abierto `open_seconds`.
+
+        Returns:
+            True si el llamador debe lanzar la sonda; en ese caso tiene que terminar con
+            `probe_succeeded()` o `probe_failed()`.
+        """
+        with self._lock:
+            if self._state != OPEN or time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self._transition(HALF_OPEN)
+            return True
+
+    def probe_succeeded(self) -> None:
+        """La sonda funcionó: el circuito se cierra y vuelve a recibir tráfico."""
+        with self._lock:
+            self._transition(CLOSED)
+        logger.info("✅ Circuito '%s' cerrado tras una sonda correcta.", self.name)
+
+    def probe_failed(self, error: Optional[BaseException] = None) -> None:
+        """La sonda falló: el circuito vuelve a abrirse durante otros `open_seconds`."""
+        with self._lock:
+            if error is not None:
+                self._last_error = str(error)
+            self._transition(OPEN)
+        logger.warning("⚠️ Sonda del circuito '%s' fallida: %s", self.name, error)
+
+    def get_stats(self) -> dict[str, Any]:
+        """Estado, llamadas en la ventana, tasas de error y lentitud, y último error."""
+        with self._lock:
+            calls = len(self._window)
+            failures = sum(1 for ok, _ in self._window if not ok)
+            slow = sum(1 for _, is_slow in self._window if is_slow)
+            return {
+                "state": self._state,
+                "calls": calls,
+                "failures": failures,
+                "failure_rate": failures / calls if calls else 0.0,
+                "slow_call_rate": slow / calls if calls else 0.0,
+                "open_for_seconds": time.monotonic() - self._opened_at if self._state != CLOSED else 0.0,
+                "last_error": self._last_error,
+            }
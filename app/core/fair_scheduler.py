@@ -0,0 +1,235 @@
+"""
+Planificador justo de las llamadas salientes al modelo.
+
+Todas las generaciones compiten por los mismos hilos y por la misma cuota del proveedor. El
+planificador limita las llamadas simultáneas y, cuando hay cola, reparte los huecos con weighted
+fair queuing: cada usuario es un flujo cuyo peso depende de su rol, de modo que el tráfico premium
+espera menos y ningún usuario acapara la concurrencia aunque envíe muchas peticiones a la vez.
+"""
+
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Iterator, Optional
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+# Peso de cada rol (ver ROLE_PERMISSIONS): a más peso, más huecos recibe su cola cuando hay espera.
+ROLE_WEIGHTS: dict[str, float] = {
+    "superadmin": 4.0,
+    "admin": 4.0,
+    "premium": 4.0,
+    "moderator": 2.0,
+    "user": 2.0,
+    "guest": 1.0,
+}
+
+
+def default_max_concurrency() -> int:
+    """
+    Concurrencia por defecto: la mitad de los hilos del worker de gunicorn (`GUNICORN_THREADS`).
+
+    Si el planificador admitiese tantas llamadas como hilos hay, las peticiones sobrantes
+    esperarían en el backlog de gunicorn y nunca en la cola con prioridad. Con la mitad, el resto
+    de hilos puede esperar en la cola ponderada y atender las rutas que no llaman al modelo.
+    """
+    return max(1, int(os.getenv("GUNICORN_THREADS", "4")) // 2)
+
+
+class SchedulerTimeoutError(RuntimeError):
+    """La petición no obtuvo hueco dentro del tiempo máximo de cola."""
+
+
+class _Waiter:
+    """Una petición en cola."""
+
+    __slots__ = ("owner", "role", "tag", "seq", "enqueued_at", "event", "granted")
+
+    def __init__(self, owner: str, role: str, tag: float, seq: int) -> None:
+        self.owner = owner
+        self.role = role
+        self.tag = tag
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+class FairScheduler:
+    """
+    Semáforo con cola weighted fair queuing por usuario y rol.
+
+    Cada petición recibe una etiqueta de finalización virtual `max(V, F_usuario) + 1/peso` y,
+    cuando se libera un hueco, se atiende la cabeza de cola con la etiqueta más baja entre los
+    usuarios que no han alcanzado su límite de llamadas simultáneas.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_per_user: int = 4,
+        queue_timeout: float = 30.0,
+        weights: Optional[dict[str, float]] = None,
+    ) -> None:
+        """
+        Args:
+            max_concurrency: Llamadas simultáneas al modelo en el proceso; por defecto
+                `default_max_concurrency()`.
+            max_per_user: Llamadas simultáneas de un mismo usuario.
+            queue_timeout: Segundos máximos de espera en cola antes de rechazar la petición.
+            weights: Peso por rol; por defecto `ROLE_WEIGHTS`.
+        """
+        self.max_concurrency = max_concurrency or default_max_concurrency()
+        self.max_per_user = max_per_user
+        self.queue_timeout = queue_timeout
+        self.weights = dict(weights or ROLE_WEIGHTS)
+        self._lock = threading.Lock()
+        self._queues: dict[str, deque[_Waiter]] = {}
+        self._last_finish: dict[str, float] = {}
+        self._active_by_owner: dict[str, int] = {}
+        self._active = 0
+        self._virtual_time = 0.0
+        self._seq = 0
+
+    def configure(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_per_user: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+    ) -> None:
+        """Ajusta los límites (p. ej. desde la configuración de la aplicación)."""
+        with self._lock:
+            if max_concurrency is not None:
+                self.max_concurrency = max_concurrency
+            if max_per_user is not None:
+                self.max_per_user = max_per_user
+            if queue_timeout is not None:
+                self.queue_timeout = queue_timeout
+            self._dispatch()
+
+    def _role_class(self, role: Optional[str]) -> str:
+        return role if role in self.weights else "guest"
+
+    def acquire(self, owner: str, role: Optional[str] = "user", timeout: Optional[float] = None) -> float:
+        """
+        Espera un hueco para `owner`.
+
+        Returns:
+            Segundos de espera en cola.
+
+        Raises:
+            SchedulerTimeoutError: si no se obtiene hueco en `timeout` (o `queue_timeout`) segundos.
+        """
+        role = self._role_class(role)
+        with self._lock:
+            start_tag = max(self._virtual_time, self._last_finish.get(owner, 0.0))
+            tag = start_tag + 1.0 / self.weights[role]
+            self._last_finish[owner] = tag
+            self._seq += 1
+            waiter = _Waiter(owner, role, tag, self._seq)
+            self._queues.setdefault(owner, deque()).append(waiter)
+            self._dispatch()
+
+        if not waiter.event.wait(self.queue_timeout if timeout is None else timeout):
+            with self._lock:
+                if not waiter.granted:
+                    self._remove(waiter)
+                    self._forget_if_idle(owner)
+                    metrics_manager.increment_counter("scheduler_timeouts")
+                    raise SchedulerTimeoutError("No hay capacidad disponible para procesar la petición")
+
+        wait = time.monotonic() - waiter.enqueued_at
+        metrics_manager.record_timing(f"scheduler_wait_{role}", wait)
+        return wait
+
+    def release(self, owner: str) -> None:
+        """Libera el hueco de `owner` y lo cede a la siguiente petición en cola."""
+        with self._lock:
+            self._active -= 1
+            remaining = self._active_by_owner.get(owner, 1) - 1
+            if remaining > 0:
+                self._active_by_owner[owner] = remaining
+            else:
+                self._active_by_owner.pop(owner, None)
+                self._forget_if_idle(owner)
+            self._dispatch()
+
+    @contextlib.contextmanager
+    def slot(self, owner: str, role: Optional[str] = "user", timeout: Optional[float] = None) -> Iterator[float]:
+        """Context manager que ocupa un hueco durante la llamada al modelo."""
+        wait = self.acquire(owner, role, timeout)
+        try:
+            yield wait
+        finally:
+            self.release(owner)
+
+    def _forget_if_idle(self, owner: str) -> None:
+        """
+        Olvida la etiqueta de un usuario sin peticiones activas ni en cola (con el lock tomado).
+
+        Un usuario inactivo vuelve a empezar en el tiempo virtual actual, como en WFQ; así el
+        diccionario sólo guarda a los usuarios con peticiones en curso, también cuando abandonan
+        la cola por timeout.
+        """
+        if owner not in self._queues and owner not in self._active_by_owner:
+            self._last_finish.pop(owner, None)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.owner)
+        if queue is not None:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.owner]
+        self._publish_gauges()
+
+    def _dispatch(self) -> None:
+        """Concede los huecos libres a las cabezas de cola con menor etiqueta (con el lock tomado)."""
+        while self._active < self.max_concurrency:
+            best: Optional[_Waiter] = None
+            for owner, queue in self._queues.items():
+                if self._active_by_owner.get(owner, 0) >= self.max_per_user:
+                    continue
+                head = queue[0]
+                if best is None or (head.tag, head.seq) < (best.tag, best.seq):
+                    best = head
+            if best is None:
+                break
+
+            queue = self._queues[best.owner]
+            queue.popleft()
+            if not queue:
+                del self._queues[best.owner]
+            self._virtual_time = max(self._virtual_time, best.tag - 1.0 / self.weights[best.role])
+            self._active += 1
+            self._active_by_owner[best.owner] = self._active_by_owner.get(best.owner, 0) + 1
+            best.granted = True
+            best.event.set()
+        self._publish_gauges()
+
+    def _publish_gauges(self) -> None:
+        metrics_manager.set_gauge("scheduler_active", self._active)
+        metrics_manager.set_gauge("scheduler_queued", sum(len(queue) for queue in self._queues.values()))
+
+    def get_stats(self) -> dict[str, Any]:
+        """Ocupación actual y cola por rol."""
+        with self._lock:
+            queued: dict[str, int] = {}
+            for queue in self._queues.values():
+                for waiter in queue:
+                    queued[waiter.role] = queued.get(waiter.role, 0) + 1
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "max_per_user": self.max_per_user,
+                "queued_by_role": queued,
+                "active_users": len(self._active_by_owner),
+            }
+
+
+# Instancia global compartida por todas las rutas que llaman al modelo.
+fair_scheduler = FairScheduler()
@@ -3,16 +3,25 @@ Sistema de métricas para monitoreo de rendimiento.
 """
 
 import logging
+import math
 import threading
 import time
 from collections import defaultdict, deque
-from typing import Any, Deque, Dict, List
+from typing import Any, Deque, Dict, List, Sequence
 
 from flask import Blueprint, Response, current_app
 
 logger = logging.getLogger(__name__)
 
 
+def _percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Calcula un percentil (0-100) sobre una secuencia ya ordenada, por el método del rango más cercano."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
 class MetricsManager:
     """
     Gestor de métricas de rendimiento, thread-safe, para monitoreo de la aplicación.
@@ -31,6 +40,8 @@ class MetricsManager:
         self.counters: Dict[str, int] = defaultdict(int)
         self.response_times: Deque[float] = deque(maxlen=max_history)
         self.request_history: Deque[Dict[str, Any]] = deque(maxlen=max_history)
+        self.timings: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=max_history))
+        self.gauges: Dict[str, float] = {}
         self.start_time: float = time.time()
 
         logger.info(
@@ -48,6 +59,40 @@ class MetricsManager:
         with self._lock:
             self.response_times.append(duration)
 
+    def set_gauge(self, name: str, value: float) -> None:
+        """Fija el valor actual de un indicador instantáneo (p. ej. profundidad de una cola)."""
+        with self._lock:
+            self.gauges[name] = value
+
+    def record_timing(self, name: str, duration: float) -> None:
+        """
+        Registra una duración (en segundos) en un historial con nombre, p. ej. 'stream_ttft'.
+
+        Cada historial mantiene como máximo `max_history` muestras y se resume con percentiles
+        en `get_metrics()`.
+        """
+        with self._lock:
+            self.timings[name].append(duration)
+
+    def get_timing_stats(self, name: str) -> Dict[str, float]:
+        """Devuelve el resumen (count, avg, p50, p95, p99, max) de un historial de duraciones."""
+        with self._lock:
+            return self._timing_stats_without_lock(name)
+
+    def _timing_stats_without_lock(self, name: str) -> Dict[str, float]:
+        """Versión interna de get_timing_stats que no adquiere el lock."""
+        values = sorted(self.timings.get(name, ()))
+        if not values:
+            return {}
+        return {
+            "count": len(values),
+            "avg_seconds": sum(values) / len(values),
+            "p50_seconds": _percentile(values, 50),
+            "p95_seconds": _percentile(values, 95),
+            "p99_seconds": _percentile(values, 99),
+            "max_seconds": values[-1],
+        }
+
     def record_request(self, endpoint: str, method: str, status_code: int) -> dict[str, Any]:
         """
         Registra una solicitud entrante y actualiza los contadores relacionados.
@@ -90,7 +135,9 @@ class MetricsManager:
             return {
                 "uptime_seconds": uptime,
                 "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
                 "response_time_stats": response_stats,
+                "timing_stats": {name: self._timing_stats_without_lock(name) for name in self.timings if self.timings[name]},
                 "requests_per_minute": len(recent_requests),
                 "request_history_count": len(self.request_history),
                 "timestamp": current_time,
@@ -102,6 +149,8 @@ class MetricsManager:
             self.counters.clear()
             self.response_times.clear()
             self.request_history.clear()
+            self.timings.clear()
+            self.gauges.clear()
             self.start_time = time.time()
         logger.warning("Todas las métricas han sido reseteadas.")
 
@@ -174,6 +223,18 @@ def prometheus_metrics() -> None:
             )
         )
 
+    # Indicadores instantáneos
+    for key, value in metrics.get("gauges", {}).items():
+        output.append(_format_prometheus_metric(f"gemini_{key}", value, "gauge", f"Valor actual de {key}."))
+
+    # Duraciones con nombre (TTFT, cadencia de chunks, ...) como resúmenes con cuantiles
+    for name, stats in metrics.get("timing_stats", {}).items():
+        metric_name = f"gemini_{name}_seconds"
+        output.append(f"# HELP {metric_name} Distribución de la duración '{name}'.\n# TYPE {metric_name} summary\n")
+        for quantile in ("50", "95", "99"):
+            output.append(f'{metric_name}{{quantile="0.{quantile}"}} {stats[f"p{quantile}_seconds"]}\n')
+        output.append(f"{metric_name}_count {stats['count']}\n")
+
     # Solicitudes por minuto
     output.append(
         _format_prometheus_metric(
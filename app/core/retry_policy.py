@@ -0,0 +1,252 @@
+"""
+Política de reintentos compartida para las llamadas al proveedor de IA.
+
+Reintenta sólo los errores transitorios, con backoff exponencial "full jitter" (espera aleatoria
+entre 0 y el tope del intento) para que los clientes no se sincronicen, sin pasarse del plazo de
+la petición y con un presupuesto de reintentos (token bucket) que los mantiene por debajo de un
+porcentaje del tráfico: durante una caída del proveedor se deja de reintentar en lugar de
+multiplicar la carga.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Mensajes típicos de errores transitorios cuando el SDK no usa las excepciones de google.api_core.
+_TRANSIENT_MARKERS = ("429", "500", "502", "503", "504", "unavailable", "timeout", "timed out", "deadline", "quota")
+
+
+class RetryBudget:
+    """
+    Token bucket de reintentos: cada petición deposita `ratio` fichas y cada reintento gasta una.
+
+    Con `ratio=0.1` los reintentos no superan el 10 % de las peticiones, más una reserva mínima
+    por segundo (0,1/s: un reintento cada 10 s) para que con poco tráfico también se pueda
+    reintentar. El bucket empieza con pocas fichas y tiene un tope bajo para que un arranque en
+    plena caída, o un silencio largo, no permitan una ráfaga de reintentos.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.1,
+        min_per_second: float = 0.1,
+        max_tokens: float = 10.0,
+        initial_tokens: float = 2.0,
+    ) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = min(initial_tokens, max_tokens)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def deposit(self) -> None:
+        """Registra una petición (primer intento)."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """Intenta gastar una ficha para un reintento."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Indica si un error es transitorio y merece reintento.
+
+    Se reintentan los 429/5xx, timeouts y errores de conexión, y los rechazos del limitador por
+    concurrencia. No se reintentan los errores del cliente (argumentos, credenciales, permisos),
+    los circuitos abiertos ni los techos rpm/rpd del limitador.
+    """
+    from app.core.adaptive_limiter import LimitExceededError
+    from app.core.circuit_breaker import CircuitOpenError
+
+    if isinstance(error, LimitExceededError):
+        return error.reason == "concurrency"
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    try:
+        from google.api_core import exceptions as api_exceptions
+
+        if isinstance(
+            error,
+            (
+                api_exceptions.TooManyRequests,
+                api_exceptions.ResourceExhausted,
+                api_exceptions.ServiceUnavailable,
+                api_exceptions.InternalServerError,
+                api_exceptions.GatewayTimeout,
+                api_exceptions.DeadlineExceeded,
+                api_exceptions.Aborted,
+            ),
+        ):
+            return True
+        if isinstance(error, api_exceptions.GoogleAPICallError):
+            return False
+    except ImportError:
+        pass
+    text = str(error).lower()
+    return any(marker in text for marker in _TRANSIENT_MARKERS)
+
+
+class RetryPolicy:
+    """Reintentos con full jitter, clasificación de errores, plazo y presupuesto compartido."""
+
+    def __init__(
+        self,
+        name: str = "upstream",
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        budget: Optional[RetryBudget] = None,
+        retryable: Callable[[BaseException], bool] = is_retryable_error,
+    ) -> None:
+        """
+        Args:
+            name: Nombre de la política (prefijo de las métricas).
+            max_attempts: Intentos totales, incluido el primero.
+            base_delay: Tope de la espera antes del primer reintento; se duplica en cada intento.
+            max_delay: Tope máximo de la espera entre intentos.
+            budget: Presupuesto de reintentos; por defecto uno propio del 10 %.
+            retryable: Clasificador de errores reintentables.
+        """
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.retryable = retryable
+
+    def configure(
+        self,
+        max_attempts: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        budget_ratio: Optional[float] = None,
+    ) -> None:
+        """Ajusta intentos, espera base y presupuesto (p. ej. desde `VertexAIConfig.fallback_config`)."""
+        if max_attempts is not None:
+            self.max_attempts = max(1, int(max_attempts))
+        if base_delay is not None:
+            self.base_delay = float(base_delay)
+        if budget_ratio is not None:
+            self.budget.ratio = float(budget_ratio)
+
+    def backoff(self, attempt: int) -> float:
+        """Espera "full jitter" antes del reintento número `attempt` (empezando en 1)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _next_delay(self, error: BaseException, attempt: int, deadline: Optional[float]) -> Optional[float]:
+        """Decide si se reintenta tras el intento `attempt`; devuelve la espera o None para rendirse."""
+        if attempt >= self.max_attempts:
+            reason = "exhausted"
+        elif not self.retryable(error):
+            reason = "not_retryable"
+        else:
+            delay = self.backoff(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                reason = "deadline"
+            elif not self.budget.try_withdraw():
+                reason = "budget"
+            else:
+                metrics_manager.increment_counter(f"retry_{self.name}_retries")
+                logger.info("🔁 Reintento %d de %s en %.2fs: %s", attempt, self.name, delay, error)
+                return delay
+        metrics_manager.increment_counter(f"retry_{self.name}_giveup_{reason}")
+        return None
+
+    def _record_attempt(self, attempt: int, start: float, error: Optional[BaseException]) -> None:
+        metrics_manager.increment_counter(f"retry_{self.name}_attempts")
+        metrics_manager.record_timing(f"retry_{self.name}_attempt_{attempt}_latency", time.monotonic() - start)
+        if error is not None:
+            metrics_manager.increment_counter(f"retry_{self.name}_attempt_errors")
+
+    def call(self, fn: Callable[[], T], deadline: Optional[float] = None) -> T:
+        """
+        Ejecuta `fn` con reintentos (versión síncrona).
+
+        Args:
+            fn: Llamada a reintentar.
+            deadline: Instante (`time.monotonic()`) a partir del cual no se reintenta.
+        """
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                self._record_attempt(attempt, start, e)
+                delay = self._next_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self._record_attempt(attempt, start, None)
+            return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        """
+        Ejecuta la corutina que devuelve `fn` con reintentos; la espera no bloquea el event loop.
+
+        Args:
+            fn: Fábrica de la corutina (se crea una nueva por intento).
+            deadline: Instante (`time.monotonic()`) a partir del cual no se reintenta.
+        """
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                self._record_attempt(attempt, start, e)
+                delay = self._next_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._record_attempt(attempt, start, None)
+            return result
+
+    def get_stats(self) -> dict[str, Any]:
+        """Configuración y fichas disponibles del presupuesto."""
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "budget_ratio": self.budget.ratio,
+            "budget_tokens": round(self.budget.tokens, 2),
+        }
+
+
+# Instancia global: el presupuesto de reintentos se comparte entre GeminiService y VertexAIClient.
+retry_policy = RetryPolicy()
@@ -0,0 +1,140 @@
+"""
+Coalescencia de llamadas idénticas en vuelo ("single-flight").
+
+Si llegan varias peticiones con la misma huella mientras la primera sigue en curso, sólo ésta
+llama al servicio: las demás esperan su resultado (o su excepción) y lo comparten.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalescencia para código síncrono (hilos de gunicorn/Flask)."""
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name: Prefijo de las métricas (`<name>_leaders`, `<name>_collapsed`).
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+
+    def do(self, key: str, fn: Callable[[], T], deadline: Optional[float] = None) -> T:
+        """
+        Ejecuta `fn` o, si ya hay una llamada en vuelo con la misma clave, espera su resultado.
+
+        Args:
+            key: Huella de la petición.
+            fn: Función que realiza la llamada real.
+            deadline: Instante (`time.monotonic()`) hasta el que este llamador espera a la llamada
+                líder; el plazo del líder puede ser más largo que el suyo.
+
+        Returns:
+            El resultado de la llamada líder. Si ésta falla, la misma excepción se lanza en todos
+            los llamadores que la esperaban.
+
+        Raises:
+            TimeoutError: Si vence `deadline` antes de que termine la llamada líder.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._inflight[key] = future
+
+        if not leader:
+            metrics_manager.increment_counter(f"{self.name}_collapsed")
+            logger.debug("Petición coalescida con una llamada en vuelo (%s)", key[:24])
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                return future.result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                if future.done():
+                    raise  # la propia llamada líder terminó con un TimeoutError
+                metrics_manager.increment_counter(f"{self.name}_follower_timeouts")
+                raise TimeoutError("Se agotó el plazo esperando a una llamada idéntica en curso") from None
+
+        metrics_manager.increment_counter(f"{self.name}_leaders")
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def inflight_count(self) -> int:
+        """Número de claves con una llamada en curso."""
+        with self._lock:
+            return len(self._inflight)
+
+
+class AsyncSingleFlight:
+    """
+    Coalescencia para corutinas.
+
+    La llamada real se ejecuta como una tarea independiente a la que todos los llamadores
+    esperan con `asyncio.shield`; la tarea sólo se cancela cuando se cancelan todos ellos.
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name: Prefijo de las métricas (`<name>_leaders`, `<name>_collapsed`).
+        """
+        self.name = name
+        self._inflight: Dict[str, Tuple[asyncio.Task, list[int]]] = {}
+
+    async def do(self, key: str, coro_fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Espera el resultado de `coro_fn()` compartiéndolo con las llamadas idénticas en vuelo.
+
+        Args:
+            key: Huella de la petición.
+            coro_fn: Función que crea la corutina de la llamada real.
+        """
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0].get_loop() is asyncio.get_running_loop():
+            task, waiters = entry
+            metrics_manager.increment_counter(f"{self.name}_collapsed")
+        else:
+            task = asyncio.ensure_future(coro_fn())
+            waiters = [0]
+            self._inflight[key] = (task, waiters)
+            task.add_done_callback(lambda _t, k=key, t=task: self._forget(k, t))
+            metrics_manager.increment_counter(f"{self.name}_leaders")
+
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            waiters[0] -= 1
+            if waiters[0] == 0 and not task.done():
+                task.cancel()
+            raise
+
+    def _forget(self, key: str, task: "asyncio.Task[Any]") -> None:
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._inflight[key]
+
+    def inflight_count(self) -> int:
+        """Número de claves con una llamada en curso."""
+        return len(self._inflight)
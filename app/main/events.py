@@ -1,36 +1,301 @@
 """
 Manejo de eventos de Socket.IO para la comunicación en tiempo real.
+
+El chat por Socket.IO autentica una sola vez al conectar (JWT en `auth.token`, en el parámetro
+`token` o en la cabecera Authorization) y guarda el estado de la conversación por conexión, así
+los mensajes siguientes no repiten el coste de HTTP, JWT y middleware. Las respuestas se emiten en
+trozos (`response_chunk`) a medida que llegan del modelo y terminan con `response_done` o
+`response_error`.
+
+Cada conexión tiene contrapresión: si la cola de salida de engine.io de un cliente lento supera
+SOCKETIO_MAX_PENDING_PACKETS, se deja de leer del modelo hasta que se vacíe y, si no se vacía en
+SOCKETIO_SLOW_CLIENT_TIMEOUT_SECONDS, la generación se cancela. La memoria por conexión queda
+acotada aunque el cliente no lea.
 """
 
-from typing import Any
+import logging
+import threading
+import time
+from typing import Any, Optional
 
+from flask import current_app, request
+from flask_jwt_extended import decode_token
 from flask_socketio import emit
 
-from app import socketio
+from app.config.extensions import socketio
+from app.core.fair_scheduler import SchedulerTimeoutError, fair_scheduler
+from app.core.metrics import metrics_manager
+from app.models import User
+from app.services.chat_pipeline import (
+    ChatRequestError,
+    build_generation_kwargs,
+    model_override,
+    parse_chat_request,
+    queue_timeout,
+    request_deadline,
+)
+from app.services.model_router import model_router
+
+logger = logging.getLogger(__name__)
+
+# Mensajes de la conversación que se guardan por conexión (el ensamblador recorta por tokens).
+HISTORY_MAX_MESSAGES = 40
+
+
+class ChatConnection:
+    """Estado de una conexión de chat: identidad, conversación y generación en curso."""
+
+    def __init__(self, sid: str, user_id: Optional[int], role: str, owner: str) -> None:
+        self.sid = sid
+        self.user_id = user_id
+        self.role = role
+        self.owner = owner
+        self.history: list[dict[str, Any]] = []
+        # Una sola generación a la vez por conexión.
+        self.generating = threading.Lock()
+        # Se activa al desconectar para cortar la generación en curso.
+        self.closed = threading.Event()
+
+    def remember(self, user_text: str, model_text: str) -> None:
+        """Añade un turno completo a la conversación de la conexión."""
+        self.history.append({"role": "user", "parts": [{"text": user_text}]})
+        self.history.append({"role": "model", "parts": [{"text": model_text}]})
+        del self.history[:-HISTORY_MAX_MESSAGES]
+
+
+# Estado por sid de Socket.IO.
+_connections: dict[str, ChatConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def _token_from_handshake(auth: Optional[dict[str, Any]]) -> Optional[str]:
+    """Token JWT del handshake: `auth.token`, parámetro `token` o cabecera `Authorization: Bearer`."""
+    if isinstance(auth, dict) and auth.get("token"):
+        return auth["token"]
+    if request.args.get("token"):
+        return request.args["token"]
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[len("Bearer ") :]
+    return None
+
+
+def _user_from_token(token: str) -> Optional[User]:
+    """Usuario activo del token de acceso, o None si el token no es válido (o es de refresco)."""
+    try:
+        claims = decode_token(token)
+        if claims.get("type") != "access":
+            return None
+        identity = claims[current_app.config.get("JWT_IDENTITY_CLAIM", "sub")]
+        user_id = identity["user_id"] if isinstance(identity, dict) else int(identity)
+    except Exception:
+        return None
+    user = User.query.get(user_id)
+    return user if user and user.status == "active" else None
+
+
+class SlowClientError(Exception):
+    """El cliente no consume la respuesta a tiempo y la generación se corta."""
+
+
+# Se avisa una sola vez si esta versión de engine.io no permite ver la cola de salida.
+_backpressure_unavailable = threading.Event()
+
+
+def _outgoing_queue(sid: str) -> Optional[Any]:
+    """
+    Cola de salida de engine.io de la conexión, o None si no se puede obtener.
+
+    No es API pública de python-socketio/python-engineio: cada paso se comprueba para que un cambio
+    de versión o de `async_mode` desactive la contrapresión en lugar de romper el chat.
+    """
+    server = getattr(socketio, "server", None)
+    manager = getattr(server, "manager", None)
+    sockets = getattr(getattr(server, "eio", None), "sockets", None)
+    if manager is None or not isinstance(sockets, dict) or not hasattr(manager, "eio_sid_from_sid"):
+        return None
+    try:
+        eio_socket = sockets.get(manager.eio_sid_from_sid(sid, "/"))
+    except Exception:
+        return None
+    queue = getattr(eio_socket, "queue", None)
+    return queue if callable(getattr(queue, "qsize", None)) else None
+
+
+def _pending_packets(sid: str) -> int:
+    """Paquetes en la cola de salida de engine.io de la conexión (0, sin contrapresión, si no se puede saber)."""
+    queue = _outgoing_queue(sid)
+    if queue is None:
+        if not _backpressure_unavailable.is_set():
+            _backpressure_unavailable.set()
+            logger.warning("⚠️ No se puede leer la cola de salida de engine.io: contrapresión desactivada.")
+        return 0
+    try:
+        return int(queue.qsize())
+    except Exception:
+        return 0
+
+
+def _wait_for_client(connection: ChatConnection) -> bool:
+    """
+    Espera a que la cola de salida del cliente baje del máximo.
+
+    Returns:
+        False si el cliente se desconecta o no vacía la cola a tiempo.
+    """
+    if connection.closed.is_set():
+        return False
+    max_pending = current_app.config.get("SOCKETIO_MAX_PENDING_PACKETS", 32)
+    if _pending_packets(connection.sid) < max_pending:
+        return True
+    metrics_manager.increment_counter("socketio_backpressure_waits")
+    deadline = time.monotonic() + current_app.config.get("SOCKETIO_SLOW_CLIENT_TIMEOUT_SECONDS", 10)
+    while _pending_packets(connection.sid) >= max_pending:
+        if connection.closed.is_set() or time.monotonic() >= deadline:
+            return False
+        socketio.sleep(0.05)
+    return True
 
 
 @socketio.on("connect")
-def handle_connect() -> None:
+def handle_connect(auth: Optional[dict[str, Any]] = None) -> None:
     """
     Maneja la conexión de un nuevo cliente.
+
+    Autentica el JWT una sola vez; sin token la conexión es de invitado y con un token no válido
+    se rechaza.
     """
-    print("Client connected")
-    emit("status", {"msg": "Connected to server"})
+    user = None
+    token = _token_from_handshake(auth)
+    if token:
+        user = _user_from_token(token)
+        if user is None:
+            metrics_manager.increment_counter("socketio_auth_rejected")
+            raise ConnectionRefusedError("unauthorized")
+
+    if user:
+        connection = ChatConnection(request.sid, user.id, user.role or "user", f"user:{user.id}")
+    else:
+        connection = ChatConnection(request.sid, None, "guest", f"ip:{request.remote_addr}")
+    with _connections_lock:
+        _connections[request.sid] = connection
+    metrics_manager.set_gauge("socketio_connections", len(_connections))
+    logger.info("🔌 Cliente conectado (%s)", connection.owner)
+    emit("status", {"msg": "Connected to server", "authenticated": user is not None})
 
 
 @socketio.on("disconnect")
-def handle_disconnect() -> None:
+def handle_disconnect(reason: Any = None) -> None:
+    """
+    Maneja la desconexión de un cliente y cancela su generación en curso.
     """
-    Maneja la desconexión de un cliente.
+    with _connections_lock:
+        connection = _connections.pop(request.sid, None)
+    if connection:
+        connection.closed.set()
+        logger.info("🔌 Cliente desconectado (%s)", connection.owner)
+    metrics_manager.set_gauge("socketio_connections", len(_connections))
+
+
+def _stream_to_client(connection: ChatConnection, stream: Any, request_id: Any, start_time: float) -> Optional[list[str]]:
+    """
+    Emite los trozos del modelo como `response_chunk`, esperando a los clientes lentos.
+
+    Returns:
+        Los trozos emitidos, o None si el cliente se ha desconectado.
+
+    Raises:
+        SlowClientError: Si el cliente no vacía su cola de salida a tiempo.
     """
-    print("Client disconnected")
+    chunks: list[str] = []
+    try:
+        for text in stream:
+            if not chunks:
+                metrics_manager.record_timing("socketio_ttft", time.time() - start_time)
+            chunks.append(text)
+            if not _wait_for_client(connection):
+                if connection.closed.is_set():
+                    return None
+                raise SlowClientError()
+            emit("response_chunk", {"request_id": request_id, "text": text})
+    finally:
+        # Cerrar el generador libera la llamada al modelo aunque se corte a medias.
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    return chunks
+
+
+def _generate(connection: ChatConnection, gemini_service: Any, params: dict[str, Any], data: dict[str, Any]) -> None:
+    """Genera y emite la respuesta a un mensaje ya validado; las excepciones las traduce `handle_message`."""
+    request_id = data.get("request_id")
+    start_time = time.time()
+    # Sólo el `timeout` del mensaje: las cabeceras de `request` son las del handshake de la conexión.
+    deadline = request_deadline(data.get("timeout"))
+    params["history"] = list(connection.history)
+    generation_kwargs, routing = build_generation_kwargs(params, connection.user_id, model_override(params, connection.role))
+    generation_kwargs["deadline"] = deadline
+    generation_kwargs["cancel_event"] = connection.closed
+    with fair_scheduler.slot(connection.owner, connection.role, queue_timeout(deadline)):
+        chunks = _stream_to_client(
+            connection, gemini_service.generate_response_stream(**generation_kwargs), request_id, start_time
+        )
+    if chunks is None:
+        return
+
+    response_text = "".join(chunks)
+    connection.remember(params["user_message"], response_text)
+    metrics_manager.increment_counter("socketio_chunks", len(chunks))
+    model_router.record_outcome(routing, time.time() - start_time, response_text)
+    done = {"request_id": request_id, "chunks": len(chunks)}
+    if params["image"]:
+        done["image_hash"] = params["image"].digest
+    emit("response_done", done)
 
 
 @socketio.on("message")
 def handle_message(data: dict[str, Any]) -> None:
     """
-    Maneja los mensajes entrantes de los clientes.
+    Maneja los mensajes de chat de los clientes.
+
+    Acepta el mismo cuerpo que /api/chat/stream (salvo `history`, que se lleva en la conexión), un
+    `request_id` opcional que se repite en los eventos de respuesta y un `timeout` opcional en
+    segundos. Si el cliente se desconecta o vence el plazo, se corta la llamada al modelo.
     """
-    print("received message: " + str(data))
-    # Aquí se procesaría el mensaje y se enviaría a Gemini
-    emit("response", {"data": "This is a response from the server."})
+    connection = _connections.get(request.sid)
+    data = data if isinstance(data, dict) else {"message": data}
+    request_id = data.get("request_id")
+    if connection is None:
+        emit("response_error", {"request_id": request_id, "message": "Conexión no inicializada."})
+        return
+
+    try:
+        params = parse_chat_request(data)
+    except ChatRequestError as e:
+        emit("response_error", {"request_id": request_id, "message": e.message})
+        return
+    gemini_service = current_app.config.get("GEMINI_SERVICE")
+    if not gemini_service:
+        emit("response_error", {"request_id": request_id, "message": "El servicio de IA no está disponible."})
+        return
+    if not connection.generating.acquire(blocking=False):
+        emit("response_error", {"request_id": request_id, "message": "Ya hay una respuesta en curso."})
+        return
+
+    metrics_manager.increment_counter("socketio_messages")
+    try:
+        _generate(connection, gemini_service, params, data)
+    except SlowClientError:
+        metrics_manager.increment_counter("socketio_slow_clients")
+        logger.warning("🐢 Generación cancelada: el cliente %s no consume la respuesta", connection.owner)
+        emit("response_error", {"request_id": request_id, "message": "Cliente demasiado lento."})
+    except SchedulerTimeoutError:
+        emit("response_error", {"request_id": request_id, "message": "El servicio está saturado."})
+    except TimeoutError:
+        emit("response_error", {"request_id": request_id, "message": "Se agotó el tiempo de la petición."})
+    except Exception as e:
+        metrics_manager.increment_counter("socketio_errors")
+        logger.exception("Error durante el chat por Socket.IO: %s", str(e))
+        emit("response_error", {"request_id": request_id, "message": f"Error: {str(e)}"})
+    finally:
+        connection.generating.release()
@@ -168,6 +168,9 @@ class ChatSession(db.Model):
     )
     status: str = db.Column(db.String(20), default="active", nullable=False)
     model: str = db.Column(db.String(50), default="gemini-flash-latest", nullable=False)
+    # Resumen incremental de los mensajes antiguos (hasta summary_message_id, incluido).
+    summary: Optional[str] = db.Column(db.Text)
+    summary_message_id: Optional[int] = db.Column(db.Integer)
 
     messages: Mapped[list["ChatMessage"]] = db.relationship(
         "ChatMessage", backref="session", lazy="select", cascade="all, delete-orphan"
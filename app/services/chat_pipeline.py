@@ -0,0 +1,376 @@
+"""
+Preparación común de las peticiones de chat para las rutas HTTP y el chat por Socket.IO.
+
+Valida el cuerpo de la petición, construye el prompt y los argumentos de GeminiService (imagen,
+PDF, historial ajustado al presupuesto de contexto, nivel de modelo) y calcula los plazos. No lee
+la petición HTTP en curso: el endpoint y las cabeceras se reciben como argumentos, porque en un
+evento de Socket.IO `request` es el handshake de la conexión y no el mensaje.
+"""
+
+import base64
+import io
+import logging
+import time
+from typing import Any, Mapping, Optional, Tuple
+
+import bleach
+import PyPDF2
+from flask import current_app
+
+from app.config.extensions import db
+from app.core.fair_scheduler import fair_scheduler
+from app.core.metrics import metrics_manager
+from app.core.permissions import has_permission
+from app.services.context_assembler import context_assembler
+from app.services.conversation_memory import ConversationMemory
+from app.services.gemini_service import ERROR_RESPONSE_PREFIX
+from app.services.image_captions import asks_visual_detail, caption_turns, image_captions
+from app.services.image_pipeline import ImageDecodeError
+from app.services.image_store import ImageNotFoundError, StoredImage, image_store
+from app.services.model_router import RoutingDecision, model_router
+from app.services.tokenizer import token_counter
+
+logger = logging.getLogger(__name__)
+
+# Tipo de modelo (ver VertexAIConfig.models) cuyo presupuesto de contexto se aplica al chat cuando
+# el enrutador de modelos no está activo.
+CHAT_MODEL_TYPE = "fast"
+
+# Longitud máxima del texto extraído de un PDF que se envía al modelo.
+PDF_MAX_CHARS = 30000
+
+
+class ChatRequestError(ValueError):
+    """Petición de chat no válida; `status` y `error` indican cómo responder al cliente."""
+
+    def __init__(self, message: str, status: int = 400, error: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.error = error
+
+    def to_dict(self) -> dict[str, Any]:
+        """Cuerpo de la respuesta de error."""
+        body: dict[str, Any] = {"message": self.message}
+        if self.error:
+            body["error"] = self.error
+        return body
+
+
+def extract_text_from_pdf(pdf_base64: str) -> str:
+    """Extract text from a base64 encoded PDF."""
+    try:
+        # Decodificar base64 a bytes
+        # Manejar posibles prefijos como "data:application/pdf;base64,"
+        if "," in pdf_base64:
+            pdf_base64 = pdf_base64.split(",")[1]
+
+        pdf_bytes = base64.b64decode(pdf_base64)
+        pdf_file = io.BytesIO(pdf_bytes)
+
+        # Leer PDF
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        text = []
+
+        # Extraer texto de todas las páginas
+        for page in pdf_reader.pages:
+            text.append(page.extract_text())
+
+        return "\n".join(text)
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {str(e)}")
+        raise Exception(f"No se pudo leer el PDF: {str(e)}") from e
+
+
+def parse_chat_request(data: Optional[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Valida y normaliza el cuerpo de una petición de chat.
+
+    La imagen de `image_context` se resuelve aquí una sola vez: un `image_data` nuevo se decodifica
+    y normaliza en el almacén de imágenes, y un `image_hash` de un turno anterior se busca en él
+    (si ya no está, se responde 404 con `error: image_not_found` para que el cliente la reenvíe).
+
+    Raises:
+        ChatRequestError: Si el cuerpo no es válido.
+    """
+    if not data or not data.get("message"):
+        raise ChatRequestError("El campo 'message' es requerido.")
+
+    # 🔒 SECURITY: Sanitizar entrada del usuario para prevenir XSS/Injection
+    user_message = bleach.clean(data["message"].strip())
+
+    if not user_message:
+        raise ChatRequestError("El mensaje no puede estar vacío.")
+    if len(user_message) > 4000:
+        raise ChatRequestError("El mensaje excede el límite de 4000 caracteres.")
+
+    image_context = data.get("image_context", None)
+    try:
+        image = image_store.resolve(image_context if isinstance(image_context, dict) else None)
+    except ImageNotFoundError as e:
+        raise ChatRequestError("La imagen ya no está disponible; vuelve a enviarla.", status=404, error="image_not_found") from e
+    except ImageDecodeError as e:
+        raise ChatRequestError("La imagen no es válida.") from e
+
+    return {
+        "user_message": user_message,
+        "session_id": data.get("session_id", "anonymous"),
+        "image_context": image_context,
+        "image": image,
+        "pdf_context": data.get("pdf_context", None),
+        "history": data.get("history", []),  # Recibir historial
+        "language": data.get("language", "es"),
+        "model_type": data.get("model_type"),  # Sólo se respeta con el permiso premium.models.access
+    }
+
+
+def request_deadline(timeout: Optional[Any] = None, headers: Optional[Mapping[str, str]] = None) -> float:
+    """
+    Instante (`time.monotonic()`) en que vence la petición.
+
+    El cliente puede acortarlo con las cabeceras HTTP `X-Request-Deadline` (instante Unix absoluto)
+    o `X-Request-Timeout`, o con `timeout` (segundos). Nunca supera REQUEST_DEADLINE_SECONDS, que
+    queda por debajo del timeout de gunicorn/nginx para cortar la llamada al modelo antes de que el
+    proxy abandone la petición.
+    """
+    headers = headers or {}
+    limits = [float(current_app.config.get("REQUEST_DEADLINE_SECONDS", 110))]
+    for value, absolute in (
+        (headers.get("X-Request-Deadline"), True),
+        (headers.get("X-Request-Timeout"), False),
+        (timeout, False),
+    ):
+        try:
+            if value is not None:
+                limits.append(float(value) - time.time() if absolute else float(value))
+        except (TypeError, ValueError):
+            continue
+    return time.monotonic() + max(0.0, min(limits))
+
+
+def queue_timeout(deadline: float) -> float:
+    """Espera máxima en la cola del planificador sin pasarse del plazo de la petición."""
+    return max(0.0, min(fair_scheduler.queue_timeout, deadline - time.monotonic()))
+
+
+def model_override(params: dict[str, Any], role: str, endpoint: Optional[str] = None) -> Optional[str]:
+    """
+    Nivel de modelo impuesto para la petición, o None para que decida el enrutador.
+
+    El usuario puede pedir un nivel con `model_type` si su rol tiene `premium.models.access`; si no,
+    se aplica el nivel fijado para el endpoint en MODEL_ROUTER_OVERRIDES, si lo hay.
+    """
+    requested = params.get("model_type")
+    if requested and has_permission(role, "premium.models.access"):
+        return requested
+    return current_app.config.get("MODEL_ROUTER_OVERRIDES", {}).get(endpoint)
+
+
+def response_cache_ttl(params: dict[str, Any], endpoint: Optional[str]) -> Optional[int]:
+    """TTL de la caché de respuestas para el endpoint; las peticiones con imagen o PDF nunca se cachean."""
+    image_context, pdf_context = params["image_context"], params["pdf_context"]
+    has_attachment = bool(image_context and image_context.get("has_image")) or bool(pdf_context and pdf_context.get("has_pdf"))
+    if has_attachment:
+        return None
+    return current_app.config.get("RESPONSE_CACHE_TTLS", {}).get(endpoint)
+
+
+def image_caption(image: Optional[StoredImage], image_context: Optional[dict[str, Any]], user_message: str) -> Optional[str]:
+    """
+    Descripción ya generada de la imagen de la petición si el turno puede ir sin la imagen.
+
+    Sólo con IMAGE_CAPTIONS_ENABLED, y nunca cuando el usuario pide un detalle visual o el cliente
+    envía `image_context.force_image`: entonces se vuelve a enviar la imagen al modelo.
+    """
+    if image is None or not current_app.config.get("IMAGE_CAPTIONS_ENABLED"):
+        return None
+    if (image_context or {}).get("force_image") or asks_visual_detail(user_message):
+        metrics_manager.increment_counter("image_caption_bypassed")
+        return None
+    return image_captions.get(image.digest)
+
+
+def build_generation_kwargs(
+    params: dict[str, Any],
+    user_id: Optional[int],
+    model_override: Optional[str] = None,
+    memory: Optional[ConversationMemory] = None,
+) -> Tuple[dict[str, Any], RoutingDecision]:
+    """
+    Construye los argumentos para GeminiService a partir de una petición de chat validada.
+
+    Inyecta el contexto de imagen o PDF en el prompt cuando corresponde (o, si la imagen ya tiene
+    descripción, la sustituye por ésta en el historial) y elige el nivel de modelo
+    con el enrutador (con MODEL_ROUTER_ENABLED desactivado la decisión sólo se registra). Puede
+    lanzar una excepción si el PDF no se puede leer.
+
+    Con `memory` (ver `conversation_memory`) el historial sale de la sesión guardada en la base de
+    datos, con el resumen de los turnos antiguos, en lugar del que envía el cliente.
+
+    Returns:
+        Una tupla (argumentos, decisión_de_enrutado).
+    """
+    user_message = params["user_message"]
+    image_context = params["image_context"]
+    pdf_context = params["pdf_context"]
+    history = params["history"]
+    language = params["language"]
+
+    final_prompt = user_message
+    # Contexto documental que precede al prompt; va aparte para poder cachearlo en el proveedor.
+    document = None
+    image = params.get("image")
+    caption = image_caption(image, image_context, user_message)
+
+    # 1. Imagen ya descrita: el turno va sólo con texto y conserva el historial
+    if caption is not None:
+        image_name = image_context.get("image_name", "imagen")
+        history = [*(history if isinstance(history, list) else []), *caption_turns(caption, image_name, language)]
+        image = None
+        logger.info(f"Processing message with image caption instead of image: {image_name}")
+
+    # 1b. Manejo de IMÁGENES (Multimodal - Sin historial complejo por ahora)
+    elif image_context and image_context.get("has_image"):
+        final_prompt = _image_prompt(image_context, user_message, language)
+        # Reset history for image requests to avoid multimodal conflicts
+        history = []
+
+    # 2. Manejo de PDFs (Contexto del documento antes del prompt - Sin historial complejo)
+    elif pdf_context and pdf_context.get("has_pdf"):
+        document, final_prompt = _pdf_prompt(pdf_context, user_message, language)
+        # Reset history for PDF requests
+        history = []
+
+    # 3. Elegir el nivel de modelo con rasgos baratos de la petición
+    routing = model_router.route(
+        user_message,
+        history if isinstance(history, list) else None,
+        has_image=caption is None and bool(image_context and image_context.get("has_image")),
+        has_document=document is not None,
+        language=language,
+        override=model_override,
+        context_tokens=token_counter.count(document),
+    )
+    routing_enabled = bool(current_app.config.get("MODEL_ROUTER_ENABLED"))
+    routing.applied = routing_enabled
+    model_type = routing.model_type if routing_enabled else CHAT_MODEL_TYPE
+
+    # 4. Ajustar el historial al presupuesto de contexto del modelo (los más recientes primero)
+    if memory is not None:
+        history = memory.get_context(model_type, reserved_tokens=token_counter.count(final_prompt))
+    elif history and isinstance(history, list):
+        history = context_assembler.assemble(history, model_type, reserved_tokens=token_counter.count(final_prompt))
+
+    generation_kwargs = {
+        "session_id": params["session_id"],
+        "user_id": user_id,
+        "prompt": final_prompt,
+        "image_data": image,
+        "history": history,  # Pasar historial
+        "language": language,
+        "document": document,
+    }
+    if routing_enabled:
+        generation_kwargs["model_type"] = routing.model_type
+    return generation_kwargs, routing
+
+
+def _image_prompt(image_context: dict[str, Any], user_message: str, language: str) -> str:
+    """Prompt para una pregunta sobre la imagen adjunta."""
+    image_name = image_context.get("image_name", "imagen")
+    context_message = image_context.get("context_message", "")
+    logger.info(f"Processing message with image context: {image_name}")
+
+    if language == "en":
+        return f"""
+{context_message}
+
+Image context:
+- File name: {image_name}
+- User asks: {user_message}
+
+Please analyze the provided image and respond to the user's question in detail and helpfully.
+"""
+    return f"""
+{context_message}
+
+Contexto de imagen:
+- Nombre del archivo: {image_name}
+- El usuario pregunta: {user_message}
+
+Por favor, analiza la imagen proporcionada y responde a la pregunta del usuario de manera detallada y útil.
+"""
+
+
+def _pdf_prompt(pdf_context: dict[str, Any], user_message: str, language: str) -> Tuple[str, str]:
+    """(documento, prompt) para una pregunta sobre el PDF adjunto; el documento va aparte del prompt."""
+    pdf_name = pdf_context.get("pdf_name", "documento.pdf")
+    pdf_text = extract_text_from_pdf(pdf_context.get("pdf_data"))
+    if len(pdf_text) > PDF_MAX_CHARS:
+        pdf_text = pdf_text[:PDF_MAX_CHARS] + "\n...[Texto truncado]..."
+    logger.info(f"Processing message with PDF context: {pdf_name}")
+
+    if language == "en":
+        document = f"""
+Document Context (Extracted from PDF '{pdf_name}'):
+---
+{pdf_text}
+---"""
+        prompt = f"""
+User Question: {user_message}
+
+Instructions: Answer the question based strictly on the provided document context.
+"""
+    else:
+        document = f"""
+Contexto del Documento (Extraído del PDF '{pdf_name}'):
+---
+{pdf_text}
+---"""
+        prompt = f"""
+Pregunta del Usuario: {user_message}
+
+Instrucciones: Responde a la pregunta basándote estrictamente en el contexto del documento.
+"""
+    return document, prompt
+
+
+def conversation_memory(params: dict[str, Any], user_id: Optional[int]) -> Optional[ConversationMemory]:
+    """
+    Memoria persistente de la sesión (historial y resumen incremental) para /chat/send y /chat/stream.
+
+    Sólo con CHAT_SERVER_HISTORY_ENABLED, para usuarios autenticados con un `session_id` propio y en
+    peticiones sin imagen ni PDF (que no usan historial). Si la sesión no se puede cargar (p. ej. el
+    `session_id` pertenece a otro usuario) se usa el historial que envía el cliente.
+    """
+    if not current_app.config.get("CHAT_SERVER_HISTORY_ENABLED") or user_id is None:
+        return None
+    session_id = params["session_id"]
+    image_context, pdf_context = params["image_context"], params["pdf_context"]
+    if not session_id or session_id == "anonymous":
+        return None
+    if (image_context and image_context.get("has_image")) or (pdf_context and pdf_context.get("has_pdf")):
+        return None
+    try:
+        return ConversationMemory(str(session_id), user_id)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"No se pudo cargar la sesión {session_id}; se usa el historial del cliente: {e}")
+        return None
+
+
+def is_error_response(response_text: str) -> bool:
+    """True si GeminiService devolvió su mensaje de error en lugar de una respuesta del modelo."""
+    return response_text.startswith(ERROR_RESPONSE_PREFIX)
+
+
+def remember_turn(memory: Optional[ConversationMemory], user_message: str, response_text: str) -> None:
+    """Guarda el turno en la sesión; al cerrar el turno se compacta en segundo plano si ha crecido."""
+    if memory is None or not response_text or is_error_response(response_text):
+        return
+    try:
+        memory.add_message("user", user_message)
+        memory.add_message("model", response_text)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"No se pudo guardar el turno en la sesión {memory.session_id}: {e}")
@@ -0,0 +1,369 @@
+"""
+Pool de credenciales de Gemini (API keys y proyectos de Vertex AI) con balanceo de carga.
+
+Cada credencial tiene su propia cuota (RPM), así que repartir las peticiones entre varias
+multiplica el throughput disponible. El pool elige en cada petición la credencial con más cuota
+restante y menor latencia reciente, y retira temporalmente las que reciben un 429.
+"""
+
+import contextlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API = "gemini_api"
+VERTEX_AI = "vertex_ai"
+
+
+class PoolExhaustedError(RuntimeError):
+    """No hay ninguna credencial disponible (todas en enfriamiento o sin configurar)."""
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Indica si una excepción del SDK corresponde a un 429 / cuota agotada."""
+    try:
+        from google.api_core import exceptions as api_exceptions
+
+        if isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)):
+            return True
+    except ImportError:
+        pass
+    text = str(error).lower()
+    return "429" in text or "resource exhausted" in text or "quota" in text
+
+
+@dataclass
+class PoolCredential:
+    """Una credencial del pool y su estado de uso."""
+
+    name: str
+    kind: str
+    api_key: Optional[str] = None
+    project: Optional[str] = None
+    location: Optional[str] = None
+    rpm_limit: int = 60
+
+    requests_total: int = 0
+    errors_total: int = 0
+    rate_limited_total: int = 0
+    in_flight: int = 0
+    latency_ewma: Optional[float] = None
+    cooldown_until: float = 0.0
+    recent_requests: Deque[float] = field(default_factory=deque)
+    models: Dict[Any, Any] = field(default_factory=dict)
+
+    def __repr__(self) -> str:
+        # Nunca mostrar la API key en logs.
+        return f"PoolCredential(name={self.name!r}, kind={self.kind!r})"
+
+
+class ClientPool:
+    """
+    Reparte las peticiones entre varias credenciales de Gemini.
+
+    Uso típico:
+
+        with pool.lease(GEMINI_API) as credential:
+            model = pool.gemini_model(credential, "gemini-2.0-flash-001")
+            model.generate_content(...)
+
+    Al salir del bloque se registra la latencia; si la llamada falla con un 429, la credencial
+    queda fuera de rotación durante `cooldown_seconds`.
+    """
+
+    def __init__(
+        self,
+        rpm_limit: int = 60,
+        cooldown_seconds: float = 60.0,
+        latency_alpha: float = 0.2,
+        window_seconds: float = 60.0,
+    ) -> None:
+        """
+        Args:
+            rpm_limit: Peticiones por minuto asumidas por credencial si no se indica otra cosa.
+            cooldown_seconds: Tiempo fuera de rotación tras un 429.
+            latency_alpha: Peso de la última muestra en la media móvil exponencial de latencia.
+            window_seconds: Ventana en la que se cuenta la cuota consumida.
+        """
+        self.rpm_limit = rpm_limit
+        self.cooldown_seconds = cooldown_seconds
+        self.latency_alpha = latency_alpha
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._credentials: list[PoolCredential] = []
+
+    # ------------------------------------------------------------------
+    # Configuración
+    # ------------------------------------------------------------------
+
+    def configure(
+        self,
+        api_keys: Optional[list[str]] = None,
+        vertex_projects: Optional[list[tuple[str, str]]] = None,
+        rpm_limit: Optional[int] = None,
+        cooldown_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        Sustituye las credenciales del pool.
+
+        Args:
+            api_keys: API keys de Gemini.
+            vertex_projects: Pares (proyecto, región) de Vertex AI.
+            rpm_limit: Cuota RPM por credencial.
+            cooldown_seconds: Tiempo fuera de rotación tras un 429.
+        """
+        if rpm_limit is not None:
+            self.rpm_limit = rpm_limit
+        if cooldown_seconds is not None:
+            self.cooldown_seconds = cooldown_seconds
+
+        credentials = [
+            PoolCredential(name=f"{GEMINI_API}_{index}", kind=GEMINI_API, api_key=key, rpm_limit=self.rpm_limit)
+            for index, key in enumerate(dict.fromkeys(k for k in (api_keys or []) if k))
+        ]
+        for project, location in dict.fromkeys(vertex_projects or []):
+            name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{VERTEX_AI}_{project}_{location}")
+            credentials.append(
+                PoolCredential(name=name, kind=VERTEX_AI, project=project, location=location, rpm_limit=self.rpm_limit)
+            )
+
+        with self._lock:
+            self._credentials = credentials
+        logger.info(
+            "🔑 Pool de credenciales configurado: %d API keys, %d proyectos Vertex AI.",
+            self.size(GEMINI_API),
+            self.size(VERTEX_AI),
+        )
+
+    def configure_from_env(self) -> None:
+        """
+        Carga las credenciales de las variables de entorno.
+
+        - `GEMINI_API_KEYS`: API keys separadas por comas.
+        - `VERTEX_AI_PROJECTS`: pares `proyecto:región` separados por comas.
+        - `CLIENT_POOL_RPM_PER_KEY` y `CLIENT_POOL_COOLDOWN_SECONDS`.
+
+        Si no hay ni `GEMINI_API_KEYS` ni `VERTEX_AI_PROJECTS`, el pool no se modifica.
+        """
+        api_keys = parse_api_keys(os.getenv("GEMINI_API_KEYS", ""))
+        vertex_projects = parse_vertex_projects(os.getenv("VERTEX_AI_PROJECTS", ""))
+        if not api_keys and not vertex_projects:
+            return
+        self.configure(
+            api_keys=api_keys,
+            vertex_projects=vertex_projects,
+            rpm_limit=int(os.getenv("CLIENT_POOL_RPM_PER_KEY", str(self.rpm_limit))),
+            cooldown_seconds=float(os.getenv("CLIENT_POOL_COOLDOWN_SECONDS", str(self.cooldown_seconds))),
+        )
+
+    def size(self, kind: Optional[str] = None) -> int:
+        """Número de credenciales configuradas (de un tipo, si se indica)."""
+        return sum(1 for c in self._credentials if kind is None or c.kind == kind)
+
+    # ------------------------------------------------------------------
+    # Selección
+    # ------------------------------------------------------------------
+
+    def _prune_window(self, credential: PoolCredential, now: float) -> None:
+        while credential.recent_requests and now - credential.recent_requests[0] > self.window_seconds:
+            credential.recent_requests.popleft()
+
+    def _score(self, credential: PoolCredential) -> float:
+        """Puntuación de una credencial: más cuota restante y menos latencia reciente es mejor."""
+        used = len(credential.recent_requests) + credential.in_flight
+        remaining = max(credential.rpm_limit - used, 0) / max(credential.rpm_limit, 1)
+        # Las credenciales sin muestras se tratan como rápidas para que reciban tráfico pronto.
+        latency = credential.latency_ewma if credential.latency_ewma is not None else 0.0
+        return remaining / (1.0 + latency)
+
+    def acquire(self, kind: str = GEMINI_API) -> PoolCredential:
+        """
+        Elige la mejor credencial disponible del tipo indicado y la marca como en uso.
+
+        Raises:
+            PoolExhaustedError: Si no hay credenciales de ese tipo fuera de enfriamiento.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for credential in self._credentials:
+                if credential.kind != kind or credential.cooldown_until > now:
+                    continue
+                self._prune_window(credential, now)
+                candidates.append(credential)
+
+            if not candidates:
+                metrics_manager.increment_counter("client_pool_exhausted")
+                raise PoolExhaustedError(f"No hay credenciales disponibles para {kind}")
+
+            credential = max(candidates, key=self._score)
+            credential.in_flight += 1
+            credential.requests_total += 1
+            credential.recent_requests.append(now)
+
+        metrics_manager.increment_counter(f"client_pool_{credential.name}_requests")
+        self._publish_gauges(credential)
+        return credential
+
+    def release(
+        self,
+        credential: PoolCredential,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """
+        Devuelve una credencial al pool registrando el resultado de la llamada.
+
+        Args:
+            credential: La credencial obtenida con `acquire`.
+            latency: Duración de la llamada en segundos (sólo se usa si tuvo éxito).
+            error: Excepción de la llamada, si falló. Un 429 la pone en enfriamiento.
+        """
+        with self._lock:
+            credential.in_flight = max(credential.in_flight - 1, 0)
+            if error is None:
+                if latency is not None:
+                    if credential.latency_ewma is None:
+                        credential.latency_ewma = latency
+                    else:
+                        credential.latency_ewma += self.latency_alpha * (latency - credential.latency_ewma)
+            else:
+                credential.errors_total += 1
+                if is_rate_limit_error(error):
+                    credential.rate_limited_total += 1
+                    credential.cooldown_until = time.monotonic() + self.cooldown_seconds
+
+        if error is not None:
+            metrics_manager.increment_counter(f"client_pool_{credential.name}_errors")
+            if credential.cooldown_until > time.monotonic():
+                metrics_manager.increment_counter(f"client_pool_{credential.name}_rate_limited")
+                logger.warning("⏸️ Credencial %s fuera de rotación %.0fs tras un 429.", credential.name, self.cooldown_seconds)
+        self._publish_gauges(credential)
+
+    @contextlib.contextmanager
+    def lease(self, kind: str = GEMINI_API) -> Iterator[PoolCredential]:
+        """Context manager que combina `acquire` y `release` midiendo la latencia del bloque."""
+        credential = self.acquire(kind)
+        start = time.monotonic()
+        try:
+            yield credential
+        except GeneratorExit:
+            # El consumidor de un stream lo abandonó: no es un error de la credencial.
+            self.release(credential)
+            raise
+        except BaseException as e:
+            self.release(credential, error=e)
+            raise
+        else:
+            self.release(credential, latency=time.monotonic() - start)
+
+    # ------------------------------------------------------------------
+    # Clientes por credencial
+    # ------------------------------------------------------------------
+
+    def gemini_model(self, credential: PoolCredential, model_name: str, **model_kwargs: Any) -> Any:
+        """
+        Devuelve (cacheado) un `genai.GenerativeModel` que usa la API key de la credencial.
+
+        No se llama a `genai.configure`, que es global al proceso: el cliente de transporte se crea
+        con la key de la credencial y se asigna al modelo. Sólo se crea el cliente síncrono; para
+        las llamadas `*_async` se usa `gemini_model_async`.
+        """
+        cache_key = (model_name, repr(sorted(model_kwargs.items())))
+        model = credential.models.get(cache_key)
+        if model is None:
+            import google.ai.generativelanguage as glm
+            import google.generativeai as genai
+
+            model = genai.GenerativeModel(model_name, **model_kwargs)
+            model._client = glm.GenerativeServiceClient(client_options={"api_key": credential.api_key})
+            credential.models[cache_key] = model
+        return model
+
+    async def gemini_model_async(self, credential: PoolCredential, model_name: str, **model_kwargs: Any) -> Any:
+        """
+        Como `gemini_model`, con el cliente asíncrono de la credencial para `generate_content_async`.
+
+        El cliente asíncrono de gRPC necesita un bucle de eventos: se crea aquí, dentro del bucle del
+        runner asíncrono, y no en los hilos de petición, que no tienen bucle.
+        """
+        model = self.gemini_model(credential, model_name, **model_kwargs)
+        if model._async_client is None:
+            import google.ai.generativelanguage as glm
+
+            model._async_client = glm.GenerativeServiceAsyncClient(client_options={"api_key": credential.api_key})
+        return model
+
+    def vertex_model(self, credential: PoolCredential, model_name: str) -> Any:
+        """Devuelve (cacheado) un modelo de Vertex AI ligado al proyecto y región de la credencial."""
+        model = credential.models.get(model_name)
+        if model is None:
+            from vertexai.generative_models import GenerativeModel
+
+            resource = f"projects/{credential.project}/locations/{credential.location}/publishers/google/models/{model_name}"
+            model = GenerativeModel(resource)
+            credential.models[model_name] = model
+        return model
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def _utilization(self, credential: PoolCredential) -> float:
+        return len(credential.recent_requests) / max(credential.rpm_limit, 1)
+
+    def _publish_gauges(self, credential: PoolCredential) -> None:
+        metrics_manager.set_gauge(f"client_pool_{credential.name}_utilization", self._utilization(credential))
+        metrics_manager.set_gauge(f"client_pool_{credential.name}_in_flight", credential.in_flight)
+
+    def get_stats(self) -> dict[str, Any]:
+        """Estado de cada credencial: uso en la ventana, latencia, errores y enfriamiento."""
+        now = time.monotonic()
+        stats = {}
+        with self._lock:
+            for credential in self._credentials:
+                self._prune_window(credential, now)
+                stats[credential.name] = {
+                    "kind": credential.kind,
+                    "requests_total": credential.requests_total,
+                    "errors_total": credential.errors_total,
+                    "rate_limited_total": credential.rate_limited_total,
+                    "in_flight": credential.in_flight,
+                    "requests_in_window": len(credential.recent_requests),
+                    "rpm_limit": credential.rpm_limit,
+                    "utilization": self._utilization(credential),
+                    "latency_ewma_seconds": credential.latency_ewma,
+                    "cooldown_remaining_seconds": max(credential.cooldown_until - now, 0.0),
+                }
+        return stats
+
+
+def parse_api_keys(value: str) -> list[str]:
+    """Convierte 'key1,key2' en una lista de API keys."""
+    return [key.strip() for key in value.split(",") if key.strip()]
+
+
+def parse_vertex_projects(value: str) -> list[tuple[str, str]]:
+    """Convierte 'proyecto:región,...' en pares; la región por defecto es us-central1."""
+    projects = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        project, _, location = item.partition(":")
+        projects.append((project.strip(), location.strip() or "us-central1"))
+    return projects
+
+
+# Instancia global compartida por GeminiService y VertexAIClient (la cuota es por credencial,
+# así que ambos deben ver el mismo estado). Vacía hasta que se configura en create_app.
+client_pool = ClientPool()
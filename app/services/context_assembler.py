@@ -0,0 +1,105 @@
+"""Ensamblado del historial de conversación dentro de un presupuesto de tokens."""
+
+import logging
+from typing import Any, Iterable, Optional, Union
+
+from app.config.vertex_ai import VertexAIConfig, vertex_config
+from app.models import ChatMessage
+from app.services.tokenizer import TokenCounter, token_counter
+
+logger = logging.getLogger(__name__)
+
+HistoryMessage = Union[ChatMessage, dict[str, Any]]
+
+
+class ContextAssembler:
+    """
+    Selecciona los turnos más recientes del historial que caben en el presupuesto de contexto
+    del modelo, en lugar de recortar por número de mensajes.
+    """
+
+    def __init__(self, config: Optional[VertexAIConfig] = None, counter: Optional[TokenCounter] = None) -> None:
+        """
+        Args:
+            config: Configuración de la que se leen los presupuestos por tipo de modelo.
+            counter: Tokenizador con el que se cuentan los mensajes que no traen recuento.
+        """
+        self.config = config or vertex_config
+        self.counter = counter or token_counter
+
+    def message_tokens(self, message: HistoryMessage) -> int:
+        """
+        Tokens de un mensaje del historial.
+
+        Los `ChatMessage` guardan su recuento en la columna `tokens`; si falta se calcula una vez y
+        se deja en el objeto. Para los mensajes en formato Gemini se usa la caché por segmento del
+        tokenizador, así un mismo texto no se vuelve a tokenizar entre peticiones.
+        """
+        if isinstance(message, ChatMessage):
+            if message.tokens is None:
+                message.tokens = self.counter.count(message.content)
+            return message.tokens
+        parts = message.get("parts")
+        if not isinstance(parts, list):
+            return 0
+        return self.counter.count_segments(
+            part["text"] for part in parts if isinstance(part, dict) and isinstance(part.get("text"), str)
+        )
+
+    @staticmethod
+    def _to_gemini(message: HistoryMessage) -> dict[str, Any]:
+        if isinstance(message, ChatMessage):
+            return {"role": message.role, "parts": [{"text": message.content}]}
+        return message
+
+    def assemble(
+        self,
+        history: Iterable[HistoryMessage],
+        model_type: str = "fast",
+        reserved_tokens: int = 0,
+        newest_first: bool = False,
+    ) -> list[dict[str, Any]]:
+        """
+        Construye el historial en formato Gemini que cabe en el presupuesto del modelo.
+
+        Se recorren los turnos del más reciente al más antiguo y se para en el primero que no cabe,
+        de modo que el contexto nunca tiene huecos. El resultado empieza siempre por un turno del
+        usuario, como espera la API de chat.
+
+        Args:
+            history: Mensajes (ChatMessage o dicts {'role', 'parts'}).
+            model_type: Tipo de modelo del que se toma `context_budget_tokens`.
+            reserved_tokens: Tokens ya comprometidos (p. ej. el mensaje actual), que se descuentan.
+            newest_first: True si `history` ya viene ordenado del más reciente al más antiguo
+                (permite pasar una consulta que se consume de forma perezosa).
+
+        Returns:
+            Los mensajes seleccionados en orden cronológico.
+        """
+        remaining = self.config.get_context_budget(model_type) - reserved_tokens
+        messages = history if newest_first else reversed(list(history))
+
+        selected: list[HistoryMessage] = []
+        for message in messages:
+            if not isinstance(message, ChatMessage) and not (
+                isinstance(message, dict) and isinstance(message.get("parts"), list)
+            ):
+                continue  # entradas mal formadas enviadas por el cliente
+            tokens = self.message_tokens(message)
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            selected.append(message)
+
+        selected.reverse()
+        while selected and self._role(selected[0]) != "user":
+            selected.pop(0)
+        return [self._to_gemini(message) for message in selected]
+
+    @staticmethod
+    def _role(message: HistoryMessage) -> Optional[str]:
+        return message.role if isinstance(message, ChatMessage) else message.get("role")
+
+
+# Instancia global usada por las rutas de chat y la memoria de conversación.
+context_assembler = ContextAssembler()
@@ -0,0 +1,272 @@
+"""
+Caché de contexto del proveedor (Gemini context caching) para prefijos grandes y repetidos.
+
+La instrucción de sistema y el texto de los PDF se reenvían en cada llamada. Con context caching
+el prefijo se sube una vez, se referencia por nombre en las llamadas siguientes y Google factura
+los tokens cacheados a precio reducido. Si el prefijo es demasiado pequeño para el proveedor o la
+creación falla, `get_model` devuelve None y el llamador envía el contenido en línea, como antes.
+
+Cada entrada devuelta por `get_model` queda prestada hasta que el llamador llama a `release`: una
+entrada expulsada (LRU o duplicada) sólo se borra del proveedor cuando termina su último préstamo,
+para no invalidar el prefijo a una petición que aún lo está usando.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+from app.core.metrics import metrics_manager
+from app.services.tokenizer import token_counter, usage_from_response
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiCachingBackend:
+    """Adaptador sobre `genai.caching.CachedContent`."""
+
+    def create(self, model_name: str, system_instruction: str, documents: Sequence[str], ttl: float) -> Any:
+        import google.generativeai as genai
+
+        contents = [{"role": "user", "parts": [{"text": document}]} for document in documents]
+        return genai.caching.CachedContent.create(
+            model=model_name,
+            system_instruction=system_instruction,
+            contents=contents or None,
+            ttl=ttl,
+        )
+
+    def model_for(self, handle: Any, generation_config: Optional[dict[str, Any]] = None) -> Any:
+        import google.generativeai as genai
+
+        return genai.GenerativeModel.from_cached_content(handle, generation_config=generation_config)
+
+    def refresh(self, handle: Any, ttl: float) -> None:
+        handle.update(ttl=ttl)
+
+    def delete(self, handle: Any) -> None:
+        handle.delete()
+
+
+@dataclass
+class ContextCacheEntry:
+    """Un prefijo cacheado en el proveedor y su contabilidad."""
+
+    key: str
+    handle: Any
+    model: Any
+    tokens: int
+    expires_at: float
+    hits: int = 0
+    tokens_saved: int = 0
+    leases: int = 0
+    retired: bool = False
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class ContextCache:
+    """
+    Gestiona los prefijos cacheados: creación única por hash de contenido, renovación antes de
+    que caduquen y expulsión LRU cuando se supera `max_entries`.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[GeminiCachingBackend] = None,
+        max_entries: int = 32,
+        ttl_seconds: float = 3600,
+        refresh_margin_seconds: float = 300,
+        min_tokens: int = 4096,
+        failure_backoff_seconds: float = 600,
+    ) -> None:
+        """
+        Args:
+            backend: Adaptador del proveedor; por defecto, el de la API de Gemini.
+            max_entries: Número máximo de prefijos cacheados a la vez.
+            ttl_seconds: TTL con el que se crean (y renuevan) los prefijos.
+            refresh_margin_seconds: Se renueva el TTL si quedan menos segundos que éstos.
+            min_tokens: Tamaño mínimo que acepta el proveedor; por debajo se envía en línea.
+            failure_backoff_seconds: Tiempo sin reintentar un prefijo cuya creación falló.
+        """
+        self.backend = backend or GeminiCachingBackend()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.min_tokens = min_tokens
+        self.failure_backoff_seconds = failure_backoff_seconds
+        self._entries: "OrderedDict[str, ContextCacheEntry]" = OrderedDict()
+        self._failed: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_key(model_name: str, system_instruction: str, documents: Sequence[str]) -> str:
+        """Hash del contenido del prefijo: mismo modelo, instrucción y documentos, misma entrada."""
+        digest = hashlib.sha256()
+        for part in (model_name, system_instruction, *documents):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return "gemini:context:" + digest.hexdigest()
+
+    def get_model(
+        self,
+        model_name: str,
+        system_instruction: str,
+        documents: Sequence[str] = (),
+        generation_config: Optional[dict[str, Any]] = None,
+    ) -> Optional[tuple[Any, ContextCacheEntry]]:
+        """
+        Devuelve un modelo que referencia el prefijo cacheado, creándolo si hace falta.
+
+        La entrada devuelta queda prestada: el llamador debe devolverla con `release` al terminar
+        la llamada al modelo.
+
+        Returns:
+            (modelo, entrada), o None si el prefijo no se cachea (demasiado pequeño, o el
+            proveedor falló hace poco) y el contenido debe enviarse en línea.
+        """
+        key = self.build_key(model_name, system_instruction, documents)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                entry.leases += 1
+                needs_refresh = entry.expires_at - now < self.refresh_margin_seconds
+                if needs_refresh:
+                    # Se adelanta la caducidad ya para que sólo una petición haga la renovación.
+                    entry.expires_at = now + self.refresh_margin_seconds
+            elif self._failed.get(key, 0.0) > now:
+                return None
+            else:
+                entry = None
+                needs_refresh = False
+
+        if entry is not None:
+            metrics_manager.increment_counter("context_cache_hits")
+            if needs_refresh:
+                self._refresh(entry)
+            return entry.model, entry
+
+        tokens = token_counter.count_segments([system_instruction, *documents])
+        if tokens < self.min_tokens:
+            return None
+        return self._create(key, model_name, system_instruction, documents, tokens, generation_config)
+
+    def _create(
+        self,
+        key: str,
+        model_name: str,
+        system_instruction: str,
+        documents: Sequence[str],
+        tokens: int,
+        generation_config: Optional[dict[str, Any]],
+    ) -> Optional[tuple[Any, ContextCacheEntry]]:
+        try:
+            handle = self.backend.create(model_name, system_instruction, documents, self.ttl_seconds)
+            model = self.backend.model_for(handle, generation_config)
+        except Exception as e:
+            logger.warning("⚠️ No se pudo crear la caché de contexto (%d tokens): %s", tokens, e)
+            metrics_manager.increment_counter("context_cache_create_errors")
+            with self._lock:
+                self._failed[key] = time.monotonic() + self.failure_backoff_seconds
+            return None
+
+        entry = ContextCacheEntry(
+            key=key,
+            handle=handle,
+            model=model,
+            tokens=tokens,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            leases=1,
+        )
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            self._entries[key] = entry
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1])
+        metrics_manager.increment_counter("context_cache_created")
+        logger.info("🧊 Prefijo de %d tokens cacheado en el proveedor.", tokens)
+
+        # Otra petición pudo crear la misma entrada en paralelo: se borra la copia sobrante.
+        for stale in ([previous] if previous is not None else []) + evicted:
+            self._retire(stale)
+        return model, entry
+
+    def release(self, entry: ContextCacheEntry) -> None:
+        """Devuelve el préstamo de `get_model`; si la entrada ya fue expulsada y era el último, se borra."""
+        with self._lock:
+            entry.leases = max(entry.leases - 1, 0)
+            delete_now = entry.retired and entry.leases == 0
+        if delete_now:
+            self._delete(entry)
+
+    def _retire(self, entry: ContextCacheEntry) -> None:
+        """Marca una entrada ya fuera del índice y la borra del proveedor si nadie la está usando."""
+        with self._lock:
+            entry.retired = True
+            delete_now = entry.leases == 0
+        if delete_now:
+            self._delete(entry)
+        else:
+            # Se borrará al devolverse el último préstamo; si éste nunca llega, caduca por TTL.
+            metrics_manager.increment_counter("context_cache_delete_deferred")
+
+    def _refresh(self, entry: ContextCacheEntry) -> None:
+        try:
+            self.backend.refresh(entry.handle, self.ttl_seconds)
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            metrics_manager.increment_counter("context_cache_refreshed")
+        except Exception as e:
+            logger.warning("⚠️ No se pudo renovar la caché de contexto: %s", e)
+
+    def _delete(self, entry: ContextCacheEntry) -> None:
+        metrics_manager.increment_counter("context_cache_evicted")
+        try:
+            self.backend.delete(entry.handle)
+        except Exception as e:
+            logger.debug("No se pudo borrar la caché de contexto %s: %s", entry.key[:24], e)
+
+    def record_usage(self, entry: ContextCacheEntry, response: Any) -> None:
+        """Suma a la entrada los tokens de entrada que el proveedor sirvió desde la caché."""
+        usage = getattr(response, "usage_metadata", None)
+        saved = getattr(usage, "cached_content_token_count", None)
+        if not isinstance(saved, int) or isinstance(saved, bool):
+            # Sin el dato explícito, todo el prefijo se ha servido desde la caché.
+            saved = entry.tokens if usage_from_response(response) is not None else 0
+        with self._lock:
+            entry.tokens_saved += saved
+        metrics_manager.increment_counter("context_cache_tokens_saved", saved)
+
+    def clear(self) -> None:
+        """Borra todas las entradas (también en el proveedor, al terminar las peticiones en curso)."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._failed.clear()
+        for entry in entries:
+            self._retire(entry)
+
+    def get_stats(self) -> dict[str, Any]:
+        """Contabilidad por entrada: tamaño, usos, tokens de entrada ahorrados y tiempo restante."""
+        now = time.monotonic()
+        with self._lock:
+            entries = {
+                entry.key: {
+                    "tokens": entry.tokens,
+                    "hits": entry.hits,
+                    "in_use": entry.leases,
+                    "tokens_saved": entry.tokens_saved,
+                    "expires_in_seconds": max(entry.expires_at - now, 0.0),
+                }
+                for entry in self._entries.values()
+            }
+        return {
+            "entries": entries,
+            "total_tokens_saved": sum(e["tokens_saved"] for e in entries.values()),
+        }
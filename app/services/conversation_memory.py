@@ -1,13 +1,49 @@
 """Módulo para gestionar la memoria de conversaciones con Gemini AI."""
 
+import asyncio
 import logging
-from typing import Any, Dict, List, Optional
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from flask import Flask, current_app
 
 from app.config.extensions import db
+from app.core.async_runner import loop_runner
 from app.models import ChatMessage, ChatSession
+from app.services.context_assembler import context_assembler
+from app.services.tokenizer import token_counter
 
 logger = logging.getLogger(__name__)
 
+# A partir de cuántos tokens sin resumir se compacta una sesión, y cuántos tokens recientes se
+# conservan literalmente tras compactar.
+COMPACTION_THRESHOLD_TOKENS = int(os.getenv("CHAT_COMPACTION_THRESHOLD_TOKENS", "6000"))
+COMPACTION_KEEP_RECENT_TOKENS = int(os.getenv("CHAT_COMPACTION_KEEP_RECENT_TOKENS", "2000"))
+
+SUMMARY_PROMPT = """Actualiza el resumen de una conversación entre un usuario y un asistente de IA.
+Conserva hechos, decisiones, preferencias del usuario y preguntas pendientes. Sé conciso y no
+inventes nada. Devuelve sólo el resumen actualizado.
+
+Resumen actual:
+{summary}
+
+Nuevos mensajes:
+{transcript}
+"""
+
+# Sesiones (id interno) con una compactación en curso, para no lanzar dos a la vez.
+_compacting: set[int] = set()
+_compacting_lock = threading.Lock()
+
+
+async def summarize_with_basic_model(prompt: str) -> str:
+    """Resume con el modelo 'basic' (el más barato) del cliente de Vertex AI / Gemini API."""
+    from app.config.vertex_client import vertex_client
+
+    result = await vertex_client.generate_response(prompt, model_type="basic", max_tokens=512, temperature=0.2)
+    return result["response"]
+
 
 class ConversationMemory:
     """
@@ -15,7 +51,13 @@ class ConversationMemory:
     utilizando la base de datos.
     """
 
-    def __init__(self, session_id: str, user_id: int, max_history: int = 20) -> None:
+    def __init__(
+        self,
+        session_id: str,
+        user_id: int,
+        max_history: int = 20,
+        summarizer: Optional[Callable[[str], Awaitable[str]]] = None,
+    ) -> None:
         """
         Inicializa la memoria de conversación, cargando o creando una sesión.
 
@@ -23,8 +65,11 @@ class ConversationMemory:
             session_id: El ID único de la sesión de chat.
             user_id: El ID del usuario propietario de la sesión.
             max_history: Número máximo de mensajes a recuperar del historial.
+            summarizer: Corutina que genera el resumen a partir de un prompt; por defecto, el
+                modelo 'basic'.
         """
         self.max_history = max_history
+        self.summarizer = summarizer or summarize_with_basic_model
         self.session: ChatSession = self._load_or_create_session(session_id, user_id)
 
     def _load_or_create_session(self, session_id: str, user_id: int) -> ChatSession:
@@ -47,16 +92,24 @@ class ConversationMemory:
         Args:
             role: El rol del mensaje ('user' o 'model').
             content: El contenido del mensaje.
-            tokens: El número de tokens utilizados por el mensaje (opcional).
+            tokens: El número de tokens del mensaje. Si no se indica (p. ej. porque la respuesta
+                no trajo `usage_metadata`), se estima con el tokenizador local.
         """
         if role not in ["user", "model"]:
             raise ValueError("El rol debe ser 'user' o 'model'")
 
+        if tokens is None:
+            tokens = token_counter.count(content)
+
         message = ChatMessage(session_id=self.session.id, role=role, content=content, tokens=tokens)
         db.session.add(message)
         db.session.commit()
         logger.debug("Mensaje de '%s' añadido a la sesión %s", role, self.session.session_id)
 
+        # Al cerrar un turno, compactar en segundo plano si la sesión ha crecido demasiado.
+        if role == "model":
+            self.maybe_compact()
+
     def get_history(self) -> List[ChatMessage]:
         """
         Obtiene el historial de mensajes de la sesión actual desde la base de datos.
@@ -118,3 +171,133 @@ class ConversationMemory:
                 }
             )
         return formatted_history
+
+    def get_context(self, model_type: str = "fast", reserved_tokens: int = 0) -> List[Dict[str, Any]]:
+        """
+        Devuelve el historial en formato Gemini limitado por el presupuesto de tokens del modelo.
+
+        A diferencia de `format_for_gemini`, que recorta por `max_history` mensajes, aquí se
+        incluyen tantos turnos recientes como quepan en `context_budget_tokens`. Los mensajes se
+        leen del más reciente al más antiguo y la lectura se detiene al agotar el presupuesto.
+
+        Args:
+            model_type: Tipo de modelo ('fast', 'pro', 'basic').
+            reserved_tokens: Tokens ya ocupados por el mensaje actual.
+        """
+        summary_turns: List[Dict[str, Any]] = []
+        if self.session.summary:
+            summary_turns = [
+                {"role": "user", "parts": [{"text": f"Resumen de la conversación anterior:\n{self.session.summary}"}]},
+                {"role": "model", "parts": [{"text": "Entendido, continúo a partir de ese contexto."}]},
+            ]
+            reserved_tokens += sum(context_assembler.message_tokens(turn) for turn in summary_turns)
+
+        # Tras compactar sólo se envía la cola de mensajes posterior al resumen.
+        newest_first = self._unsummarized_query().order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).yield_per(50)
+        context = summary_turns + context_assembler.assemble(newest_first, model_type, reserved_tokens, newest_first=True)
+
+        # Mensajes antiguos sin recuento: el ensamblador lo ha calculado y se guarda para la próxima vez.
+        if db.session.dirty:
+            db.session.commit()
+        return context
+
+    def _unsummarized_query(self) -> Any:
+        """Consulta de los mensajes de la sesión que todavía no están incluidos en el resumen."""
+        query = ChatMessage.query.filter_by(session_id=self.session.id)
+        if self.session.summary_message_id:
+            query = query.filter(ChatMessage.id > self.session.summary_message_id)
+        return query
+
+    def maybe_compact(self, background: bool = True) -> bool:
+        """
+        Resume los turnos antiguos si los mensajes sin resumir superan el umbral de tokens.
+
+        El resumen es incremental: el modelo recibe el resumen actual y sólo los mensajes nuevos
+        que hay que incorporar. Se conservan literalmente los turnos más recientes (hasta
+        `COMPACTION_KEEP_RECENT_TOKENS`), empezando siempre por un turno del usuario.
+
+        Args:
+            background: Si es True, la llamada al modelo se hace en el event loop de fondo y el
+                resumen se guarda cuando termina; si es False, se espera al resultado.
+
+        Returns:
+            True si se ha lanzado (o hecho) una compactación.
+        """
+        pending = self._unsummarized_query().order_by(ChatMessage.id.asc()).all()
+        counts = [context_assembler.message_tokens(message) for message in pending]
+        if sum(counts) < COMPACTION_THRESHOLD_TOKENS:
+            return False
+
+        # Cola reciente que se conserva: del final hacia atrás mientras quepa en el presupuesto.
+        cut, tail_tokens = len(pending), 0
+        while cut > 0 and tail_tokens + counts[cut - 1] <= COMPACTION_KEEP_RECENT_TOKENS:
+            cut -= 1
+            tail_tokens += counts[cut]
+        # La cola empieza en un turno del usuario: si hace falta se conserva el turno completo.
+        while 0 < cut < len(pending) and pending[cut].role != "user":
+            cut -= 1
+        to_fold = pending[:cut]
+        if not to_fold:
+            return False
+
+        session_pk = self.session.id
+        with _compacting_lock:
+            if session_pk in _compacting:
+                return False
+            _compacting.add(session_pk)
+
+        transcript = "\n".join(
+            f"{'Usuario' if message.role == 'user' else 'Asistente'}: {message.content}" for message in to_fold
+        )
+        prompt = SUMMARY_PROMPT.format(summary=self.session.summary or "(vacío)", transcript=transcript)
+        last_folded_id = to_fold[-1].id
+        logger.info(
+            "🗜️ Compactando %d mensajes de la sesión %s (%d tokens sin resumir).",
+            len(to_fold),
+            self.session.session_id,
+            sum(counts),
+        )
+
+        if not background:
+            try:
+                summary = loop_runner.run(self.summarizer(prompt), timeout=120)
+                self._store_summary(session_pk, last_folded_id, summary)
+            finally:
+                with _compacting_lock:
+                    _compacting.discard(session_pk)
+            db.session.refresh(self.session)
+            return True
+
+        app = current_app._get_current_object()
+        loop_runner.submit(self._compact_in_background(app, session_pk, last_folded_id, prompt), timeout=180)
+        return True
+
+    async def _compact_in_background(self, app: Flask, session_pk: int, last_folded_id: int, prompt: str) -> None:
+        """Genera el resumen en el loop de fondo y lo guarda desde un hilo del executor."""
+        try:
+            summary = await self.summarizer(prompt)
+
+            def store() -> None:
+                with app.app_context():
+                    self._store_summary(session_pk, last_folded_id, summary)
+
+            await asyncio.get_running_loop().run_in_executor(None, store)
+        except Exception:
+            logger.exception("❌ Error al compactar la sesión %s", session_pk)
+        finally:
+            with _compacting_lock:
+                _compacting.discard(session_pk)
+
+    @staticmethod
+    def _store_summary(session_pk: int, last_folded_id: int, summary: str) -> None:
+        """Guarda el resumen y el último mensaje que incluye, si el modelo devolvió texto."""
+        if not summary or not summary.strip():
+            logger.warning("⚠️ El resumen de la sesión %s llegó vacío; se descarta.", session_pk)
+            return
+        session = db.session.get(ChatSession, session_pk)
+        if session is None:
+            return
+        session.summary = summary.strip()
+        session.summary_message_id = last_folded_id
+        db.session.commit()
+        logger.info("✅ Resumen de la sesión %s actualizado.", session.session_id)
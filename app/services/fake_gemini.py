@@ -0,0 +1,270 @@
+"""
+Backend simulado de Gemini para pruebas de rendimiento sin llamar a Google.
+
+`FakeGenerativeModel` imita la parte del SDK que usan `GeminiService` y `VertexAIClient`
+(`generate_content`, `generate_content_async`, `start_chat().send_message`, con y sin streaming).
+Las respuestas son deterministas para un mismo modelo y prompt, y la latencia (TTFT y tokens por
+segundo), los errores 429/500 y los timeouts se configuran con variables `FAKE_GEMINI_*`. Se
+activa con FAKE_GEMINI_ENABLED=True: así /api/chat/send y el resto de mejoras de rendimiento se
+pueden medir en local y en CI sin coste.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Iterator, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+from app.services.tokenizer import token_counter
+
+logger = logging.getLogger(__name__)
+
+_WORDS = (
+    "el modelo simulado responde con texto determinista para medir latencia coste y rendimiento "
+    "sin llamar a la api real cada palabra cuenta como un token de salida en esta respuesta de prueba"
+).split()
+
+
+def fake_backend_enabled() -> bool:
+    """Indica si las llamadas al modelo deben ir al backend simulado."""
+    return os.getenv("FAKE_GEMINI_ENABLED", "False").lower() == "true"
+
+
+@dataclass
+class FakeBackendConfig:
+    """Perfil de latencia y errores del backend simulado."""
+
+    ttft_ms: float = 300.0  # Mediana del tiempo hasta el primer token
+    latency_sigma: float = 0.4  # Dispersión (lognormal) del TTFT
+    tokens_per_second: float = 80.0
+    output_tokens: int = 200  # Tokens de salida típicos (acotados por max_output_tokens)
+    chunk_tokens: int = 8  # Tokens por fragmento en streaming
+    error_429_rate: float = 0.0
+    error_500_rate: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 30.0
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeBackendConfig":
+        """Lee el perfil de las variables FAKE_GEMINI_*."""
+        seed = os.getenv("FAKE_GEMINI_SEED")
+        return cls(
+            ttft_ms=float(os.getenv("FAKE_GEMINI_TTFT_MS", cls.ttft_ms)),
+            latency_sigma=float(os.getenv("FAKE_GEMINI_LATENCY_SIGMA", cls.latency_sigma)),
+            tokens_per_second=float(os.getenv("FAKE_GEMINI_TOKENS_PER_SECOND", cls.tokens_per_second)),
+            output_tokens=int(os.getenv("FAKE_GEMINI_OUTPUT_TOKENS", cls.output_tokens)),
+            chunk_tokens=int(os.getenv("FAKE_GEMINI_CHUNK_TOKENS", cls.chunk_tokens)),
+            error_429_rate=float(os.getenv("FAKE_GEMINI_ERROR_429_RATE", cls.error_429_rate)),
+            error_500_rate=float(os.getenv("FAKE_GEMINI_ERROR_500_RATE", cls.error_500_rate)),
+            timeout_rate=float(os.getenv("FAKE_GEMINI_TIMEOUT_RATE", cls.timeout_rate)),
+            timeout_seconds=float(os.getenv("FAKE_GEMINI_TIMEOUT_SECONDS", cls.timeout_seconds)),
+            seed=int(seed) if seed else None,
+        )
+
+
+class FakeResponse:
+    """Respuesta completa con `text` y `usage_metadata`, como la del SDK."""
+
+    def __init__(self, text: str, prompt_tokens: int, output_tokens: int) -> None:
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+
+class FakeStreamResponse:
+    """Respuesta en streaming: itera fragmentos y expone `usage_metadata` al terminar."""
+
+    def __init__(self, chunks: Iterator[str], prompt_tokens: int, output_tokens: int) -> None:
+        self._chunks = chunks
+        self._prompt_tokens = prompt_tokens
+        self._output_tokens = output_tokens
+        self.usage_metadata = None
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        for text in self._chunks:
+            yield SimpleNamespace(text=text)
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=self._prompt_tokens,
+            candidates_token_count=self._output_tokens,
+            total_token_count=self._prompt_tokens + self._output_tokens,
+        )
+
+
+def _prompt_text(content: Any) -> str:
+    """Texto de un contenido del SDK (cadena, lista de partes o dict con `parts`)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, dict):
+        return _prompt_text(content.get("parts", content.get("text", "")))
+    if isinstance(content, (list, tuple)):
+        return "\n".join(filter(None, (_prompt_text(part) for part in content)))
+    return str(getattr(content, "text", "") or "")
+
+
+def _max_output_tokens(generation_config: Any) -> Optional[int]:
+    """`max_output_tokens` de una configuración del SDK de Gemini, de Vertex AI o de un dict."""
+    if generation_config is None:
+        return None
+    if isinstance(generation_config, dict):
+        return generation_config.get("max_output_tokens")
+    if hasattr(generation_config, "to_dict"):
+        return generation_config.to_dict().get("max_output_tokens")
+    value = getattr(generation_config, "max_output_tokens", None)
+    return value if isinstance(value, int) else None
+
+
+class FakeGenerativeModel:
+    """Sustituto de `GenerativeModel` con respuestas deterministas y latencia configurable."""
+
+    def __init__(
+        self,
+        model_name: str = "gemini-flash-latest",
+        system_instruction: Optional[str] = None,
+        config: Optional[FakeBackendConfig] = None,
+        **kwargs: Any,
+    ) -> None:
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.config = config or FakeBackendConfig.from_env()
+        self._rng = random.Random(self.config.seed)
+        self._rng_lock = threading.Lock()
+
+    def _answer(self, prompt: str, generation_config: Any) -> tuple[str, int]:
+        """Texto determinista para el prompt y su número de tokens de salida."""
+        digest = hashlib.sha256(f"{self.model_name}\n{prompt}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        tokens = max(1, int(self.config.output_tokens * rng.uniform(0.5, 1.5)))
+        limit = _max_output_tokens(generation_config)
+        if limit:
+            tokens = min(tokens, limit)
+        words = [rng.choice(_WORDS) for _ in range(tokens - 1)]
+        return " ".join([f"[{digest.hex()[:8]}]", *words]), tokens
+
+    def _plan(self, request_options: Optional[dict[str, Any]]) -> tuple[Optional[str], float]:
+        """Sortea el resultado de la llamada (error o no) y el TTFT en segundos."""
+        with self._rng_lock:
+            roll = self._rng.random()
+            ttft = self.config.ttft_ms / 1000 * self._rng.lognormvariate(0, self.config.latency_sigma)
+        config = self.config
+        if roll < config.error_429_rate:
+            return "429", 0.0
+        roll -= config.error_429_rate
+        if roll < config.error_500_rate:
+            return "500", ttft
+        roll -= config.error_500_rate
+        if roll < config.timeout_rate:
+            timeout = self._timeout(request_options)
+            return "timeout", min(config.timeout_seconds, timeout) if timeout else config.timeout_seconds
+        return None, ttft
+
+    def _raise(self, outcome: str) -> None:
+        logger.debug("🧪 Backend simulado: error inyectado (%s)", outcome)
+        if outcome == "429":
+            raise api_exceptions.ResourceExhausted("429 Resource has been exhausted (simulado)")
+        if outcome == "500":
+            raise api_exceptions.InternalServerError("500 Internal error (simulado)")
+        raise api_exceptions.DeadlineExceeded("504 Deadline exceeded (simulado)")
+
+    @staticmethod
+    def _timeout(request_options: Optional[dict[str, Any]]) -> Optional[float]:
+        return (request_options or {}).get("timeout")
+
+    def _generation_seconds(self, tokens: int) -> float:
+        return tokens / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+    def _stream(self, text: str, delay: float) -> Iterator[str]:
+        """Fragmentos de `chunk_tokens` palabras al ritmo de `tokens_per_second`."""
+        time.sleep(delay)
+        words = text.split(" ")
+        step = max(1, self.config.chunk_tokens)
+        for start in range(0, len(words), step):
+            if start:
+                time.sleep(self._generation_seconds(step))
+            yield " ".join(words[start : start + step]) + (" " if start + step < len(words) else "")
+
+    def generate_content(
+        self,
+        contents: Any,
+        generation_config: Any = None,
+        stream: bool = False,
+        request_options: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Equivalente síncrono de `GenerativeModel.generate_content`."""
+        prompt = _prompt_text(contents)
+        outcome, delay = self._plan(request_options)
+        if outcome is not None:
+            time.sleep(delay)
+            self._raise(outcome)
+        text, output_tokens = self._answer(prompt, generation_config)
+        prompt_tokens = token_counter.count(prompt)
+        if stream:
+            return FakeStreamResponse(self._stream(text, delay), prompt_tokens, output_tokens)
+        duration = delay + self._generation_seconds(output_tokens)
+        timeout = self._timeout(request_options)
+        if timeout is not None and duration > timeout:
+            # Como el SDK real: la llamada se corta al vencer el timeout de la petición.
+            time.sleep(timeout)
+            self._raise("timeout")
+        time.sleep(duration)
+        return FakeResponse(text, prompt_tokens, output_tokens)
+
+    async def generate_content_async(
+        self,
+        contents: Any,
+        generation_config: Any = None,
+        request_options: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> FakeResponse:
+        """Equivalente asíncrono (sin streaming) de `generate_content`."""
+        prompt = _prompt_text(contents)
+        outcome, delay = self._plan(request_options)
+        if outcome is not None:
+            await asyncio.sleep(delay)
+            self._raise(outcome)
+        text, output_tokens = self._answer(prompt, generation_config)
+        duration = delay + self._generation_seconds(output_tokens)
+        timeout = self._timeout(request_options)
+        if timeout is not None and duration > timeout:
+            await asyncio.sleep(timeout)
+            self._raise("timeout")
+        await asyncio.sleep(duration)
+        return FakeResponse(text, token_counter.count(prompt), output_tokens)
+
+    def start_chat(self, history: Optional[list[Any]] = None, **kwargs: Any) -> "FakeChatSession":
+        return FakeChatSession(self, history)
+
+
+class FakeChatSession:
+    """Sesión de chat: el historial forma parte del prompt y de la respuesta determinista."""
+
+    def __init__(self, model: FakeGenerativeModel, history: Optional[list[Any]] = None) -> None:
+        self.model = model
+        self.history: list[Any] = list(history or [])
+
+    def send_message(
+        self,
+        content: Any,
+        generation_config: Any = None,
+        stream: bool = False,
+        request_options: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        response = self.model.generate_content(
+            [*self.history, content], generation_config=generation_config, stream=stream, request_options=request_options
+        )
+        if not stream:
+            self.history.append({"role": "user", "parts": [_prompt_text(content)]})
+            self.history.append({"role": "model", "parts": [response.text]})
+        return response
@@ -4,26 +4,71 @@ VERSIÓN RESTAURADA - Esta era la que funcionaba antes de la limpieza.
 ACTUALIZADA CON SOPORTE MULTIMODAL PARA ANÁLISIS DE IMÁGENES.
 """
 
+import contextlib
 import logging
 import os
+import threading
 import time
-from typing import Any, Optional
+from typing import Any, Iterator, Optional, Union
 
 import google.generativeai as genai
 
+from app.config.vertex_ai import vertex_config
+from app.core.adaptive_limiter import upstream_limiter
+from app.core.metrics import metrics_manager
+from app.core.retry_policy import retry_policy
+from app.core.singleflight import SingleFlight
+from app.services.client_pool import GEMINI_API, ClientPool
+from app.services.context_cache import ContextCache, ContextCacheEntry
+from app.services.fake_gemini import FakeGenerativeModel, fake_backend_enabled
+from app.services.image_captions import CAPTION_PROMPTS, CaptionCache
+from app.services.image_store import StoredImage, image_store
+from app.services.response_cache import ResponseCache, build_cache_key
+from app.services.tokenizer import token_counter, usage_from_response
+
 logger = logging.getLogger(__name__)
 
+# Prefijo de las respuestas de `generate_response` que en realidad son un error del modelo.
+ERROR_RESPONSE_PREFIX = "Error en el servicio de IA"
+
 
 class GeminiService:
     """Servicio para manejar la comunicación con Google Gemini AI."""
 
-    def __init__(self) -> None:
-        """Inicializar el servicio Gemini - VERSIÓN ORIGINAL RESTAURADA."""
+    def __init__(
+        self,
+        response_cache: Optional[ResponseCache] = None,
+        client_pool: Optional[ClientPool] = None,
+        context_cache: Optional[ContextCache] = None,
+        caption_cache: Optional[CaptionCache] = None,
+    ) -> None:
+        """
+        Inicializar el servicio Gemini - VERSIÓN ORIGINAL RESTAURADA.
+
+        Args:
+            response_cache: Caché opcional de respuestas exactas. Sólo se usa en las llamadas que
+                indican un `cache_ttl`.
+            client_pool: Pool opcional de API keys. Si tiene keys configuradas, cada llamada usa la
+                key que elija el pool; si no, se usa la key de `GEMINI_API_KEY`.
+            context_cache: Caché de contexto opcional del proveedor para la instrucción de sistema
+                y los documentos grandes. No se usa junto con el pool de keys, porque cada prefijo
+                cacheado pertenece a la key que lo creó.
+            caption_cache: Caché opcional de descripciones de imágenes. Si se indica, tras la primera
+                respuesta sobre una imagen se genera su descripción en segundo plano para que los
+                turnos siguientes puedan ir sólo con texto (ver `app.services.image_captions`).
+
+        Con FAKE_GEMINI_ENABLED=True las llamadas van al backend simulado (ver
+        `app.services.fake_gemini`), sin API key, pool ni caché de contexto.
+        """
+        self.fake_backend = fake_backend_enabled()
         self.api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
+        if self.fake_backend:
+            logger.warning("🧪 GeminiService usa el backend simulado (FAKE_GEMINI_ENABLED)")
+            client_pool = context_cache = None
+        elif not self.api_key:
             raise ValueError("GEMINI_API_KEY no encontrada en las variables de entorno")
-
-        genai.configure(api_key=self.api_key)
+        else:
+            genai.configure(api_key=self.api_key)
 
         # System Instruction para definir la personalidad y comportamiento
         system_instruction = """
@@ -38,18 +83,38 @@ Tus principios fundamentales son:
 Responde siempre en el idioma que el usuario prefiera (por defecto Español), con formato Markdown limpio.
 """
 
-        self.model = genai.GenerativeModel(model_name="gemini-2.0-flash-001", system_instruction=system_instruction)
+        self.model_name = "gemini-2.0-flash-001"
+        self.generation_config: dict[str, Any] = {"temperature": 0.7, "max_output_tokens": 2048}
+        self.system_instruction = system_instruction
+        self.response_cache = response_cache
+        self.client_pool = client_pool
+        self.context_cache = context_cache
+        self.caption_cache = caption_cache
+        # Reintentos con presupuesto compartido en el proceso (ver app.core.retry_policy).
+        self.retry_policy = retry_policy
+        # Peticiones idénticas simultáneas comparten una única llamada al modelo.
+        self.singleflight = SingleFlight("gemini_service")
+
+        self.model = self._new_model(self.model_name)
+        # Modelos por nombre para las llamadas enrutadas a otro nivel (ver `model_type`).
+        self._models: dict[str, Any] = {self.model_name: self.model}
+        # Media móvil de tokens de salida de las respuestas completas (estimación de lo ahorrado al cancelar).
+        self._avg_output_tokens: Optional[float] = None
         logger.info("✅ Servicio Gemini ORIGINAL restaurado y configurado con System Instructions")
 
-    def generate_response(  # noqa: C901
+    def generate_response(
         self,
         message: Optional[str] = None,
         session_id: Optional[str] = None,
         user_id: Optional[int] = None,
         prompt: Optional[str] = None,
-        image_data: Optional[str] = None,
+        image_data: Optional[Union[str, StoredImage]] = None,
         history: Optional[list[dict[str, Any]]] = None,
         language: str = "es",
+        cache_ttl: Optional[int] = None,
+        document: Optional[str] = None,
+        deadline: Optional[float] = None,
+        model_type: Optional[str] = None,
     ) -> str:
         """
         Generar respuesta usando Gemini AI con historial de conversación.
@@ -59,9 +124,18 @@ Responde siempre en el idioma que el usuario prefiera (por defecto Español), co
             session_id: Ignorado
             user_id: Ignorado
             prompt: Alias para message
-            image_data: Data URL de imagen
+            image_data: Imagen ya almacenada (`StoredImage`) o data URL; un data URL se decodifica y
+                normaliza una sola vez en el almacén de imágenes, fuera del bucle de reintentos.
             history: Historial de chat en formato Gemini
             language: Idioma preferido
+            cache_ttl: Si se indica y el servicio tiene caché de respuestas, TTL en segundos con el
+                que se cachea la respuesta. Las peticiones con imagen nunca se cachean.
+            document: Contexto documental (p. ej. texto de un PDF) que precede al prompt. Con caché
+                de contexto se sube una vez y se reutiliza en las preguntas siguientes.
+            deadline: Instante (`time.monotonic()`) en que vence la petición: no se reintenta más
+                allá y la llamada en curso se corta con ese timeout.
+            model_type: Nivel de `VertexAIConfig.models` ('basic', 'fast', 'pro') elegido por el
+                enrutador; None usa el modelo por defecto del servicio.
 
         Returns:
             String con la respuesta generada
@@ -72,79 +146,365 @@ Responde siempre en el idioma que el usuario prefiera (por defecto Español), co
         if not text_to_process:
             return "Por favor, proporciona un mensaje para procesar."
 
+        try:
+            image = self._resolve_image(image_data)
+            key = self._request_fingerprint(text_to_process, image, history, language, document, model_type)
+
+            def generate() -> str:
+                return self.singleflight.do(
+                    key,
+                    lambda: self._generate_with_retries(
+                        text_to_process, image, history, language, document, deadline, model_type
+                    ),
+                    deadline=deadline,
+                )
+
+            if self.response_cache is not None and cache_ttl and not image:
+                return self.response_cache.get_or_compute(key, generate, ttl=cache_ttl)
+            result = generate()
+            self._schedule_caption(image, language)
+            return result
+        except Exception as e:
+            return f"{ERROR_RESPONSE_PREFIX}: {str(e)}"
+
+    def describe_image(self, image: StoredImage, language: str = "es") -> str:
+        """
+        Descripción compacta de una imagen con el modelo más barato, para sustituirla en el historial.
+
+        Lanza la excepción del modelo si falla (no la convierte en texto como `generate_response`).
+        """
+        prompt = CAPTION_PROMPTS.get(language, CAPTION_PROMPTS["es"])
+        deadline = time.monotonic() + 60
+        return self._generate_with_retries(prompt, image, None, language, deadline=deadline, model_type="basic")
+
+    def _schedule_caption(self, image: Optional[StoredImage], language: str) -> None:
+        """Tras una respuesta sobre una imagen, genera su descripción en segundo plano si no existe."""
+        if image is not None and self.caption_cache is not None:
+            self.caption_cache.schedule(image.digest, lambda: self.describe_image(image, language))
+
+    @staticmethod
+    def _resolve_image(image_data: Optional[Union[str, StoredImage]]) -> Optional[StoredImage]:
+        """Imagen almacenada de la petición; un data URL se guarda (y procesa) en el almacén si es nueva."""
+        if not image_data or isinstance(image_data, StoredImage):
+            return image_data or None
+        return image_store.put(image_data)
+
+    def _request_fingerprint(
+        self,
+        text_to_process: str,
+        image: Optional[StoredImage],
+        history: Optional[list[dict[str, Any]]],
+        language: str,
+        document: Optional[str] = None,
+        model_type: Optional[str] = None,
+    ) -> str:
+        """Huella de una petición: misma huella implica la misma llamada al modelo."""
+        model_name, generation_config = self._resolve_model(model_type)
+        key = build_cache_key(self._inline_document(text_to_process, document), history, language, model_name, generation_config)
+        if image:
+            key += ":" + image.digest
+        return key
+
+    def _generate_with_retries(
+        self,
+        text_to_process: str,
+        image: Optional[StoredImage],
+        history: Optional[list[dict[str, Any]]],
+        language: str,
+        document: Optional[str] = None,
+        deadline: Optional[float] = None,
+        model_type: Optional[str] = None,
+    ) -> str:
+        """
+        Llama al modelo con la política de reintentos y devuelve el texto; lanza la última excepción
+        si no se puede reintentar más (error no transitorio, intentos o presupuesto agotados, o plazo).
+        """
         start_time = time.time()
-        max_retries = 3
-        retry_delay = 1
+        model_name, generation_config = self._resolve_model(model_type)
 
-        for attempt in range(max_retries):
-            try:
-                # 1. Caso Multimodal (Imagen + Texto) - El historial es complejo aquí, usaremos generate_content simple
-                if image_data:
-                    # ... (Lógica de imagen existente) ...
-                    import base64
-                    import io
+        def attempt() -> str:
+            request_options = self._request_options(deadline)
 
-                    from PIL import Image
+            # 1. Caso Multimodal (Imagen + Texto) - El historial es complejo aquí, usaremos generate_content simple
+            if image:
+                logger.info(f"🖼️ Processing multimodal request: {text_to_process[:50]}...")
 
-                    if "," in image_data:
-                        header, base64_data = image_data.split(",", 1)
-                    else:
-                        base64_data = image_data
+                with self._lease_model(document, model_name=model_name) as (model, cache_entry):
+                    content = self._build_multimodal_content(
+                        self._inline_document(text_to_process, document, cache_entry), image, language
+                    )
+                    response = model.generate_content(
+                        content,
+                        generation_config=genai.types.GenerationConfig(**generation_config),
+                        request_options=request_options,
+                    )
+                self._record_context_cache_usage(cache_entry, response)
+                self._observe_output(response)
+                return response.text
 
-                    image_bytes = base64.b64decode(base64_data)
-                    image = Image.open(io.BytesIO(image_bytes))
+            # 2. Caso Texto Puro con Historial (Chat Session)
+            chat_history = self._build_chat_history(history)
 
-                    # Añadir contexto de idioma
-                    lang_instr = "Responde en Español. " if language == "es" else "Respond in English. "
-                    final_prompt = lang_instr + text_to_process
+            logger.info(f"💬 Processing chat request with {len(chat_history)} history messages...")
 
-                    content = [final_prompt, image]
-                    logger.info(f"🖼️ Processing multimodal request: {text_to_process[:50]}...")
+            with self._lease_model(document, model_name=model_name) as (model, cache_entry):
+                # Iniciar sesión de chat con historial
+                chat = model.start_chat(history=chat_history)
 
-                    response = self.model.generate_content(
-                        content, generation_config=genai.types.GenerationConfig(temperature=0.7, max_output_tokens=2048)
-                    )
-                    return response.text
-
-                # 2. Caso Texto Puro con Historial (Chat Session)
-                else:
-                    # Configurar historial si existe
-                    chat_history = []
-                    if history:
-                        # Validar y limpiar historial
-                        for msg in history:
-                            if "role" in msg and "parts" in msg:
-                                # Asegurar que 'parts' sea una lista de strings o el formato correcto
-                                parts = msg["parts"]
-                                if (
-                                    isinstance(parts, list)
-                                    and len(parts) > 0
-                                    and isinstance(parts[0], dict)
-                                    and "text" in parts[0]
-                                ):
-                                    chat_history.append(msg)
-
-                    # Iniciar sesión de chat con historial
-                    chat = self.model.start_chat(history=chat_history)
-
-                    logger.info(f"💬 Processing chat request with {len(chat_history)} history messages...")
-
-                    # Enviar mensaje
-                    response = chat.send_message(
-                        text_to_process, generation_config=genai.types.GenerationConfig(temperature=0.7, max_output_tokens=2048)
-                    )
+                # Enviar mensaje
+                response = chat.send_message(
+                    self._inline_document(text_to_process, document, cache_entry),
+                    generation_config=genai.types.GenerationConfig(**generation_config),
+                    request_options=request_options,
+                )
 
-                    logger.info(f"✅ Respuesta generada en {time.time() - start_time:.2f}s")
-                    return response.text
+            logger.info(f"✅ Respuesta generada en {time.time() - start_time:.2f}s")
+            self._record_context_cache_usage(cache_entry, response)
+            self._observe_output(response)
+            self._calibrate_tokenizer(self._inline_document(text_to_process, document), chat_history, response)
+            return response.text
 
+        def logged_attempt() -> str:
+            try:
+                return attempt()
             except Exception as e:
-                logger.error(f"❌ Error de Gemini (Intento {attempt + 1}): {e}")
-                # ... (Manejo de errores existente) ...
-                if attempt == max_retries - 1:
-                    return f"Error en el servicio de IA: {str(e)}"
-                time.sleep(retry_delay * (2**attempt))
+                logger.error(f"❌ Error de Gemini: {e}")
+                raise
+
+        try:
+            return self.retry_policy.call(logged_attempt, deadline=deadline)
+        except Exception:
+            if deadline is not None and time.monotonic() >= deadline:
+                self._record_cancellation("deadline")
+            raise
 
-        return "Error desconocido."
+    def generate_response_stream(
+        self,
+        message: Optional[str] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[int] = None,
+        prompt: Optional[str] = None,
+        image_data: Optional[Union[str, StoredImage]] = None,
+        history: Optional[list[dict[str, Any]]] = None,
+        language: str = "es",
+        document: Optional[str] = None,
+        model_type: Optional[str] = None,
+        deadline: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Iterator[str]:
+        """
+        Generar una respuesta en streaming, devolviendo los fragmentos de texto según llegan.
+
+        Acepta los mismos argumentos que `generate_response`. A diferencia de éste, no reintenta
+        ni convierte los errores en texto: una vez enviado el primer fragmento no es posible
+        reintentar de forma transparente, así que las excepciones se propagan al llamador.
+
+        La generación se corta (y se deja de consumir el stream del proveedor) cuando vence
+        `deadline`, cuando se activa `cancel_event` (p. ej. el cliente se ha desconectado) o cuando
+        el llamador cierra el generador. En el primer caso se lanza `TimeoutError`.
+
+        Yields:
+            Fragmentos de texto de la respuesta, en orden.
+        """
+        text_to_process = prompt or message
+
+        if not text_to_process:
+            yield "Por favor, proporciona un mensaje para procesar."
+            return
+
+        if deadline is not None and time.monotonic() >= deadline:
+            self._record_cancellation("deadline")
+            raise TimeoutError("Plazo de la petición agotado antes de llamar al modelo")
+
+        model_name, config = self._resolve_model(model_type)
+        generation_config = genai.types.GenerationConfig(**config)
+        request_options = self._request_options(deadline)
+        image = self._resolve_image(image_data)
+        produced: list[str] = []
+
+        # La credencial se mantiene ocupada mientras dura el stream completo.
+        with self._lease_model(document, stream=True, model_name=model_name) as (model, cache_entry):
+            request_text = self._inline_document(text_to_process, document, cache_entry)
+            if image:
+                content = self._build_multimodal_content(request_text, image, language)
+                logger.info(f"🖼️ Processing multimodal streaming request: {text_to_process[:50]}...")
+                response = model.generate_content(
+                    content, generation_config=generation_config, stream=True, request_options=request_options
+                )
+            else:
+                chat_history = self._build_chat_history(history)
+                chat = model.start_chat(history=chat_history)
+                logger.info(f"💬 Processing streaming chat request with {len(chat_history)} history messages...")
+                response = chat.send_message(
+                    request_text, generation_config=generation_config, stream=True, request_options=request_options
+                )
+
+            try:
+                for chunk in response:
+                    if cancel_event is not None and cancel_event.is_set():
+                        self._record_cancellation("disconnect", produced)
+                        return
+                    if deadline is not None and time.monotonic() >= deadline:
+                        self._record_cancellation("deadline", produced)
+                        raise TimeoutError("Plazo de la petición agotado durante el streaming")
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Fragmentos sin partes de texto (p. ej. sólo metadatos de seguridad)
+                        continue
+                    if text:
+                        produced.append(text)
+                        yield text
+            except GeneratorExit:
+                # El llamador cerró el stream (cliente desconectado o demasiado lento).
+                self._record_cancellation("closed", produced)
+                raise
+
+            # El usage_metadata está disponible al terminar el stream.
+            self._record_context_cache_usage(cache_entry, response)
+            self._observe_output(response, produced)
+        self._schedule_caption(image, language)
+
+    @staticmethod
+    def _request_options(deadline: Optional[float]) -> Optional[dict[str, float]]:
+        """Timeout de la llamada al proveedor con el tiempo que le queda a la petición."""
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Plazo de la petición agotado antes de llamar al modelo")
+        return {"timeout": remaining}
+
+    def _observe_output(self, response: Any, produced: Optional[list[str]] = None) -> None:
+        """Actualiza la media de tokens de salida con una respuesta completa."""
+        usage = usage_from_response(response)
+        if usage is not None and usage[1]:
+            output_tokens = usage[1]
+        else:
+            text = "".join(produced) if produced is not None else getattr(response, "text", None)
+            if not isinstance(text, str):
+                return
+            output_tokens = token_counter.count(text)
+        if self._avg_output_tokens is None:
+            self._avg_output_tokens = float(output_tokens)
+        else:
+            self._avg_output_tokens += 0.1 * (output_tokens - self._avg_output_tokens)
+
+    def _record_cancellation(self, reason: str, produced: Optional[list[str]] = None) -> None:
+        """
+        Registra una generación cancelada y los tokens de salida que se estima que se han ahorrado
+        (la media de las respuestas completas menos lo ya generado).
+        """
+        produced_tokens = token_counter.count("".join(produced)) if produced else 0
+        saved = max(0, round((self._avg_output_tokens or 0) - produced_tokens))
+        metrics_manager.increment_counter(f"generations_cancelled_{reason}")
+        metrics_manager.increment_counter("generation_tokens_saved", saved)
+        logger.info(f"🛑 Generación cancelada ({reason}) tras {produced_tokens} tokens; ~{saved} tokens ahorrados")
+
+    def _calibrate_tokenizer(self, text: str, chat_history: list[dict[str, Any]], response: Any) -> None:
+        """Ajusta el tokenizador local con el recuento real de tokens de entrada de una respuesta."""
+        usage = usage_from_response(response)
+        if usage is None:
+            return
+        segments = [self.system_instruction, text]
+        segments.extend(part.get("text") for msg in chat_history for part in msg["parts"] if isinstance(part, dict))
+        token_counter.calibrate(segments, usage[0])
+
+    @staticmethod
+    def _inline_document(text: str, document: Optional[str], cache_entry: Optional[ContextCacheEntry] = None) -> str:
+        """Antepone el documento al prompt salvo que ya esté en el prefijo cacheado."""
+        if not document or cache_entry is not None:
+            return text
+        return f"{document}\n\n{text}"
+
+    def _record_context_cache_usage(self, cache_entry: Optional[ContextCacheEntry], response: Any) -> None:
+        if cache_entry is not None and self.context_cache is not None:
+            self.context_cache.record_usage(cache_entry, response)
+
+    def _resolve_model(self, model_type: Optional[str]) -> tuple[str, dict[str, Any]]:
+        """
+        Nombre del modelo y configuración de generación para un nivel de `VertexAIConfig.models`.
+
+        El tope de tokens de salida es el menor entre el del servicio y el del nivel. Sin nivel (o
+        con uno desconocido) se usa el modelo por defecto del servicio.
+        """
+        model_info = vertex_config.get_model_info(model_type) if model_type else None
+        if not model_info:
+            return self.model_name, self.generation_config
+        max_output_tokens = min(self.generation_config["max_output_tokens"], model_info["max_tokens"])
+        return model_info["name"], {**self.generation_config, "max_output_tokens": max_output_tokens}
+
+    def _model_for(self, model_name: str) -> Any:
+        """Modelo (con la key global) para un nombre, creado la primera vez que se usa."""
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._new_model(model_name)
+            self._models[model_name] = model
+        return model
+
+    def _new_model(self, model_name: str) -> Any:
+        """Crea el modelo real o, con FAKE_GEMINI_ENABLED, el simulado."""
+        model_class = FakeGenerativeModel if self.fake_backend else genai.GenerativeModel
+        return model_class(model_name=model_name, system_instruction=self.system_instruction)
+
+    @contextlib.contextmanager
+    def _lease_model(
+        self, document: Optional[str] = None, stream: bool = False, model_name: Optional[str] = None
+    ) -> Iterator[tuple[Any, Optional[ContextCacheEntry]]]:
+        """
+        Devuelve el modelo con el que hacer una llamada y, si lo hay, el prefijo cacheado que usa.
+
+        La llamada ocupa un hueco del limitador adaptativo del proceso (`upstream_limiter`), que
+        la rechaza con `LimitExceededError` si se han alcanzado los techos configurados. En
+        streaming la duración depende de la longitud de la respuesta y no se usa como señal.
+
+        Con un pool de keys configurado, toma la mejor key disponible y registra en el pool la
+        latencia o el error de la llamada (un 429 la deja en enfriamiento). Sin pool, usa la caché
+        de contexto si el prefijo (instrucción de sistema + documento) es cacheable y, si no, el
+        modelo configurado con la key global.
+        """
+        with upstream_limiter.lease(measure_latency=not stream):
+            yield from self._select_model(document, model_name or self.model_name)
+
+    def _select_model(self, document: Optional[str], model_name: str) -> Iterator[tuple[Any, Optional[ContextCacheEntry]]]:
+        """Generador de `_lease_model`: key del pool, prefijo cacheado o modelo con la key global."""
+        if self.client_pool is None or not self.client_pool.size(GEMINI_API):
+            cached = None
+            if self.context_cache is not None:
+                cached = self.context_cache.get_model(model_name, self.system_instruction, [document] if document else [])
+            if cached is None:
+                yield self._model_for(model_name), None
+                return
+            try:
+                yield cached
+            finally:
+                self.context_cache.release(cached[1])
+            return
+
+        with self.client_pool.lease(GEMINI_API) as credential:
+            yield (
+                self.client_pool.gemini_model(credential, model_name, system_instruction=self.system_instruction),
+                None,
+            )
+
+    @staticmethod
+    def _build_multimodal_content(text: str, image: StoredImage, language: str) -> list[Any]:
+        """Construye el contenido multimodal (texto con instrucción de idioma y bytes ya procesados de la imagen)."""
+        # Añadir contexto de idioma
+        lang_instr = "Responde en Español. " if language == "es" else "Respond in English. "
+        return [lang_instr + text, {"mime_type": image.image.mime_type, "data": image.image.data}]
+
+    @staticmethod
+    def _build_chat_history(history: Optional[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+        """Valida el historial recibido y conserva sólo los mensajes con formato Gemini ({'role', 'parts': [{'text'}]})."""
+        chat_history: list[dict[str, Any]] = []
+        for msg in history or []:
+            if "role" in msg and "parts" in msg:
+                # Asegurar que 'parts' sea una lista de strings o el formato correcto
+                parts = msg["parts"]
+                if isinstance(parts, list) and len(parts) > 0 and isinstance(parts[0], dict) and "text" in parts[0]:
+                    chat_history.append(msg)
+        return chat_history
 
     def validate_api_key(self) -> bool:
         """
@@ -0,0 +1,152 @@
+"""
+Descripciones de texto de las imágenes para abaratar las conversaciones con imagen.
+
+Tras la primera respuesta multimodal sobre una imagen se genera en segundo plano una descripción
+compacta y se guarda por el hash de la imagen. En los turnos siguientes esa descripción se inyecta
+como un turno de texto del historial y la petición se hace sólo con texto: conserva el contexto de
+la conversación y no vuelve a subir ni a cobrar la imagen. Si el usuario pregunta por un detalle
+visual nuevo (o el cliente envía `force_image`), se vuelve a enviar la imagen.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+CAPTION_PROMPTS = {
+    "es": (
+        "Describe esta imagen de forma compacta (máximo 120 palabras) para que alguien que no la ve "
+        "pueda responder preguntas sobre ella: objetos y personas principales, texto visible, números, "
+        "colores relevantes y disposición. Sin introducciones."
+    ),
+    "en": (
+        "Describe this image compactly (at most 120 words) so someone who cannot see it can answer "
+        "questions about it: main objects and people, visible text, numbers, relevant colors and "
+        "layout. No preamble."
+    ),
+}
+
+# Longitud máxima de una descripción guardada (por si el modelo no respeta el límite).
+CAPTION_MAX_CHARS = 1200
+
+# Preguntas que necesitan volver a mirar la imagen en lugar de su descripción.
+_VISUAL_DETAIL_RE = re.compile(
+    r"\b(mira\w*|fíjate|observa\w*|detalle\w*|amplía|zoom|esquina|fondo|color\w*|lee\w*|qué pone|"
+    r"qué dice|texto de la imagen|vuelve a ver|otra vez la imagen|look\w*|detail\w*|corner|background|"
+    r"colou?r\w*|read\w*|what does it say|zoom in|look again)\b",
+    re.IGNORECASE,
+)
+
+
+def asks_visual_detail(message: str) -> bool:
+    """Indica si el mensaje pide un detalle visual que la descripción puede no recoger."""
+    return bool(_VISUAL_DETAIL_RE.search(message or ""))
+
+
+def caption_turns(caption: str, image_name: str, language: str = "es") -> list[dict[str, Any]]:
+    """Turnos de historial (usuario y modelo) que sustituyen a la imagen por su descripción."""
+    if language == "en":
+        user_text = f"[Previously shared image '{image_name}'. Description: {caption}]"
+        model_text = "Understood, I will keep that image in mind."
+    else:
+        user_text = f"[Imagen compartida anteriormente '{image_name}'. Descripción: {caption}]"
+        model_text = "Entendido, tengo en cuenta esa imagen."
+    return [
+        {"role": "user", "parts": [{"text": user_text}]},
+        {"role": "model", "parts": [{"text": model_text}]},
+    ]
+
+
+class CaptionCache:
+    """Descripciones por hash de imagen (LRU con TTL) y su generación en segundo plano."""
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 86400, max_workers: int = 2) -> None:
+        """
+        Args:
+            max_entries: Número máximo de descripciones guardadas.
+            ttl_seconds: Vida de una descripción desde su último uso.
+            max_workers: Generaciones simultáneas en segundo plano.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-caption")
+
+    def configure(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None) -> None:
+        """Ajusta los límites (p. ej. desde la configuración de la aplicación)."""
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if ttl_seconds is not None:
+                self.ttl_seconds = ttl_seconds
+
+    def get(self, digest: str) -> Optional[str]:
+        """Descripción de la imagen, o None si aún no existe o expiró."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            now = time.monotonic()
+            if entry is not None and entry[1] <= now:
+                del self._entries[digest]
+                entry = None
+            if entry is not None:
+                self._entries[digest] = (entry[0], now + self.ttl_seconds)
+                self._entries.move_to_end(digest)
+        metrics_manager.increment_counter("image_caption_hits" if entry else "image_caption_misses")
+        return entry[0] if entry else None
+
+    def set(self, digest: str, caption: str) -> None:
+        """Guarda la descripción de una imagen."""
+        caption = " ".join(caption.split())[:CAPTION_MAX_CHARS]
+        with self._lock:
+            self._entries[digest] = (caption, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def schedule(self, digest: str, generate: Callable[[], str]) -> Optional[Future]:
+        """
+        Genera en segundo plano la descripción de una imagen si no existe ni se está generando.
+
+        Args:
+            digest: Hash de la imagen.
+            generate: Llamada al modelo que devuelve la descripción (lanza si falla).
+
+        Returns:
+            El futuro de la generación, o None si no hacía falta.
+        """
+        with self._lock:
+            if digest in self._entries or digest in self._pending:
+                return None
+            self._pending.add(digest)
+
+        def run() -> None:
+            try:
+                caption = generate()
+                if caption and caption.strip():
+                    self.set(digest, caption)
+                    metrics_manager.increment_counter("image_captions_generated")
+            except Exception as e:
+                metrics_manager.increment_counter("image_caption_errors")
+                logger.warning("⚠️ No se pudo describir la imagen %s: %s", digest[:12], e)
+            finally:
+                with self._lock:
+                    self._pending.discard(digest)
+
+        return self._executor.submit(run)
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "pending": len(self._pending), "max_entries": self.max_entries}
+
+
+# Instancia global compartida por las rutas de chat y GeminiService.
+image_captions = CaptionCache()
@@ -0,0 +1,231 @@
+"""
+Preparación de imágenes para los modelos multimodales.
+
+Cada imagen se decodifica una sola vez, se reduce a la resolución que el modelo aprovecha (Gemini
+trocea las imágenes grandes en teselas de 768 px y cobra cada tesela; una foto de móvil de 12 MP
+sólo añade bytes y latencia de subida) y se vuelve a codificar en JPEG, o en WebP si tiene
+transparencia. Las imágenes se procesan en paralelo en un pool de hilos (Pillow libera el GIL al
+decodificar, escalar y codificar).
+
+Se registran en métricas los bytes recibidos, enviados y ahorrados y el tiempo de proceso, y el
+llamador puede anotar la latencia del modelo por tramo de tamaño con `record_upstream_latency`.
+"""
+
+import asyncio
+import base64
+import binascii
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+# Formatos que acepta Gemini sin conversión.
+SUPPORTED_MIME_TYPES = ("image/jpeg", "image/png", "image/webp", "image/heic", "image/heif")
+
+# Lado máximo por defecto: hasta 2x2 teselas de 768 px, suficiente para texto y detalle.
+DEFAULT_MAX_SIDE = 1536
+DEFAULT_JPEG_QUALITY = 85
+
+# Tramos por tamaño del mayor payload enviado, para comparar la latencia del modelo.
+_SIZE_BUCKETS = ((256 * 1024, "lt256k"), (1024 * 1024, "256k_1m"), (4 * 1024 * 1024, "1m_4m"))
+
+_EXIF_ORIENTATION = 0x0112
+
+# Imagen recibida de un cliente: data URL, base64 o bytes. Nunca una ruta (ver `read_image_file`).
+ImageSource = Union[str, bytes]
+
+
+class ImageDecodeError(ValueError):
+    """La imagen no se puede leer o no es una imagen válida."""
+
+
+@dataclass
+class ProcessedImage:
+    """Imagen lista para enviar al modelo."""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_width: int
+    original_height: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(0, self.original_bytes - len(self.data))
+
+
+def size_bucket(num_bytes: int) -> str:
+    """Tramo de tamaño ('lt256k', '256k_1m', '1m_4m' o 'gt4m') de un payload."""
+    for limit, name in _SIZE_BUCKETS:
+        if num_bytes < limit:
+            return name
+    return "gt4m"
+
+
+def read_image_source(source: ImageSource) -> bytes:
+    """
+    Bytes de una imagen dada como data URL, base64 o bytes.
+
+    El texto nunca se interpreta como ruta de archivo: los datos vienen del cliente. Las imágenes
+    locales del servidor se leen con `read_image_file`.
+
+    Raises:
+        ImageDecodeError: si el origen no se puede decodificar.
+    """
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, str):
+        encoded = source.partition(",")[2] if source.startswith("data:") else source
+        try:
+            return base64.b64decode(encoded, validate=False)
+        except (binascii.Error, ValueError) as e:
+            raise ImageDecodeError(f"Base64 de imagen no válido: {e}") from e
+    raise ImageDecodeError(f"Formato de imagen no soportado: {type(source).__name__}")
+
+
+def read_image_file(path: Union[str, Path]) -> bytes:
+    """
+    Bytes de una imagen local del servidor. Sólo para llamadores de confianza: nunca con rutas
+    recibidas de un cliente.
+
+    Raises:
+        ImageDecodeError: si el archivo no se puede leer.
+    """
+    try:
+        return Path(path).read_bytes()
+    except (OSError, ValueError) as e:
+        raise ImageDecodeError(f"No se pudo leer la imagen {path}: {e}") from e
+
+
+class ImagePipeline:
+    """Decodifica, reduce y recodifica imágenes en un pool de hilos."""
+
+    def __init__(
+        self,
+        max_side: Optional[int] = DEFAULT_MAX_SIDE,
+        jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            max_side: Lado máximo en píxeles; None para no reducir (sólo normalizar el formato).
+            jpeg_quality: Calidad de JPEG/WebP al recodificar.
+            max_workers: Hilos del pool; por defecto uno por CPU (máximo 8).
+        """
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(8, os.cpu_count() or 1), thread_name_prefix="image-pipeline"
+        )
+
+    def process(self, source: ImageSource) -> ProcessedImage:
+        """
+        Prepara una imagen para el modelo.
+
+        Raises:
+            ImageDecodeError: si no es una imagen válida.
+        """
+        start = time.perf_counter()
+        raw = read_image_source(source)
+        try:
+            processed = self._prepare(raw)
+        except (UnidentifiedImageError, OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            raise ImageDecodeError(f"La imagen no es válida: {e}") from e
+
+        metrics_manager.increment_counter("image_pipeline_images")
+        metrics_manager.increment_counter("image_pipeline_bytes_in", processed.original_bytes)
+        metrics_manager.increment_counter("image_pipeline_bytes_out", len(processed.data))
+        metrics_manager.increment_counter("image_pipeline_bytes_saved", processed.bytes_saved)
+        metrics_manager.record_timing("image_pipeline_processing", time.perf_counter() - start)
+        logger.debug(
+            "🖼️ Imagen %dx%d (%d B) -> %dx%d %s (%d B)",
+            processed.original_width,
+            processed.original_height,
+            processed.original_bytes,
+            processed.width,
+            processed.height,
+            processed.mime_type,
+            len(processed.data),
+        )
+        return processed
+
+    def _prepare(self, raw: bytes) -> ProcessedImage:
+        """Decodifica una vez, corrige la orientación EXIF, reduce y recodifica si hace falta."""
+        image = Image.open(io.BytesIO(raw))
+        original_format = (image.format or "").lower()
+        original_size = image.size
+        if self.max_side and max(original_size) > self.max_side:
+            # En JPEG el decodificador escala en el propio DCT: no se decodifica a tamaño completo.
+            image.draft("RGB", (self.max_side, self.max_side))
+        rotated = image.getexif().get(_EXIF_ORIENTATION, 1) != 1
+        if rotated:
+            image = ImageOps.exif_transpose(image)
+
+        resized = bool(self.max_side) and max(image.size) > self.max_side
+        if resized:
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+        original_mime = f"image/{original_format}"
+        if not (resized or rotated) and image.size == original_size and original_mime in SUPPORTED_MIME_TYPES:
+            # Ya tiene un tamaño y formato válidos: recodificar sólo perdería calidad.
+            image.load()  # Detecta archivos truncados antes de enviarlos tal cual.
+            return ProcessedImage(raw, original_mime, *image.size, len(raw), *original_size)
+        data, mime_type = self._encode(image)
+        return ProcessedImage(data, mime_type, *image.size, len(raw), *original_size)
+
+    def _encode(self, image: Image.Image) -> tuple[bytes, str]:
+        """Codifica en JPEG, o en WebP si la imagen tiene transparencia."""
+        buffer = io.BytesIO()
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha:
+            image.convert("RGBA").save(buffer, format="WEBP", quality=self.jpeg_quality, method=4)
+            return buffer.getvalue(), "image/webp"
+        image.convert("RGB").save(buffer, format="JPEG", quality=self.jpeg_quality, optimize=True)
+        return buffer.getvalue(), "image/jpeg"
+
+    async def process_many(self, sources: Sequence[ImageSource]) -> list[Optional[ProcessedImage]]:
+        """
+        Procesa varias imágenes en paralelo en el pool de hilos.
+
+        Returns:
+            Una entrada por origen, en el mismo orden; None para las que no son imágenes válidas.
+        """
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, self.process, source) for source in sources),
+            return_exceptions=True,
+        )
+        processed: list[Optional[ProcessedImage]] = []
+        for result in results:
+            if isinstance(result, ImageDecodeError):
+                logger.warning("⚠️ Imagen descartada: %s", result)
+                metrics_manager.increment_counter("image_pipeline_rejected")
+                processed.append(None)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                processed.append(result)
+        return processed
+
+    @staticmethod
+    def record_upstream_latency(images: Sequence[ProcessedImage], latency: float) -> None:
+        """Anota la latencia del modelo en el tramo del mayor payload enviado."""
+        if images:
+            bucket = size_bucket(max(len(image.data) for image in images))
+            metrics_manager.record_timing(f"image_pipeline_upstream_latency_{bucket}", latency)
+
+
+# Instancia global compartida por los servicios multimodales.
+image_pipeline = ImagePipeline()
@@ -0,0 +1,179 @@
+"""
+Almacén de imágenes direccionado por contenido.
+
+Cada imagen se identifica por el SHA-256 de sus bytes originales. La primera vez se decodifica y
+normaliza con el pipeline de imágenes y se guardan los bytes procesados; los turnos siguientes de
+la conversación pueden referirse a ella con `image_context.image_hash` en lugar de volver a subir
+el data URL completo. Las entradas se expulsan por LRU (presupuesto de bytes y de entradas) y por
+TTL.
+
+El almacén es de proceso: con varios workers de gunicorn una referencia puede llegar a un worker
+que no la tiene, y el cliente recibe `image_not_found` y reenvía la imagen.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from app.core.metrics import metrics_manager
+from app.core.singleflight import SingleFlight
+from app.services.image_pipeline import ImagePipeline, ImageSource, ProcessedImage, image_pipeline, read_image_source
+
+logger = logging.getLogger(__name__)
+
+
+class ImageNotFoundError(LookupError):
+    """La referencia no corresponde a ninguna imagen del almacén (nunca subida o expirada)."""
+
+
+@dataclass
+class StoredImage:
+    """Imagen procesada y su hash de contenido."""
+
+    digest: str
+    image: ProcessedImage
+    expires_at: float
+
+
+class ImageStore:
+    """LRU con TTL de imágenes procesadas, indexado por el hash de los bytes originales."""
+
+    def __init__(
+        self,
+        pipeline: Optional[ImagePipeline] = None,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600,
+    ) -> None:
+        """
+        Args:
+            pipeline: Pipeline con el que se normalizan las imágenes nuevas.
+            max_bytes: Presupuesto de bytes procesados en memoria.
+            max_entries: Número máximo de imágenes.
+            ttl_seconds: Vida de una imagen desde su último uso.
+        """
+        self.pipeline = pipeline or image_pipeline
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, StoredImage] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Dos peticiones con la misma imagen nueva sólo la procesan una vez.
+        self._singleflight = SingleFlight("image_store_process")
+
+    def configure(
+        self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None
+    ) -> None:
+        """Ajusta los límites (p. ej. desde la configuración de la aplicación)."""
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if ttl_seconds is not None:
+                self.ttl_seconds = ttl_seconds
+            self._evict()
+
+    @staticmethod
+    def digest(raw: bytes) -> str:
+        """Hash de contenido de unos bytes de imagen."""
+        return hashlib.sha256(raw).hexdigest()
+
+    def _touch(self, digest: str) -> Optional[StoredImage]:
+        """Entrada vigente para `digest`, marcada como la más reciente; None si no está o expiró."""
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry.expires_at <= now:
+            self._remove(digest)
+            return None
+        entry.expires_at = now + self.ttl_seconds
+        self._entries.move_to_end(digest)
+        return entry
+
+    def _remove(self, digest: str) -> None:
+        entry = self._entries.pop(digest)
+        self._bytes -= len(entry.image.data)
+
+    def _evict(self) -> None:
+        while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            digest = next(iter(self._entries))
+            self._remove(digest)
+            metrics_manager.increment_counter("image_store_evictions")
+        metrics_manager.set_gauge("image_store_bytes", self._bytes)
+
+    def get(self, digest: str) -> Optional[StoredImage]:
+        """Imagen almacenada con ese hash, o None."""
+        with self._lock:
+            entry = self._touch(digest)
+        metrics_manager.increment_counter("image_store_hits" if entry else "image_store_misses")
+        return entry
+
+    def put(self, source: ImageSource) -> StoredImage:
+        """
+        Devuelve la imagen almacenada para `source`, procesándola sólo si es nueva.
+
+        Raises:
+            ImageDecodeError: si `source` no es una imagen válida.
+        """
+        raw = read_image_source(source)
+        digest = self.digest(raw)
+        with self._lock:
+            entry = self._touch(digest)
+        if entry is not None:
+            metrics_manager.increment_counter("image_store_hits")
+            metrics_manager.increment_counter("image_store_bytes_reused", len(raw))
+            return entry
+
+        def process() -> StoredImage:
+            processed = self.pipeline.process(raw)
+            stored = StoredImage(digest, processed, time.monotonic() + self.ttl_seconds)
+            with self._lock:
+                if digest not in self._entries:
+                    self._entries[digest] = stored
+                    self._bytes += len(processed.data)
+                    self._evict()
+            return stored
+
+        metrics_manager.increment_counter("image_store_misses")
+        return self._singleflight.do(digest, process)
+
+    def resolve(self, image_context: Optional[dict[str, Any]]) -> Optional[StoredImage]:
+        """
+        Imagen de un `image_context` de chat: `image_data` (se almacena) o `image_hash` (se busca).
+
+        Raises:
+            ImageNotFoundError: si sólo trae un hash que el almacén no conoce.
+            ImageDecodeError: si `image_data` no es una imagen válida.
+        """
+        if not image_context or not image_context.get("has_image"):
+            return None
+        if image_context.get("image_data"):
+            return self.put(image_context["image_data"])
+        digest = image_context.get("image_hash")
+        if not digest:
+            return None
+        entry = self.get(str(digest))
+        if entry is None:
+            raise ImageNotFoundError(digest)
+        return entry
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+# Instancia global compartida por las rutas de chat y GeminiService.
+image_store = ImageStore()
@@ -0,0 +1,186 @@
+"""
+Enrutado de peticiones de chat entre los niveles de modelo (basic / fast / pro).
+
+Clasifica cada petición con rasgos locales baratos (longitud del prompt, presencia de código,
+adjuntos, profundidad del historial, idioma y palabras que piden razonamiento) y elige el nivel
+más barato de `VertexAIConfig.models` que probablemente baste. Cada decisión se registra en el
+log y en métricas por nivel para poder medir la diferencia de latencia y coste.
+"""
+
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Optional, Sequence
+
+from app.config.vertex_ai import VertexAIConfig, vertex_config
+from app.core.metrics import metrics_manager
+from app.services.tokenizer import TokenCounter, token_counter
+
+logger = logging.getLogger(__name__)
+
+# Niveles de menor a mayor coste.
+TIERS = ("basic", "fast", "pro")
+
+_CODE_RE = re.compile(
+    r"```|^\s*(def|class|import|from|function|const|let|var|public|SELECT|INSERT|CREATE)\b|[{};]\s*$|=>|\w+\([^)]*\)\s*[{:]",
+    re.MULTILINE,
+)
+_REASONING_RE = re.compile(
+    r"\b(paso a paso|analiza\w*|compara\w*|demuestra\w*|razona\w*|optimiza\w*|diseña\w*|depura\w*|"
+    r"arquitectura|step by step|analy[sz]e|compare|prove|reason|optimi[sz]e|design|debug|architecture)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class RoutingDecision:
+    """Nivel elegido para una petición y por qué."""
+
+    model_type: str
+    score: int
+    reasons: list[str] = field(default_factory=list)
+    features: dict[str, Any] = field(default_factory=dict)
+    overridden: bool = False
+    # False en modo sombra: la decisión se registra pero la petición usa el modelo por defecto.
+    applied: bool = True
+
+
+class ModelRouter:
+    """Elige el nivel de modelo de una petición a partir de rasgos locales."""
+
+    def __init__(
+        self,
+        config: Optional[VertexAIConfig] = None,
+        counter: Optional[TokenCounter] = None,
+        basic_max_score: int = 0,
+        pro_min_score: int = 4,
+    ) -> None:
+        """
+        Args:
+            config: Configuración con el catálogo de niveles y sus presupuestos de contexto.
+            counter: Tokenizador para estimar el tamaño del prompt y del historial.
+            basic_max_score: Puntuación máxima con la que basta el nivel 'basic'.
+            pro_min_score: Puntuación a partir de la cual se usa 'pro'.
+        """
+        self.config = config or vertex_config
+        self.counter = counter or token_counter
+        self.basic_max_score = basic_max_score
+        self.pro_min_score = pro_min_score
+
+    def extract_features(
+        self,
+        prompt: str,
+        history: Optional[Sequence[Any]] = None,
+        has_image: bool = False,
+        has_document: bool = False,
+        language: str = "es",
+    ) -> dict[str, Any]:
+        """Rasgos baratos de la petición (sin llamar a ningún modelo)."""
+        return {
+            "prompt_tokens": self.counter.count(prompt),
+            "has_code": bool(_CODE_RE.search(prompt)),
+            "asks_reasoning": bool(_REASONING_RE.search(prompt)),
+            "history_turns": len(history or []),
+            "has_image": has_image,
+            "has_document": has_document,
+            "language": language,
+        }
+
+    def route(
+        self,
+        prompt: str,
+        history: Optional[Sequence[Any]] = None,
+        has_image: bool = False,
+        has_document: bool = False,
+        language: str = "es",
+        override: Optional[str] = None,
+        context_tokens: int = 0,
+    ) -> RoutingDecision:
+        """
+        Clasifica una petición.
+
+        Args:
+            prompt: Mensaje (o prompt final) de la petición.
+            history: Historial que la acompaña.
+            has_image: Si lleva imagen.
+            has_document: Si lleva un documento (PDF) como contexto.
+            language: Idioma de la respuesta.
+            override: Nivel impuesto por la ruta o por el usuario; se respeta si existe.
+            context_tokens: Tokens de contexto adicional (documento, historial) que deben caber en
+                el presupuesto del nivel elegido.
+        """
+        features = self.extract_features(prompt, history, has_image, has_document, language)
+
+        if override in self.config.models:
+            decision = RoutingDecision(override, 0, ["override"], features, overridden=True)
+            self._log(decision)
+            return decision
+
+        score, reasons = self.score(features)
+        if score <= self.basic_max_score:
+            model_type = "basic"
+        elif score >= self.pro_min_score:
+            model_type = "pro"
+        else:
+            model_type = "fast"
+
+        # Subir de nivel si el contexto no cabe en el presupuesto del elegido.
+        needed = features["prompt_tokens"] + context_tokens
+        while model_type != TIERS[-1] and needed > self.config.get_context_budget(model_type):
+            model_type = TIERS[TIERS.index(model_type) + 1]
+            reasons.append("contexto")
+
+        decision = RoutingDecision(model_type, score, reasons, features)
+        self._log(decision)
+        return decision
+
+    @staticmethod
+    def score(features: dict[str, Any]) -> tuple[int, list[str]]:
+        """Puntuación de complejidad de una petición (ver `extract_features`) y los motivos que suman."""
+        prompt_tokens = features["prompt_tokens"]
+        rules = (
+            (prompt_tokens > 400, 2, "prompt_largo"),
+            (60 < prompt_tokens <= 400, 1, "prompt_medio"),
+            (features["has_code"], 2, "codigo"),
+            (features["asks_reasoning"], 2, "razonamiento"),
+            (features["has_image"] or features["has_document"], 1, "adjunto"),
+            (features["history_turns"] > 10, 1, "historial_largo"),
+            (features["language"] not in ("es", "en"), 1, "idioma"),
+        )
+        score = 0
+        reasons: list[str] = []
+        for matched, points, reason in rules:
+            if matched:
+                score += points
+                reasons.append(reason)
+        return score, reasons
+
+    @staticmethod
+    def _log(decision: RoutingDecision) -> None:
+        metrics_manager.increment_counter(f"router_decisions_{decision.model_type}")
+        logger.info(
+            "🧭 Enrutado a '%s' (puntuación %d, motivos: %s, tokens: %d)",
+            decision.model_type,
+            decision.score,
+            ",".join(decision.reasons) or "-",
+            decision.features.get("prompt_tokens", 0),
+        )
+
+    def record_outcome(self, decision: RoutingDecision, latency: float, response_text: Optional[str] = None) -> None:
+        """
+        Registra la latencia y el coste estimado de una petición enrutada, por nivel.
+
+        En modo sombra las métricas llevan el prefijo `router_shadow_`: son la línea base (modelo
+        por defecto) de las peticiones que el enrutador habría mandado a cada nivel.
+        """
+        model_type = decision.model_type
+        prefix = "router" if decision.applied else "router_shadow"
+        metrics_manager.record_timing(f"{prefix}_latency_{model_type}", latency)
+        output_tokens = self.counter.count(response_text)
+        cost = self.config.estimate_cost(decision.features.get("prompt_tokens", 0), output_tokens, model_type)
+        # Los contadores son enteros: el coste se acumula en micro-dólares.
+        metrics_manager.increment_counter(f"{prefix}_cost_microusd_{model_type}", round(cost * 1_000_000))
+
+
+# Instancia global usada por las rutas de chat.
+model_router = ModelRouter()
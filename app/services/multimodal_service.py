@@ -1,13 +1,14 @@
 """Servicio para procesamiento multimodal con Gemini AI."""
 
-import base64
 import logging
+import time
 from pathlib import Path
-from typing import Any, List, Union
+from typing import Any, List, Optional, Union
 
 from vertexai.generative_models import Part
 
 from app.config.vertex_client import VertexAIClient
+from app.services.image_pipeline import ImageDecodeError, ImagePipeline, ImageSource, image_pipeline, read_image_file
 
 logger = logging.getLogger(__name__)
 
@@ -20,40 +21,51 @@ class MultimodalService:
     con capacidad de visión.
     """
 
-    def __init__(self, client: VertexAIClient) -> None:
+    def __init__(self, client: VertexAIClient, pipeline: Optional[ImagePipeline] = None) -> None:
         """
         Inicializa el servicio multimodal.
 
         Args:
             client: Una instancia del VertexAIClient ya inicializado.
+            pipeline: Pipeline de imágenes; por defecto la instancia global.
         """
         if not client or not client.initialized:
             raise ValueError("El VertexAIClient debe ser proporcionado y estar inicializado.")
         self.client = client
+        self.pipeline = pipeline or image_pipeline
         logger.info("✅ Servicio Multimodal inicializado.")
 
     def _create_image_part(self, image_data: Union[str, Path]) -> Part:
         """
         Crea un objeto `Part` de imagen a partir de una ruta de archivo o datos en base64.
-        """
-        if isinstance(image_data, Path) or (isinstance(image_data, str) and Path(image_data).exists()):
-            path = Path(image_data)
-            mime_type = f"image/{path.suffix.lower().strip('.')}"
-            with open(path, "rb") as f:
-                return Part.from_data(f.read(), mime_type=mime_type)
-
-        elif isinstance(image_data, str) and image_data.startswith("data:image"):
-            header, encoded = image_data.split(",", 1)
-            mime_type = header.split(":")[1].split(";")[0]
-            data = base64.b64decode(encoded)
-            return Part.from_data(data, mime_type=mime_type)
 
-        raise ValueError(f"Formato de imagen no válido o ruta no encontrada: {image_data}")
+        La imagen pasa por el pipeline: se reduce a la resolución útil del modelo y se recodifica.
+        """
+        try:
+            processed = self.pipeline.process(self._load_image(image_data))
+        except ImageDecodeError as e:
+            raise ValueError(f"Formato de imagen no válido o ruta no encontrada: {image_data}") from e
+        return Part.from_data(processed.data, mime_type=processed.mime_type)
+
+    @staticmethod
+    def _load_image(image: Union[str, Path]) -> ImageSource:
+        """Bytes de una ruta local; los data URL y el base64 se pasan tal cual al pipeline."""
+        if isinstance(image, str) and image.startswith("data:"):
+            return image
+        try:
+            return read_image_file(image)
+        except ImageDecodeError:
+            if isinstance(image, Path):
+                raise
+            return image
 
     async def generate_response(self, prompt: str, images: List[Union[str, Path]], model_type: str = "pro") -> str:
         """
         Genera una respuesta a partir de un prompt de texto y una lista de imágenes.
 
+        Las imágenes se decodifican, reducen y recodifican en paralelo y se adjuntan como `Part`
+        detrás del prompt.
+
         Args:
             prompt: El prompt de texto.
             images: Una lista de imágenes. Cada elemento puede ser una ruta de archivo (str o Path)
@@ -73,28 +85,33 @@ class MultimodalService:
             elif isinstance(image, (str, Path)):
                 try:
                     if Path(image).exists():
-                        valid_images.append(image)
+                        valid_images.append(read_image_file(image))
                 except (OSError, ValueError):
-                    # Ignorar errores de path inválido
+                    # Ignorar errores de path inválido (ImageDecodeError incluido)
                     pass
 
+        # Decodificar y reducir las imágenes en paralelo; se descartan las que no se pueden leer
+        processed = [image for image in await self.pipeline.process_many(valid_images) if image is not None]
+
         # El servicio multimodal requiere al menos una imagen válida
-        if not valid_images:
+        if not processed:
             logger.warning("No se proporcionaron imágenes válidas.")
             return "Por favor, proporciona al menos una imagen válida para el análisis."
 
-        # Construir el prompt multimodal
-        multimodal_prompt = f"{prompt}\n\nAnaliza las siguientes imágenes:"
-
         try:
-            # Usar el cliente centralizado para generar contenido
-            # El cliente actual solo maneja texto, así que construimos un prompt que mencione las imágenes
             multimodal_prompt = f"{prompt}\n\nAnaliza las siguientes imágenes:"
+            parts = [Part.from_data(image.data, mime_type=image.mime_type) for image in processed]
+            start_time = time.monotonic()
             response_data: dict[str, Any] = await self.client.generate_response(
-                prompt=multimodal_prompt, model_type=model_type, max_tokens=1000
+                prompt=multimodal_prompt, model_type=model_type, max_tokens=1000, parts=parts
             )
+            self.pipeline.record_upstream_latency(processed, time.monotonic() - start_time)
             response_text = response_data["response"]
-            logger.info("Respuesta multimodal generada con éxito.")
+            logger.info(
+                "Respuesta multimodal generada con éxito (%d imágenes, %d bytes ahorrados).",
+                len(processed),
+                sum(image.bytes_saved for image in processed),
+            )
             return response_text
 
         except Exception:
@@ -0,0 +1,178 @@
+"""Caché de respuestas exactas para las generaciones de chat."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from app.core.cache import CacheManager
+from app.core.metrics import metrics_manager
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Normaliza un prompt para que variaciones triviales (espacios, mayúsculas) compartan entrada."""
+    return " ".join(prompt.split()).casefold()
+
+
+def build_cache_key(
+    prompt: str,
+    history: Optional[list[dict[str, Any]]],
+    language: str,
+    model_name: str,
+    generation_config: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Construye la clave de caché de una generación.
+
+    La clave es un hash del prompt normalizado, un resumen del historial, el idioma, el modelo y
+    la configuración de generación: dos peticiones con la misma clave producirían la misma llamada
+    al modelo.
+
+    Returns:
+        Una clave con el prefijo 'gemini:response:'.
+    """
+    history_digest = hashlib.sha256(json.dumps(history or [], sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    material = json.dumps(
+        {
+            "prompt": _normalize_prompt(prompt),
+            "history": history_digest,
+            "language": language,
+            "model": model_name,
+            "config": generation_config or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return "gemini:response:" + hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class BoundedTTLCache:
+    """
+    Almacén LRU con TTL por entrada y número máximo de entradas.
+
+    Las claves salen de los prompts de los usuarios, así que el almacén tiene que estar acotado:
+    al superar `max_entries` se expulsa la entrada usada hace más tiempo, y las caducadas se
+    descartan al leerlas o al hacer sitio.
+    """
+
+    def __init__(self, max_entries: int = 1024, default_ttl: int = 300) -> None:
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (value, now + (ttl or self.default_ttl))
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                # Primero las caducadas; si no basta, las menos usadas.
+                for expired in [k for k, (_, expires_at) in self._entries.items() if expires_at <= now]:
+                    del self._entries[expired]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    metrics_manager.increment_counter("response_cache_evictions")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResponseCache:
+    """
+    Caché opt-in delante de la llamada de generación, con protección contra estampidas.
+
+    Cuando varias peticiones idénticas fallan la caché a la vez, sólo la primera llama al modelo:
+    las demás esperan al lock de su clave y leen el valor que ésta haya guardado.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheManager] = None,
+        default_ttl: int = 300,
+        max_entries: int = 1024,
+    ) -> None:
+        """
+        Inicializa la caché de respuestas.
+
+        Args:
+            backend: Backend de almacenamiento; por defecto, un `BoundedTTLCache` propio de
+                `max_entries` entradas. Sirve cualquier objeto con la interfaz `get(key)` /
+                `set(key, value, ttl)` de CacheManager.
+            default_ttl: TTL en segundos cuando no se indica uno explícito.
+            max_entries: Entradas máximas del almacén por defecto.
+        """
+        self.backend = backend if backend is not None else BoundedTTLCache(max_entries, default_ttl)
+        self.default_ttl = default_ttl
+        self._locks: Dict[str, threading.Lock] = {}
+        self._waiters: Dict[str, int] = {}
+        self._locks_guard = threading.Lock()
+
+    def _acquire_key_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+        lock.acquire()
+        return lock
+
+    def _release_key_lock(self, key: str, lock: threading.Lock) -> None:
+        lock.release()
+        with self._locks_guard:
+            self._waiters[key] -= 1
+            if self._waiters[key] == 0:
+                del self._waiters[key]
+                del self._locks[key]
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: Optional[int] = None,
+    ) -> Any:
+        """
+        Devuelve el valor cacheado para `key` o lo calcula con `compute` y lo guarda.
+
+        Las excepciones de `compute` se propagan y no se cachean.
+
+        Args:
+            key: Clave generada con `build_cache_key`.
+            compute: Función que realiza la generación en caso de fallo de caché.
+            ttl: TTL en segundos para esta entrada.
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            metrics_manager.increment_counter("response_cache_hits")
+            return value
+
+        lock = self._acquire_key_lock(key)
+        try:
+            # Otra petición pudo rellenar la entrada mientras esperábamos el lock.
+            value = self.backend.get(key)
+            if value is not None:
+                metrics_manager.increment_counter("response_cache_hits")
+                metrics_manager.increment_counter("response_cache_stampede_waits")
+                return value
+
+            metrics_manager.increment_counter("response_cache_misses")
+            value = compute()
+            if value is not None:
+                self.backend.set(key, value, ttl or self.default_ttl)
+            return value
+        finally:
+            self._release_key_lock(key, lock)
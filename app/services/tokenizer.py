@@ -0,0 +1,194 @@
+"""
+Conteo de tokens para Gemini.
+
+Los recuentos reales salen del `usage_metadata` de cada respuesta. Para las comprobaciones previas
+a la llamada (límites y coste estimado) se usa un tokenizador local aproximado, con caché LRU por
+segmento (instrucción de sistema, mensajes del historial...) y calibrado con los recuentos reales
+observados. La caché guarda sólo el hash de cada segmento y su recuento, no el texto: los segmentos
+largos (extractos de PDF, prompts únicos) sólo entran cuando se repiten.
+"""
+
+import hashlib
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Palabras (letras/dígitos, incluidos acentos), ideogramas sueltos y cualquier otro símbolo.
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d+|[぀-ヿ㐀-鿿가-힯]|\S", re.UNICODE)
+_CJK_RE = re.compile(r"[぀-ヿ㐀-鿿가-힯]")
+
+
+def _estimate(segment: str) -> int:
+    """
+    Estimación sin calibrar de los tokens de un segmento.
+
+    Aproxima un tokenizador BPE/SentencePiece: las palabras cortas son un token y las largas se
+    parten en trozos de ~4 caracteres; los números, cada 3 dígitos; los símbolos e ideogramas, uno
+    por carácter.
+    """
+    count = 0
+    for piece in _PIECE_RE.findall(segment):
+        if piece.isdigit():
+            count += math.ceil(len(piece) / 3)
+        elif len(piece) == 1 or _CJK_RE.match(piece):
+            count += 1
+        else:
+            count += max(1, math.ceil(len(piece) / 4))
+    return count
+
+
+class SegmentCountCache:
+    """
+    Caché LRU de recuentos por segmento, indexada por un hash del texto.
+
+    Los segmentos de hasta `max_chars` caracteres se guardan a la primera; los más largos, sólo
+    cuando vuelven a aparecer (se recuerda su hash en una lista LRU aparte de `max_entries`).
+    """
+
+    def __init__(self, max_entries: int = 4096, max_chars: int = 2048) -> None:
+        """
+        Args:
+            max_entries: Número máximo de recuentos (y de hashes de segmentos largos vistos).
+            max_chars: Longitud a partir de la cual un segmento sólo se cachea si se repite.
+        """
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._seen_long: "OrderedDict[bytes, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(segment: str) -> bytes:
+        return hashlib.blake2b(segment.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def count(self, segment: str) -> int:
+        """Recuento sin calibrar del segmento, desde la caché si está."""
+        key = self._key(segment)
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            store = len(segment) <= self.max_chars or key in self._seen_long
+            if not store:
+                self._seen_long[key] = None
+                if len(self._seen_long) > self.max_entries:
+                    self._seen_long.popitem(last=False)
+
+        count = _estimate(segment)
+        if store:
+            with self._lock:
+                self._seen_long.pop(key, None)
+                self._counts[key] = count
+                if len(self._counts) > self.max_entries:
+                    self._counts.popitem(last=False)
+        return count
+
+    def get_stats(self) -> dict[str, int]:
+        """Aciertos, fallos y número de recuentos guardados."""
+        with self._lock:
+            return {"cache_hits": self.hits, "cache_misses": self.misses, "cache_size": len(self._counts)}
+
+    def clear(self) -> None:
+        """Vacía la caché y sus contadores."""
+        with self._lock:
+            self._counts.clear()
+            self._seen_long.clear()
+            self.hits = self.misses = 0
+
+
+_segment_cache = SegmentCountCache()
+
+
+def _raw_count(segment: str) -> int:
+    """Estimación sin calibrar de los tokens de un segmento, con caché por hash."""
+    return _segment_cache.count(segment)
+
+
+class TokenCounter:
+    """Tokenizador aproximado con factor de calibración aprendido de los recuentos reales."""
+
+    def __init__(self, alpha: float = 0.1, min_ratio: float = 0.5, max_ratio: float = 3.0) -> None:
+        """
+        Args:
+            alpha: Peso de cada observación en la media móvil del factor de calibración.
+            min_ratio: Límite inferior del factor (protege de observaciones anómalas).
+            max_ratio: Límite superior del factor.
+        """
+        self.alpha = alpha
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.ratio = 1.0
+        self.observations = 0
+        self._lock = threading.Lock()
+
+    def count(self, text: Optional[str]) -> int:
+        """Estima los tokens de un texto."""
+        if not text:
+            return 0
+        return max(1, round(_raw_count(text) * self.ratio))
+
+    def count_segments(self, segments: Iterable[Optional[str]]) -> int:
+        """
+        Estima los tokens de varios segmentos (p. ej. instrucción de sistema + historial + mensaje).
+
+        Cada segmento se cuenta por separado, así los que se repiten entre peticiones salen de la
+        caché en lugar de volver a tokenizarse.
+        """
+        raw = sum(_raw_count(segment) for segment in segments if segment)
+        return round(raw * self.ratio)
+
+    def calibrate(self, segments: Iterable[Optional[str]], actual_tokens: int) -> None:
+        """
+        Ajusta el factor de calibración con el recuento real de una petición.
+
+        Args:
+            segments: Los segmentos de texto que se enviaron.
+            actual_tokens: El `prompt_token_count` devuelto por el modelo.
+        """
+        raw = sum(_raw_count(segment) for segment in segments if segment)
+        if raw <= 0 or actual_tokens <= 0:
+            return
+        observed = min(max(actual_tokens / raw, self.min_ratio), self.max_ratio)
+        with self._lock:
+            if self.observations == 0:
+                self.ratio = observed
+            else:
+                self.ratio += self.alpha * (observed - self.ratio)
+            self.observations += 1
+
+    def get_stats(self) -> dict[str, Any]:
+        """Factor de calibración actual y uso de la caché de segmentos."""
+        return {"ratio": self.ratio, "observations": self.observations, **_segment_cache.get_stats()}
+
+
+def usage_from_response(response: Any) -> Optional[Tuple[int, int]]:
+    """
+    Extrae (tokens de entrada, tokens de salida) del `usage_metadata` de una respuesta.
+
+    Returns:
+        None si la respuesta no trae recuentos (p. ej. en algunos errores o respuestas simuladas).
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if not isinstance(prompt_tokens, int) or isinstance(prompt_tokens, bool):
+        return None
+    if not isinstance(output_tokens, int) or isinstance(output_tokens, bool):
+        output_tokens = 0
+    return prompt_tokens, output_tokens
+
+
+# Instancia global: el factor de calibración se comparte entre todos los servicios del proceso.
+token_counter = TokenCounter()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📦 GENERACIÓN POR LOTES (JSONL) - GEMINI AI CHATBOT
+
+Ejecuta trabajos offline de generación (evaluaciones, enriquecimiento...) contra
+`VertexAIClient.generate_response`, sin pasar por la API web:
+- Lee los prompts de un JSONL: {"id": ..., "prompt": ..., "model_type"?, "max_tokens"?, "temperature"?}
+- Concurrencia asíncrona y límite de peticiones por segundo configurables
+- Escribe cada resultado en un JSONL de salida según termina
+- Guarda un checkpoint para que una ejecución interrumpida continúe donde se quedó
+- Resume throughput, errores y coste al terminar
+
+USO:
+    python scripts/batch_generate.py prompts.jsonl resultados.jsonl --concurrency 16 --rate 10
+    python scripts/batch_generate.py prompts.jsonl resultados.jsonl --stub   # backend local de pruebas
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Cada cuántos resultados se reescribe el checkpoint.
+CHECKPOINT_EVERY = 50
+
+# Latencias que se conservan (muestreo de reservorio) para los percentiles del resumen.
+LATENCY_SAMPLE_SIZE = 10000
+
+
+class StubClient:
+    """
+    Backend local con la misma interfaz que `VertexAIClient.generate_response`.
+
+    Responde de forma determinista sin red, con latencia y tasa de errores opcionales, para
+    probar el runner y dimensionar la concurrencia.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0) -> None:
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    async def generate_response(
+        self, prompt: str, model_type: str = "fast", max_tokens: int = 1000, temperature: float = 0.7, **kwargs
+    ) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        if digest[0] / 255 < self.failure_rate:
+            raise RuntimeError("Error simulado del backend stub")
+        input_tokens = max(1, len(prompt) // 4)
+        output_tokens = min(max_tokens, 16)
+        return {
+            "response": f"[stub] {prompt[:80]}",
+            "model": "stub",
+            "model_type": model_type,
+            "tokens_used": input_tokens + output_tokens,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost": 0.0,
+            "response_time": self.latency,
+            "source": "stub",
+            "success": True,
+        }
+
+
+class AsyncRateLimiter:
+    """Espacia los inicios de petición para no superar `rate` peticiones por segundo."""
+
+    def __init__(self, rate: Optional[float]) -> None:
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class JobStats:
+    """Contadores acumulados del trabajo (se guardan en el checkpoint entre ejecuciones)."""
+
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    elapsed_seconds: float = 0.0
+    latencies: list = field(default_factory=list)
+
+    def record(self, result: Dict[str, Any]) -> None:
+        if result["status"] == "ok":
+            self.succeeded += 1
+            self.input_tokens += result.get("input_tokens") or 0
+            self.output_tokens += result.get("output_tokens") or 0
+            self.cost += result.get("cost") or 0.0
+        else:
+            self.failed += 1
+        completed = self.succeeded + self.failed
+        if len(self.latencies) < LATENCY_SAMPLE_SIZE:
+            self.latencies.append(result["latency_ms"])
+        else:
+            index = random.randrange(completed)
+            if index < LATENCY_SAMPLE_SIZE:
+                self.latencies[index] = result["latency_ms"]
+
+    def summary(self) -> Dict[str, Any]:
+        completed = self.succeeded + self.failed
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0
+
+        return {
+            "completed": completed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "error_rate": round(self.failed / completed, 4) if completed else 0.0,
+            "elapsed_seconds": round(self.elapsed_seconds, 2),
+            "throughput_per_second": round(completed / self.elapsed_seconds, 2) if self.elapsed_seconds else 0.0,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost, 6),
+        }
+
+
+class BatchJob:
+    """
+    Trabajo de generación por lotes reanudable.
+
+    El JSONL de salida es el registro duradero: cada línea se escribe y se vacía al terminar su
+    elemento. El checkpoint (`<salida>.checkpoint.json`) guarda la marca de agua (líneas de
+    entrada anteriores ya completadas todas) y los contadores, para reanudar sin volver a leer
+    el trabajo hecho; los ids ya presentes en la salida tampoco se repiten.
+    """
+
+    def __init__(
+        self,
+        input_path: Path,
+        output_path: Path,
+        client: Any,
+        concurrency: int = 8,
+        rate: Optional[float] = None,
+        retry_errors: bool = False,
+        checkpoint_every: int = CHECKPOINT_EVERY,
+    ) -> None:
+        self.input_path = Path(input_path)
+        self.output_path = Path(output_path)
+        self.checkpoint_path = self.output_path.with_name(self.output_path.name + ".checkpoint.json")
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.limiter = AsyncRateLimiter(rate)
+        self.retry_errors = retry_errors
+        self.checkpoint_every = checkpoint_every
+        self.stats = JobStats()
+        self.watermark = 0
+        self._done_lines: Set[int] = set()
+        self._since_checkpoint = 0
+
+    def _load_checkpoint(self) -> Set[str]:
+        """Recupera la marca de agua, los contadores y los ids ya escritos en la salida."""
+        if self.checkpoint_path.exists():
+            state = json.loads(self.checkpoint_path.read_text(encoding="utf-8"))
+            self.watermark = state.get("watermark", 0)
+            self.stats = JobStats(**state.get("stats", {}))
+            self.stats.skipped = 0
+
+        done: Set[str] = set()
+        failed: Set[str] = set()
+        if self.output_path.exists():
+            with self.output_path.open("rb+") as f:
+                content = f.read()
+                # Una caída a mitad de escritura deja una última línea incompleta: se descarta.
+                if content and not content.endswith(b"\n"):
+                    f.truncate(content.rfind(b"\n") + 1)
+                    content = content[: content.rfind(b"\n") + 1]
+            for line in content.decode("utf-8").splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("status") == "ok" or not self.retry_errors:
+                    done.add(str(record.get("id")))
+                else:
+                    failed.add(str(record.get("id")))
+
+        if self.retry_errors:
+            # Los errores quedan por debajo de la marca de agua: se vuelve a recorrer toda la entrada
+            # y los que se reintentan dejan de contar como fallidos.
+            self.watermark = 0
+            self.stats.failed = max(0, self.stats.failed - len(failed - done))
+        return done
+
+    def _save_checkpoint(self) -> None:
+        state = {"input": str(self.input_path), "watermark": self.watermark, "stats": asdict(self.stats)}
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp_path, self.checkpoint_path)
+        self._since_checkpoint = 0
+
+    def _iter_items(self, done: Set[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Recorre la entrada a partir de la marca de agua saltando los elementos ya hechos."""
+        with self.input_path.open(encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                if line_no < self.watermark:
+                    continue
+                if not line.strip():
+                    self._mark_done(line_no)
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    item = {"id": line_no, "prompt": None}
+                item.setdefault("id", line_no)
+                if str(item["id"]) in done:
+                    self.stats.skipped += 1
+                    self._mark_done(line_no)
+                    continue
+                yield line_no, item
+
+    def _mark_done(self, line_no: int) -> None:
+        self._done_lines.add(line_no)
+        while self.watermark in self._done_lines:
+            self._done_lines.discard(self.watermark)
+            self.watermark += 1
+
+    async def _process(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = item.get("prompt")
+        start = time.monotonic()
+        try:
+            if not isinstance(prompt, str) or not prompt.strip():
+                raise ValueError("El elemento no tiene un 'prompt' válido")
+            await self.limiter.wait()
+            start = time.monotonic()
+            result = await self.client.generate_response(
+                prompt,
+                model_type=item.get("model_type", "fast"),
+                max_tokens=item.get("max_tokens", 1000),
+                temperature=item.get("temperature", 0.7),
+            )
+            record = {
+                "id": item["id"],
+                "status": "ok",
+                "response": result.get("response"),
+                "source": result.get("source"),
+                "input_tokens": result.get("input_tokens"),
+                "output_tokens": result.get("output_tokens"),
+                "cost": result.get("cost"),
+            }
+        except Exception as e:
+            record = {"id": item["id"], "status": "error", "error": str(e)}
+        record["latency_ms"] = round((time.monotonic() - start) * 1000)
+        return record
+
+    async def run(self) -> Dict[str, Any]:
+        """Ejecuta (o reanuda) el trabajo y devuelve el resumen acumulado."""
+        done = self._load_checkpoint()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        start = time.monotonic()
+        previous_elapsed = self.stats.elapsed_seconds
+
+        with self.output_path.open("a", encoding="utf-8") as out:
+
+            async def worker() -> None:
+                while True:
+                    entry = await queue.get()
+                    if entry is None:
+                        return
+                    line_no, item = entry
+                    record = await self._process(item)
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    self.stats.record(record)
+                    self._mark_done(line_no)
+                    self._since_checkpoint += 1
+                    if self._since_checkpoint >= self.checkpoint_every:
+                        self.stats.elapsed_seconds = previous_elapsed + time.monotonic() - start
+                        self._save_checkpoint()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                for entry in self._iter_items(done):
+                    await queue.put(entry)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+                self.stats.elapsed_seconds = previous_elapsed + time.monotonic() - start
+                self._save_checkpoint()
+
+        return self.stats.summary()
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    """Imprime el resumen del trabajo."""
+    print("\n📊 Resumen del lote")
+    print(f"   ✅ Correctos:     {summary['succeeded']}")
+    print(f"   ❌ Errores:       {summary['failed']} ({summary['error_rate']:.2%})")
+    print(f"   ⏭️  Ya hechos:     {summary['skipped']}")
+    print(f"   ⚡ Throughput:    {summary['throughput_per_second']} elem/s en {summary['elapsed_seconds']}s")
+    print(f"   ⏱️  Latencia:      p50 {summary['latency_p50_ms']} ms · p95 {summary['latency_p95_ms']} ms")
+    print(f"   🔢 Tokens:        {summary['input_tokens']} entrada · {summary['output_tokens']} salida")
+    print(f"   💰 Coste:         ${summary['cost_usd']:.4f}")
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generación offline por lotes desde un JSONL")
+    parser.add_argument("input", type=Path, help="JSONL de entrada con un prompt por línea")
+    parser.add_argument("output", type=Path, help="JSONL de salida (se añade al existente al reanudar)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Peticiones simultáneas (por defecto 8)")
+    parser.add_argument("--rate", type=float, default=None, help="Máximo de peticiones por segundo")
+    parser.add_argument("--retry-errors", action="store_true", help="Reintentar los elementos que fallaron")
+    parser.add_argument("--stub", action="store_true", help="Usar el backend local de pruebas")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Latencia simulada del stub (s)")
+    parser.add_argument("--stub-failure-rate", type=float, default=0.0, help="Fracción de errores del stub")
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        client: Any = StubClient(latency=args.stub_latency, failure_rate=args.stub_failure_rate)
+    else:
+        from app.config.vertex_client import vertex_client
+
+        client = vertex_client
+
+    job = BatchJob(
+        args.input,
+        args.output,
+        client,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retry_errors=args.retry_errors,
+    )
+    print(f"🚀 Procesando {args.input} → {args.output} (concurrencia {args.concurrency})")
+    try:
+        summary = asyncio.run(job.run())
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrumpido: el checkpoint permite reanudar con el mismo comando.")
+        return 130
+    print_summary(summary)
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
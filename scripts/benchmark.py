@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ MICROBENCHMARKS DEL CAMINO CRÍTICO - GEMINI AI CHATBOT
+
+Mide los componentes en proceso que se ejecutan en cada petición:
+- CacheManager (get/set)
+- MetricsManager (contadores y tiempos)
+- core.security: RateLimiter, LoginAttemptTracker y SecurityAuditor.analyze_request
+- bleach.clean del mensaje en /api/chat/send
+- Expresiones regulares de app/utils/validators.py
+
+Cada benchmark se ejecuta en un hilo (ops/s) y con varios hilos a la vez (1/4/16/64 por defecto)
+para ver la contención de sus locks. Los resultados se guardan en `reports/` y, si existe una línea
+base, se comparan con ella: el script termina con código 1 si algún benchmark baja más de
+`--threshold` respecto a la línea base.
+
+USO:
+    # Guardar la línea base (en la misma máquina en la que se va a comparar)
+    python scripts/benchmark.py --save-baseline
+
+    # Comparar un cambio con la línea base (falla si algo empeora más de un 20 %)
+    python scripts/benchmark.py --threshold 0.2
+
+    # Sólo algunos benchmarks
+    python scripts/benchmark.py --only cache_get,bleach_clean --threads 1,16
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_THREADS = "1,4,16,64"
+DEFAULT_BASELINE = os.path.join("reports", "benchmark_baseline.json")
+
+# Operaciones entre consultas al reloj, para que medir no cueste más que lo medido.
+BATCH = 50
+
+CHAT_MESSAGE = (
+    "Hola, necesito ayuda con una función en Python que lea un CSV, agrupe las ventas por región "
+    "y devuelva el total de cada una ordenado de mayor a menor. ¿Puedes explicarme también cómo "
+    "manejar las filas con valores vacíos y <b>probarlo</b> con pytest?"
+)
+REQUEST_BODY = json.dumps({"message": CHAT_MESSAGE, "history": [], "language": "es"})
+
+
+def _identifiers(count: int = 256) -> List[str]:
+    return [f"ip:10.0.{i // 256}.{i % 256}" for i in range(count)]
+
+
+# Cada fábrica prepara el estado y devuelve la operación a medir; recibe el índice del hilo.
+def _cache_get() -> Callable[[int, int], Any]:
+    from app.core.cache import CacheManager
+
+    cache = CacheManager()
+    keys = [f"chat:{i}" for i in range(256)]
+    for key in keys:
+        cache.set(key, {"response": CHAT_MESSAGE})
+    return lambda thread, i: cache.get(keys[i & 255])
+
+
+def _cache_set() -> Callable[[int, int], Any]:
+    from app.core.cache import CacheManager
+
+    cache = CacheManager()
+    keys = [f"chat:{i}" for i in range(256)]
+    return lambda thread, i: cache.set(keys[i & 255], CHAT_MESSAGE)
+
+
+def _metrics_increment() -> Callable[[int, int], Any]:
+    from app.core.metrics import MetricsManager
+
+    metrics = MetricsManager()
+    return lambda thread, i: metrics.increment_counter("requests")
+
+
+def _metrics_record_timing() -> Callable[[int, int], Any]:
+    from app.core.metrics import MetricsManager
+
+    metrics = MetricsManager()
+    return lambda thread, i: metrics.record_timing("stream_ttft", 0.25)
+
+
+def _rate_limiter() -> Callable[[int, int], Any]:
+    from app.core.security import RateLimiter
+
+    # Límite inalcanzable: se mide el coste de la comprobación, no el rechazo.
+    limiter = RateLimiter(max_requests=10**9)
+    identifiers = _identifiers()
+    return lambda thread, i: limiter.is_allowed(identifiers[(thread * 31 + i) & 255])
+
+
+def _login_tracker() -> Callable[[int, int], Any]:
+    from app.core.security import LoginAttemptTracker
+
+    tracker = LoginAttemptTracker(max_attempts=10**9)
+    identifiers = _identifiers()
+
+    def op(thread: int, i: int) -> None:
+        identifier = identifiers[(thread * 31 + i) & 255]
+        if not tracker.is_locked(identifier):
+            tracker.record_failed_attempt(identifier)
+            tracker.record_successful_attempt(identifier)
+
+    return op
+
+
+def _security_analyze() -> Callable[[int, int], Any]:
+    from app.core.security import SecurityAuditor
+
+    auditor = SecurityAuditor()
+    return lambda thread, i: auditor.analyze_request(REQUEST_BODY)
+
+
+def _bleach_clean() -> Callable[[int, int], Any]:
+    import bleach
+
+    return lambda thread, i: bleach.clean(CHAT_MESSAGE.strip())
+
+
+def _validate_message() -> Callable[[int, int], Any]:
+    from app.utils.validators import validate_message_content
+
+    return lambda thread, i: validate_message_content(CHAT_MESSAGE)
+
+
+def _sanitize_input() -> Callable[[int, int], Any]:
+    from app.utils.validators import sanitize_input
+
+    return lambda thread, i: sanitize_input(CHAT_MESSAGE)
+
+
+def _validate_email() -> Callable[[int, int], Any]:
+    from app.utils.validators import validate_email
+
+    return lambda thread, i: validate_email("usuario.prueba@example.com")
+
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[int, int], Any]]] = {
+    "cache_get": _cache_get,
+    "cache_set": _cache_set,
+    "metrics_increment": _metrics_increment,
+    "metrics_record_timing": _metrics_record_timing,
+    "rate_limiter_is_allowed": _rate_limiter,
+    "login_attempt_tracker": _login_tracker,
+    "security_analyze_request": _security_analyze,
+    "bleach_clean": _bleach_clean,
+    "validate_message_content": _validate_message,
+    "sanitize_input": _sanitize_input,
+    "validate_email": _validate_email,
+}
+
+
+def measure(factory: Callable[[], Callable[[int, int], Any]], threads: int, duration: float) -> float:
+    """
+    Ops/s agregadas de `threads` hilos ejecutando la operación durante `duration` segundos.
+
+    El estado se prepara de nuevo en cada medida para que no arrastre datos de la anterior.
+    """
+    op = factory()
+    counts = [0] * threads
+    barrier = threading.Barrier(threads + 1)
+    stop = threading.Event()
+
+    def worker(index: int) -> None:
+        done = 0
+        barrier.wait()
+        while not stop.is_set():
+            for i in range(done, done + BATCH):
+                op(index, i)
+            done += BATCH
+        counts[index] = done
+
+    workers = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for worker_thread in workers:
+        worker_thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def run_benchmarks(names: List[str], thread_counts: List[int], duration: float, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Ejecuta los benchmarks y devuelve {benchmark: {"<hilos>": ops/s}}.
+
+    Se queda con la mejor de `repeat` medidas: el ruido de la máquina sólo puede restar.
+    """
+    results: Dict[str, Dict[str, float]] = {}
+    for name in names:
+        results[name] = {}
+        for threads in thread_counts:
+            best = max(measure(BENCHMARKS[name], threads, duration) for _ in range(repeat))
+            results[name][str(threads)] = round(best, 1)
+            print(f"  {name:<26}{threads:>4} hilos {best:>14,.0f} ops/s")
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float
+) -> List[Dict[str, Any]]:
+    """Benchmarks que han bajado más de `threshold` (fracción) respecto a la línea base."""
+    regressions = []
+    for name, by_threads in results.items():
+        for threads, ops in by_threads.items():
+            reference = baseline.get(name, {}).get(threads)
+            if not reference:
+                continue
+            change = ops / reference - 1
+            if change < -threshold:
+                regressions.append(
+                    {
+                        "benchmark": name,
+                        "threads": int(threads),
+                        "baseline": reference,
+                        "current": ops,
+                        "change": round(change, 3),
+                    }
+                )
+    return regressions
+
+
+def _machine() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks de los componentes del camino crítico")
+    parser.add_argument("--only", default="", help=f"Benchmarks separados por comas (disponibles: {', '.join(BENCHMARKS)})")
+    parser.add_argument("--threads", default=DEFAULT_THREADS, help=f"Hilos por medida (por defecto {DEFAULT_THREADS})")
+    parser.add_argument("--duration", type=float, default=0.5, help="Segundos por medida")
+    parser.add_argument("--repeat", type=int, default=3, help="Medidas por benchmark (se usa la mejor)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Fichero de la línea base")
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar los resultados como línea base")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Caída máxima tolerada (0.2 = 20 %%)")
+    parser.add_argument("--output", default="reports", help="Directorio (o fichero .json) de los resultados")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.only.split(",") if name.strip()] or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Benchmarks desconocidos: {', '.join(unknown)}")
+    thread_counts = [int(value) for value in args.threads.split(",") if value.strip()]
+
+    # Los componentes registran a nivel DEBUG/WARNING en el camino medido; el log no es lo que se mide.
+    logging.disable(logging.CRITICAL)
+    print(f"⏱️ Ejecutando {len(names)} benchmarks con {args.threads} hilos...")
+    results = run_benchmarks(names, thread_counts, args.duration, args.repeat)
+    logging.disable(logging.NOTSET)
+
+    report: Dict[str, Any] = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": _machine(),
+        "config": {"duration_seconds": args.duration, "repeat": args.repeat, "threads": thread_counts},
+        "results": results,
+    }
+
+    baseline_path = Path(args.baseline)
+    regressions: List[Dict[str, Any]] = []
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\n💾 Línea base guardada en {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        if baseline.get("machine") != report["machine"]:
+            print("⚠️ La línea base se midió en otra máquina o versión de Python; la comparación es orientativa")
+        regressions = compare(results, baseline.get("results", {}), args.threshold)
+        report["baseline"] = str(baseline_path)
+        report["threshold"] = args.threshold
+        report["regressions"] = regressions
+    else:
+        print(f"\nℹ️ Sin línea base en {baseline_path}; usa --save-baseline para crearla")
+
+    output = Path(args.output)
+    if output.suffix != ".json":
+        output.mkdir(parents=True, exist_ok=True)
+        output = output / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"📄 Resultados: {output}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regresiones de más del {args.threshold:.0%}:")
+        for item in regressions:
+            print(
+                f"  {item['benchmark']} ({item['threads']} hilos): {item['baseline']:,.0f} -> "
+                f"{item['current']:,.0f} ops/s ({item['change']:+.1%})"
+            )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🏋️ PRUEBA DE CARGA DE LA API DE CHAT - GEMINI AI CHATBOT
+
+Generador de carga asíncrono (sólo biblioteca estándar) guiado por escenarios:
+- anon_chat: /api/chat/send sin autenticar
+- auth_chat: /api/chat/send con JWT e historial creciente por usuario
+- stream_chat: /api/chat/stream, midiendo también el tiempo hasta el primer fragmento
+- pdf_chat: /api/chat/send con un PDF adjunto
+- login_burst: ráfagas de /auth/login simultáneos
+
+Las llegadas son de bucle abierto (proceso de Poisson a `--rate` peticiones por segundo): la
+latencia se mide desde el instante de llegada previsto, de modo que una API saturada no frena al
+generador ni esconde su propia cola. Al terminar escribe en `reports/` un JSON con p50/p95/p99,
+tasa de errores y throughput por escenario.
+
+USO:
+    # App en proceso con el backend simulado de Gemini (resultados deterministas, sin coste)
+    python scripts/load_test.py --serve --rate 20 --duration 60
+
+    # Contra gunicorn (config gthread de deployment/) con el upstream simulado
+    FAKE_GEMINI_ENABLED=True gunicorn -c deployment/gunicorn.conf.py run:app
+    python scripts/load_test.py --url http://localhost:5000 --credentials usuario:Clave123! \\
+        --mix anon_chat=4,auth_chat=2,stream_chat=2,pdf_chat=1,login_burst=1
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MIX = "anon_chat=4,auth_chat=2,stream_chat=2,pdf_chat=1,login_burst=1"
+DEFAULT_PASSWORD = "LoadTest123!"
+
+# Turnos de historial que conserva cada usuario autenticado (pregunta + respuesta).
+HISTORY_MAX_MESSAGES = 20
+
+PROMPTS = [
+    "¿Qué es la programación asíncrona?",
+    "Resume en tres puntos las ventajas de usar caché.",
+    "Escribe una función en Python que invierta una cadena.",
+    "Explica la diferencia entre latencia y throughput.",
+    "¿Cómo funciona un circuit breaker?",
+    "Dame una receta rápida para cenar.",
+]
+
+
+# ---------------------------------------------------------------------------
+# Cliente HTTP/1.1 mínimo sobre asyncio
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class HttpResponse:
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    # Segundos desde el envío hasta que llega el primer fragmento marcado (p. ej. un evento SSE).
+    first_marker: Optional[float] = None
+
+    def json(self) -> Any:
+        return json.loads(self.body.decode("utf-8"))
+
+
+class HttpClient:
+    """Cliente HTTP/1.1 con conexiones keep-alive reutilizables, suficiente para JSON y SSE."""
+
+    def __init__(self, base_url: str, timeout: float = 120.0) -> None:
+        parsed = urlparse(base_url)
+        if parsed.scheme != "http":
+            raise ValueError("Sólo se admiten URLs http:// (usa el puerto interno, sin TLS)")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        json_body: Optional[Any] = None,
+        headers: Optional[Dict[str, str]] = None,
+        marker: Optional[bytes] = None,
+    ) -> HttpResponse:
+        return await asyncio.wait_for(self._request(method, path, json_body, headers or {}, marker), self.timeout)
+
+    async def _request(
+        self, method: str, path: str, json_body: Any, headers: Dict[str, str], marker: Optional[bytes]
+    ) -> HttpResponse:
+        body = json.dumps(json_body).encode("utf-8") if json_body is not None else b""
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        if json_body is not None:
+            lines.append("Content-Type: application/json")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+        reader, writer = self._idle.pop() if self._idle else await asyncio.open_connection(self.host, self.port)
+        start = time.monotonic()
+        try:
+            writer.write(payload)
+            await writer.drain()
+            response, keep_alive = await self._read_response(reader, start, marker)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return response
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader, start: float, marker: Optional[bytes]) -> Tuple[HttpResponse, bool]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("El servidor cerró la conexión sin responder")
+        version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        chunks: List[bytes] = []
+        first_marker: Optional[float] = None
+
+        def observe(data: bytes) -> None:
+            nonlocal first_marker
+            chunks.append(data)
+            if marker and first_marker is None and marker in data:
+                first_marker = time.monotonic() - start
+
+        await HttpClient._read_body(reader, headers, observe)
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        return HttpResponse(int(status), headers, b"".join(chunks), first_marker), keep_alive
+
+    @staticmethod
+    async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str], observe: Callable[[bytes], None]) -> None:
+        """Lee el cuerpo (chunked, con Content-Length o hasta el cierre) pasando cada trozo a `observe`."""
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                observe(await reader.readexactly(size))
+                await reader.readline()
+        elif "content-length" in headers:
+            observe(await reader.readexactly(int(headers["content-length"])))
+        else:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                observe(data)
+            headers["connection"] = "close"
+
+    def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+# ---------------------------------------------------------------------------
+# Estadísticas
+# ---------------------------------------------------------------------------
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(p * len(values)) - 1))]
+
+
+@dataclass
+class ScenarioStats:
+    """Resultados de un escenario (sólo las llegadas posteriores al calentamiento)."""
+
+    requests: int = 0
+    errors: int = 0
+    dropped: int = 0
+    status_counts: Dict[str, int] = field(default_factory=dict)
+    latencies_ms: List[float] = field(default_factory=list)
+    ttft_ms: List[float] = field(default_factory=list)
+
+    def record(self, latency: float, status: str, ok: bool, ttft: Optional[float] = None) -> None:
+        self.requests += 1
+        self.errors += not ok
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.latencies_ms.append(latency * 1000)
+        if ttft is not None:
+            self.ttft_ms.append(ttft * 1000)
+
+    def merge(self, other: "ScenarioStats") -> None:
+        self.requests += other.requests
+        self.errors += other.errors
+        self.dropped += other.dropped
+        for status, count in other.status_counts.items():
+            self.status_counts[status] = self.status_counts.get(status, 0) + count
+        self.latencies_ms.extend(other.latencies_ms)
+        self.ttft_ms.extend(other.ttft_ms)
+
+    def summary(self, window: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies_ms)
+        result: Dict[str, Any] = {
+            "requests": self.requests,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "throughput_rps": round((self.requests - self.errors) / window, 2) if window else 0.0,
+            "status_counts": dict(sorted(self.status_counts.items())),
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                "p50": round(_percentile(latencies, 0.50), 1),
+                "p95": round(_percentile(latencies, 0.95), 1),
+                "p99": round(_percentile(latencies, 0.99), 1),
+                "max": round(latencies[-1], 1) if latencies else 0.0,
+            },
+        }
+        if self.ttft_ms:
+            ttft = sorted(self.ttft_ms)
+            result["ttft_ms"] = {
+                "p50": round(_percentile(ttft, 0.50), 1),
+                "p95": round(_percentile(ttft, 0.95), 1),
+                "p99": round(_percentile(ttft, 0.99), 1),
+            }
+        return result
+
+
+# ---------------------------------------------------------------------------
+# Escenarios
+# ---------------------------------------------------------------------------
+
+
+def make_pdf(text: str) -> bytes:
+    """PDF mínimo de una página con `text` (legible por PyPDF2)."""
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    stream = f"BT /F1 12 Tf 72 720 Td ({escaped}) Tj ET".encode("latin-1", "replace")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R " b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class LoadContext:
+    """Estado compartido por los escenarios: cliente, credenciales, tokens e historiales."""
+
+    def __init__(
+        self, client: HttpClient, credentials: List[Tuple[str, str]], rng: random.Random, login_burst_size: int = 5
+    ) -> None:
+        self.client = client
+        self.credentials = credentials
+        self.rng = rng
+        self.login_burst_size = login_burst_size
+        self.tokens: Dict[str, str] = {}
+        self._login_locks: Dict[str, asyncio.Lock] = {}
+        self.histories: Dict[str, List[Dict[str, Any]]] = {}
+        self.pdf_data = "data:application/pdf;base64," + base64.b64encode(
+            make_pdf("Informe trimestral: las ventas crecieron un 12 por ciento y los costes bajaron.")
+        ).decode("ascii")
+        self._next_user = 0
+
+    def prompt(self) -> str:
+        return self.rng.choice(PROMPTS)
+
+    def next_credential(self) -> Tuple[str, str]:
+        credential = self.credentials[self._next_user % len(self.credentials)]
+        self._next_user += 1
+        return credential
+
+    async def token_for(self, username: str, password: str) -> Optional[str]:
+        """JWT del usuario; se inicia sesión una sola vez por usuario."""
+        async with self._login_locks.setdefault(username, asyncio.Lock()):
+            if username not in self.tokens:
+                response = await self.client.request("POST", "/auth/login", {"username": username, "password": password})
+                if response.status != 200:
+                    return None
+                self.tokens[username] = response.json()["access_token"]
+        return self.tokens[username]
+
+
+# Un escenario devuelve una lista de (latencia desde el envío, estado, ok, ttft) por petición.
+ScenarioResult = List[Tuple[str, bool, Optional[float]]]
+
+
+async def anon_chat(ctx: LoadContext) -> ScenarioResult:
+    response = await ctx.client.request("POST", "/api/chat/send", {"message": ctx.prompt()})
+    return [(str(response.status), response.status == 200, None)]
+
+
+async def auth_chat(ctx: LoadContext) -> ScenarioResult:
+    username, password = ctx.next_credential()
+    token = await ctx.token_for(username, password)
+    if token is None:
+        return [("login_failed", False, None)]
+    history = ctx.histories.setdefault(username, [])
+    message = ctx.prompt()
+    response = await ctx.client.request(
+        "POST",
+        "/api/chat/send",
+        {"message": message, "history": list(history)},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if response.status == 200:
+        history.append({"role": "user", "parts": [{"text": message}]})
+        history.append({"role": "model", "parts": [{"text": response.json().get("response", "")}]})
+        del history[:-HISTORY_MAX_MESSAGES]
+    return [(str(response.status), response.status == 200, None)]
+
+
+async def stream_chat(ctx: LoadContext) -> ScenarioResult:
+    response = await ctx.client.request("POST", "/api/chat/stream", {"message": ctx.prompt()}, marker=b"event: chunk")
+    ok = response.status == 200 and b"event: done" in response.body
+    status = str(response.status) if ok or response.status != 200 else "stream_error"
+    return [(status, ok, response.first_marker)]
+
+
+async def pdf_chat(ctx: LoadContext) -> ScenarioResult:
+    body = {
+        "message": "¿Cuánto crecieron las ventas?",
+        "pdf_context": {"has_pdf": True, "pdf_name": "informe.pdf", "pdf_data": ctx.pdf_data},
+    }
+    response = await ctx.client.request("POST", "/api/chat/send", body)
+    return [(str(response.status), response.status == 200, None)]
+
+
+async def login_burst(ctx: LoadContext) -> ScenarioResult:
+    async def login() -> Tuple[str, bool, Optional[float]]:
+        username, password = ctx.next_credential()
+        response = await ctx.client.request("POST", "/auth/login", {"username": username, "password": password})
+        return str(response.status), response.status == 200, None
+
+    return list(await asyncio.gather(*(login() for _ in range(ctx.login_burst_size))))
+
+
+SCENARIOS: Dict[str, Callable[[LoadContext], Awaitable[ScenarioResult]]] = {
+    "anon_chat": anon_chat,
+    "auth_chat": auth_chat,
+    "stream_chat": stream_chat,
+    "pdf_chat": pdf_chat,
+    "login_burst": login_burst,
+}
+AUTH_SCENARIOS = {"auth_chat", "login_burst"}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'anon_chat=3,stream_chat=1' -> pesos por escenario."""
+    weights: Dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in mix.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Escenario desconocido: {name} (disponibles: {', '.join(SCENARIOS)})")
+        weights[name] = float(weight or 1)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+# ---------------------------------------------------------------------------
+# Generador de carga
+# ---------------------------------------------------------------------------
+
+
+class LoadTest:
+    """Ejecuta la mezcla de escenarios con llegadas de Poisson durante `duration` segundos."""
+
+    def __init__(
+        self,
+        base_url: str,
+        mix: Dict[str, float],
+        rate: float,
+        duration: float,
+        credentials: Optional[List[Tuple[str, str]]] = None,
+        warmup: float = 0.0,
+        max_inflight: int = 1000,
+        timeout: float = 120.0,
+        seed: int = 42,
+        login_burst_size: int = 5,
+    ) -> None:
+        credentials = credentials or []
+        if not credentials and AUTH_SCENARIOS & set(mix):
+            print(f"⚠️ Sin credenciales: se omiten los escenarios {', '.join(sorted(AUTH_SCENARIOS & set(mix)))}")
+            mix = {name: weight for name, weight in mix.items() if name not in AUTH_SCENARIOS}
+        if not mix:
+            raise ValueError("La mezcla de escenarios está vacía")
+        self.base_url = base_url
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.client = HttpClient(base_url, timeout=timeout)
+        self.context = LoadContext(self.client, credentials, random.Random(seed + 1), login_burst_size)
+        self.stats: Dict[str, ScenarioStats] = {name: ScenarioStats() for name in mix}
+        self._inflight = 0
+
+    async def _execute(self, name: str, scheduled: float, measured: bool) -> None:
+        self._inflight += 1
+        try:
+            results = await SCENARIOS[name](self.context)
+        except asyncio.TimeoutError:
+            results = [("timeout", False, None)]
+        except (ConnectionError, OSError) as e:
+            results = [(type(e).__name__, False, None)]
+        finally:
+            self._inflight -= 1
+        # Latencia desde la llegada prevista: incluye la espera si el generador iba con retraso.
+        latency = time.monotonic() - scheduled
+        if measured:
+            for status, ok, ttft in results:
+                self.stats[name].record(latency, status, ok, ttft)
+
+    async def run(self) -> Dict[str, Any]:
+        names, weights = list(self.mix), list(self.mix.values())
+        tasks: List[asyncio.Task] = []
+        start = time.monotonic()
+        measure_from = start + self.warmup
+        end = measure_from + self.duration
+        next_arrival = start
+        while True:
+            next_arrival += self.rng.expovariate(self.rate)
+            if next_arrival >= end:
+                break
+            await asyncio.sleep(max(0.0, next_arrival - time.monotonic()))
+            name = self.rng.choices(names, weights)[0]
+            measured = next_arrival >= measure_from
+            if self._inflight >= self.max_inflight:
+                # Bucle abierto: no se espera a la API; la llegada se cuenta como descartada.
+                if measured:
+                    self.stats[name].dropped += 1
+                continue
+            tasks.append(asyncio.create_task(self._execute(name, next_arrival, measured)))
+        if tasks:
+            await asyncio.wait(tasks, timeout=self.timeout)
+        self.client.close()
+        return self.report(time.monotonic() - measure_from)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Informe JSON; el throughput se calcula sobre la ventana medida, no sobre el drenaje final."""
+        total = ScenarioStats()
+        for stats in self.stats.values():
+            total.merge(stats)
+        return {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "target": self.base_url,
+            "config": {
+                "rate": self.rate,
+                "duration_seconds": self.duration,
+                "warmup_seconds": self.warmup,
+                "mix": self.mix,
+                "max_inflight": self.max_inflight,
+                "timeout_seconds": self.timeout,
+                "seed": self.seed,
+            },
+            "elapsed_seconds": round(elapsed, 2),
+            "scenarios": {name: stats.summary(self.duration) for name, stats in self.stats.items()},
+            "total": total.summary(self.duration),
+        }
+
+
+# ---------------------------------------------------------------------------
+# App en proceso con upstream simulado
+# ---------------------------------------------------------------------------
+
+
+def serve_app(users: int) -> Tuple[str, List[Tuple[str, str]], Callable[[], None]]:
+    """
+    Arranca la app en un hilo con el backend simulado de Gemini y `users` usuarios activos.
+
+    Returns:
+        (URL base, credenciales, función para pararla).
+    """
+    import logging
+    import threading
+
+    from werkzeug.serving import make_server
+
+    os.environ.setdefault("FLASK_ENV", "testing")
+    os.environ.setdefault("FAKE_GEMINI_ENABLED", "True")
+    os.environ.setdefault("FAKE_GEMINI_SEED", "42")
+
+    from app.core.application import get_flask_app
+    from app.models import User, db
+
+    app = get_flask_app("testing")
+    credentials = []
+    with app.app_context():
+        db.create_all()
+        for i in range(users):
+            username = f"loadtest{i}"
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                user = User(username=username, email=f"{username}@example.com", role="user", status="active")
+                user.set_password(DEFAULT_PASSWORD)
+                db.session.add(user)
+            credentials.append((username, DEFAULT_PASSWORD))
+        db.session.commit()
+
+    # Una línea de log por petición distorsiona la medida.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f"http://127.0.0.1:{server.server_port}", credentials, server.shutdown
+
+
+def print_summary(report: Dict[str, Any]) -> None:
+    print(f"\n🏋️ Prueba de carga contra {report['target']} ({report['elapsed_seconds']}s)")
+    print(f"{'escenario':<14}{'peticiones':>11}{'errores':>9}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, summary in [*report["scenarios"].items(), ("TOTAL", report["total"])]:
+        latency = summary["latency_ms"]
+        print(
+            f"{name:<14}{summary['requests']:>11}{summary['errors']:>9}{summary['throughput_rps']:>8}"
+            f"{latency['p50']:>9}{latency['p95']:>9}{latency['p99']:>9}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de chat")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="URL base de una instancia en marcha (p. ej. http://localhost:5000)")
+    target.add_argument("--serve", action="store_true", help="Arrancar la app en proceso con Gemini simulado")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesos de los escenarios (por defecto {DEFAULT_MIX})")
+    parser.add_argument("--rate", type=float, default=10.0, help="Llegadas por segundo (bucle abierto)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos medidos")
+    parser.add_argument("--warmup", type=float, default=0.0, help="Segundos de calentamiento que no se miden")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="Peticiones simultáneas máximas del generador")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout por petición en segundos")
+    parser.add_argument("--credentials", default="", help="usuario:clave separados por comas (escenarios autenticados)")
+    parser.add_argument("--users", type=int, default=10, help="Usuarios que se crean con --serve")
+    parser.add_argument("--login-burst-size", type=int, default=5, help="Logins simultáneos por ráfaga")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla de llegadas y prompts")
+    parser.add_argument("--output", default="reports", help="Directorio (o fichero .json) del informe")
+    args = parser.parse_args(argv)
+
+    stop: Optional[Callable[[], None]] = None
+    credentials = [tuple(item.split(":", 1)) for item in args.credentials.split(",") if ":" in item]
+    if args.serve:
+        base_url, served_credentials, stop = serve_app(args.users)
+        credentials = credentials or served_credentials
+    else:
+        base_url = args.url.rstrip("/")
+
+    try:
+        test = LoadTest(
+            base_url,
+            parse_mix(args.mix),
+            rate=args.rate,
+            duration=args.duration,
+            credentials=credentials,
+            warmup=args.warmup,
+            max_inflight=args.max_inflight,
+            timeout=args.timeout,
+            seed=args.seed,
+            login_burst_size=args.login_burst_size,
+        )
+        report = asyncio.run(test.run())
+    finally:
+        if stop:
+            stop()
+
+    output = Path(args.output)
+    if output.suffix != ".json":
+        output.mkdir(parents=True, exist_ok=True)
+        output = output / f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print_summary(report)
+    print(f"\n📄 Informe: {output}")
+    return 0 if report["total"]["requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
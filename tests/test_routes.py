@@ -16,3 +16,325 @@ def test_api_health_check(client):
     response = client.get("/api/health")
     # Aceptamos 404 si la ruta no está implementada aún
     assert response.status_code in (200, 404)
+
+
+def test_chat_stream_emits_sse_chunks(client, app):
+    """
+    Prueba que /api/chat/stream reenvía los fragmentos del servicio como eventos SSE.
+    """
+    app.config["GEMINI_SERVICE"].generate_response_stream.return_value = iter(["Hola", ", mundo"])
+
+    response = client.post("/api/chat/stream", json={"message": "Hola", "session_id": "s1"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    assert 'event: chunk\ndata: {"text": "Hola"}' in body
+    assert 'data: {"text": ", mundo"}' in body
+    assert body.rstrip().endswith('data: {"session_id": "s1", "chunks": 2}')
+
+
+def test_chat_stream_reports_errors_as_events(client, app):
+    """
+    Prueba que un fallo del modelo durante el streaming se notifica con un evento 'error'.
+    """
+    app.config["GEMINI_SERVICE"].generate_response_stream.side_effect = RuntimeError("upstream caído")
+
+    response = client.post("/api/chat/stream", json={"message": "Hola"})
+
+    assert response.status_code == 200
+    assert "event: error" in response.get_data(as_text=True)
+
+
+def test_chat_stream_validates_input(client):
+    """
+    Prueba que /api/chat/stream valida el mensaje igual que /api/chat/send.
+    """
+    response = client.post("/api/chat/stream", json={"message": "  "})
+    assert response.status_code == 400
+
+
+def test_chat_batch_streams_ndjson_results(client, app):
+    """
+    Prueba que /api/chat/batch devuelve una línea NDJSON por elemento y un resumen final.
+    """
+    import json
+
+    app.config["GEMINI_SERVICE"].generate_response.side_effect = lambda **kwargs: f"eco: {kwargs['prompt']}"
+
+    response = client.post(
+        "/api/chat/batch",
+        json={"items": [{"id": "a", "message": "Hola"}, {"id": "b", "message": "  "}, {"message": "Adiós"}]},
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    results = {line["id"]: line for line in lines[:-1]}
+    latency_ms = results["a"]["latency_ms"]
+    assert results["a"] == {"index": 0, "id": "a", "status": "ok", "response": "eco: Hola", "latency_ms": latency_ms}
+    assert results["b"]["status"] == "error"
+    assert results[2]["response"] == "eco: Adiós"
+    assert lines[-1]["status"] == "done"
+    assert lines[-1]["total"] == 3 and lines[-1]["errors"] == 1
+
+
+def test_chat_batch_reports_service_error_responses_as_errors(client, app):
+    """
+    Prueba que un elemento en el que GeminiService devuelve su mensaje de error cuenta como error
+    y no se registra como resultado del enrutador.
+    """
+    import json
+    from unittest.mock import patch
+
+    from app.services.gemini_service import ERROR_RESPONSE_PREFIX
+
+    def generate(**kwargs):
+        if kwargs["prompt"] == "Falla":
+            return f"{ERROR_RESPONSE_PREFIX}: 503 Service Unavailable"
+        return "ok"
+
+    app.config["GEMINI_SERVICE"].generate_response.side_effect = generate
+
+    with patch("app.api.routes.model_router.record_outcome") as record_outcome:
+        items = [{"id": "a", "message": "Hola"}, {"id": "b", "message": "Falla"}]
+        response = client.post("/api/chat/batch", json={"items": items})
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    results = {line["id"]: line for line in lines[:-1]}
+    assert results["a"]["status"] == "ok"
+    assert results["b"]["status"] == "error"
+    assert results["b"]["error"].startswith(ERROR_RESPONSE_PREFIX)
+    assert "response" not in results["b"]
+    assert lines[-1]["errors"] == 1
+    assert record_outcome.call_count == 1
+
+
+def test_chat_batch_respects_per_user_concurrency(client, app):
+    """
+    Prueba que nunca hay más llamadas simultáneas al modelo que el límite por usuario.
+    """
+    import threading
+    import time
+
+    app.config["BATCH_MAX_CONCURRENCY_PER_USER"] = 2
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def slow_generate(**kwargs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return "ok"
+
+    app.config["GEMINI_SERVICE"].generate_response.side_effect = slow_generate
+
+    from app.api import routes
+
+    routes._batch_slots.clear()  # el semáforo se crea con el límite vigente en su primer uso
+    response = client.post("/api/chat/batch", json={"items": [{"message": f"m{i}"} for i in range(6)]})
+
+    assert response.get_data(as_text=True).count('"status": "ok"') == 6
+    assert peak[0] <= 2
+
+    # Terminado el lote, el semáforo del usuario no se queda en el diccionario.
+    import gc
+
+    del response
+    gc.collect()
+    assert len(routes._batch_slots) == 0
+
+
+def test_chat_batch_validates_items(client):
+    """
+    Prueba que el lote vacío o demasiado grande se rechaza con 400.
+    """
+    assert client.post("/api/chat/batch", json={"items": []}).status_code == 400
+    assert client.post("/api/chat/batch", json={"items": [{"message": "x"}] * 51}).status_code == 400
+
+
+def test_chat_batch_applies_model_router(client, app):
+    """
+    Prueba que el nivel del enrutador sólo llega al servicio con MODEL_ROUTER_ENABLED activo y que
+    un invitado no puede imponer el suyo.
+    """
+    service = app.config["GEMINI_SERVICE"]
+    service.generate_response.side_effect = lambda **kwargs: "ok"
+    app.config["MODEL_ROUTER_OVERRIDES"] = {"api_bp.batch_messages": "fast"}
+
+    client.post("/api/chat/batch", json={"items": [{"message": "Hola", "model_type": "pro"}]}).get_data()
+    assert "model_type" not in service.generate_response.call_args.kwargs
+
+    app.config["MODEL_ROUTER_ENABLED"] = True
+    client.post("/api/chat/batch", json={"items": [{"message": "Hola", "model_type": "pro"}]}).get_data()
+    assert service.generate_response.call_args.kwargs["model_type"] == "fast"
+
+
+def test_chat_send_passes_request_deadline(client, app):
+    """
+    Prueba que X-Request-Timeout acorta el plazo que se pasa al servicio.
+    """
+    import time
+
+    service = app.config["GEMINI_SERVICE"]
+    client.post("/api/chat/send", json={"message": "Hola"}, headers={"X-Request-Timeout": "5"})
+
+    remaining = service.generate_response.call_args.kwargs["deadline"] - time.monotonic()
+    assert 0 < remaining <= 5
+
+
+def test_chat_send_accepts_image_hash_on_follow_up_turns(client, app):
+    """
+    Prueba que la respuesta con imagen devuelve su hash y que el turno siguiente puede usarlo en
+    lugar de reenviar la imagen; un hash desconocido pide reenviarla.
+    """
+    import base64
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (10, 10), "orange").save(buffer, format="PNG")
+    data_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+    service = app.config["GEMINI_SERVICE"]
+    service.generate_response.return_value = "Es naranja"
+
+    first = client.post(
+        "/api/chat/send",
+        json={"message": "¿Color?", "image_context": {"has_image": True, "image_data": data_url}},
+    )
+    image_hash = first.get_json()["image_hash"]
+
+    follow_up = client.post(
+        "/api/chat/send",
+        json={"message": "¿Y la forma?", "image_context": {"has_image": True, "image_hash": image_hash}},
+    )
+    assert follow_up.status_code == 200
+    assert service.generate_response.call_args.kwargs["image_data"].digest == image_hash
+
+    missing = client.post(
+        "/api/chat/send",
+        json={"message": "¿Y ahora?", "image_context": {"has_image": True, "image_hash": "f" * 64}},
+    )
+    assert missing.status_code == 404
+    assert missing.get_json()["error"] == "image_not_found"
+
+
+def test_chat_send_uses_image_caption_on_follow_up_turns(client, app):
+    """
+    Prueba que, con la descripción de la imagen ya generada, el turno siguiente va sólo con texto y
+    con historial, y que una pregunta por un detalle visual vuelve a enviar la imagen.
+    """
+    import base64
+    import io
+
+    from PIL import Image
+
+    from app.services.image_captions import image_captions
+    from app.services.image_store import ImageStore
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (10, 10), "teal").save(buffer, format="PNG")
+    data_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+    image_hash = ImageStore.digest(buffer.getvalue())
+    image_captions.set(image_hash, "Un cuadrado verde azulado")
+    app.config["IMAGE_CAPTIONS_ENABLED"] = True
+    service = app.config["GEMINI_SERVICE"]
+    service.generate_response.return_value = "Es un cuadrado"
+    history = [{"role": "user", "parts": [{"text": "Hola"}]}, {"role": "model", "parts": [{"text": "Hola"}]}]
+    image_context = {"has_image": True, "image_data": data_url, "image_name": "cuadrado.png"}
+
+    follow_up = client.post(
+        "/api/chat/send",
+        json={"message": "¿Qué forma tiene?", "history": history, "image_context": image_context},
+    )
+    assert follow_up.status_code == 200
+    kwargs = service.generate_response.call_args.kwargs
+    assert kwargs["image_data"] is None
+    assert kwargs["prompt"] == "¿Qué forma tiene?"
+    assert kwargs["history"][0] == history[0]
+    assert "Un cuadrado verde azulado" in kwargs["history"][-2]["parts"][0]["text"]
+
+    client.post(
+        "/api/chat/send",
+        json={"message": "Mira el borde, ¿de qué color es?", "history": history, "image_context": image_context},
+    )
+    kwargs = service.generate_response.call_args.kwargs
+    assert kwargs["image_data"].digest == image_hash
+    assert kwargs["history"] == []
+
+
+def test_chat_send_treats_image_data_as_base64_never_as_path(client, app, tmp_path):
+    """
+    Prueba que `image_data` nunca se lee como ruta del servidor y que el base64 largo sin prefijo
+    `data:` se sigue aceptando.
+    """
+    import base64
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((64, 64), 40).save(buffer, format="PNG")
+    path = tmp_path / "secreto.png"
+    path.write_bytes(buffer.getvalue())
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    assert len(encoded) > 255
+    app.config["GEMINI_SERVICE"].generate_response.return_value = "Dorado"
+
+    local = client.post(
+        "/api/chat/send",
+        json={"message": "¿Qué es?", "image_context": {"has_image": True, "image_data": str(path)}},
+    )
+    assert local.status_code == 400
+
+    raw = client.post("/api/chat/send", json={"message": "¿Qué es?", "image_context": {"has_image": True, "image_data": encoded}})
+    assert raw.status_code == 200
+
+
+def test_chat_uses_server_history_for_authenticated_sessions(client, app, test_user):
+    """
+    Prueba que, con CHAT_SERVER_HISTORY_ENABLED, /chat/send y /chat/stream usan y guardan el
+    historial de la sesión en la base de datos en lugar del que envía el cliente.
+    """
+    from unittest.mock import patch
+
+    from app.models import ChatMessage, ChatSession
+
+    app.config["CHAT_SERVER_HISTORY_ENABLED"] = True
+    service = app.config["GEMINI_SERVICE"]
+    service.generate_response.return_value = "Me llamo Gemini"
+    service.generate_response_stream.return_value = iter(["Sigo ", "aquí"])
+    forged = [{"role": "user", "parts": [{"text": "historial inventado"}]}]
+
+    with patch("app.api.routes._get_current_identity", return_value=(test_user.id, "user")):
+        client.post("/api/chat/send", json={"message": "¿Cómo te llamas?", "session_id": "sesion-1", "history": forged})
+        assert service.generate_response.call_args.kwargs["history"] == []
+
+        client.post("/api/chat/stream", json={"message": "¿Sigues ahí?", "session_id": "sesion-1", "history": forged}).get_data()
+        history = service.generate_response_stream.call_args.kwargs["history"]
+
+    assert [turn["parts"][0]["text"] for turn in history] == ["¿Cómo te llamas?", "Me llamo Gemini"]
+    session = ChatSession.query.filter_by(session_id="sesion-1").one()
+    assert session.user_id == test_user.id
+    assert [m.content for m in ChatMessage.query.filter_by(session_id=session.id).order_by(ChatMessage.id)] == [
+        "¿Cómo te llamas?",
+        "Me llamo Gemini",
+        "¿Sigues ahí?",
+        "Sigo aquí",
+    ]
+
+
+def test_chat_send_ignores_malformed_history(client, app):
+    """
+    Prueba que un historial con `parts` mal formado no provoca un 500.
+    """
+    app.config["GEMINI_SERVICE"].generate_response.side_effect = lambda **kwargs: "ok"
+    history = [{"role": "user", "parts": 5}, {"role": "model", "parts": "texto"}, {"role": "user", "parts": [{"text": "hola"}]}]
+
+    response = client.post("/api/chat/send", json={"message": "Hola", "history": history})
+
+    assert response.status_code == 200
+    assert app.config["GEMINI_SERVICE"].generate_response.call_args.kwargs["history"] == [history[2]]
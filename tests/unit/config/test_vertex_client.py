@@ -267,7 +267,9 @@ class TestVertexAIClient:
         result = await self.client.generate_response("test prompt")
 
         assert result["response"] == "Gemini fallback response"
-        assert self.client.fallback_active
+        # Un único error ya no desactiva Vertex AI para siempre: lo registra su circuit breaker.
+        assert not self.client.fallback_active
+        assert self.client.breakers["vertex:fast"].get_stats()["failures"] == 1
         self.client._generate_with_vertex_ai.assert_called_once()
         self.client._generate_with_gemini_api.assert_called_once()
         assert self.client.request_count == 1
@@ -320,7 +322,8 @@ class TestVertexAIClient:
         ):
             await self.client.generate_response("test")
 
-            assert self.client.fallback_active
+            assert not self.client.fallback_active
+            assert self.client.breakers["vertex:fast"].state == "closed"
             self.client.gemini_client.generate_content_async.assert_called_once()
 
     @pytest.mark.asyncio
@@ -396,3 +399,281 @@ class TestVertexAIClient:
             assert result["gemini_api"]["available"]
             assert result["overall_healthy"]
             assert self.client.is_healthy
+
+    def test_generate_response_sync_uses_persistent_loop(self):
+        """Test that the sync wrapper runs on the shared background loop and honours timeouts."""
+        import asyncio
+
+        loops = []
+
+        async def fake_generate(*args, **kwargs):
+            loops.append(asyncio.get_running_loop())
+            return {"response": "ok"}
+
+        self.client.generate_response = fake_generate
+
+        assert self.client.generate_response_sync("hola")["response"] == "ok"
+        assert self.client.generate_response_sync("hola")["response"] == "ok"
+        assert loops[0] is loops[1]
+
+        async def slow_generate(*args, **kwargs):
+            await asyncio.sleep(5)
+
+        self.client.generate_response = slow_generate
+        with pytest.raises(TimeoutError):
+            self.client.generate_response_sync("hola", timeout=0.05)
+
+    @pytest.mark.asyncio
+    async def test_generate_response_coalesces_identical_requests(self):
+        """Test that identical concurrent requests share one upstream call."""
+        import asyncio
+
+        self.client.initialized = True
+        self.client.is_healthy = True
+        self.client.fallback_active = False
+
+        async def slow_vertex(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            return {"response": "shared", "input_tokens": 1, "output_tokens": 1, "cost": 0.0, "response_time": 0.05}
+
+        self.client._generate_with_vertex_ai = AsyncMock(side_effect=slow_vertex)
+
+        results = await asyncio.gather(*(self.client.generate_response("same prompt") for _ in range(4)))
+
+        assert [r["response"] for r in results] == ["shared"] * 4
+        self.client._generate_with_vertex_ai.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_skips_vertex_until_probe_succeeds(self):
+        """Test that an open Vertex circuit routes to Gemini and a background probe closes it."""
+        import asyncio
+
+        self.client.initialized = True
+        self.client.is_healthy = True
+        self.client.fallback_active = False
+        self.client.breaker_settings = {"minimum_calls": 2, "window_size": 2, "open_seconds": 0.0}
+
+        gemini_result = {"response": "gemini", "input_tokens": 1, "output_tokens": 1, "cost": 0.0, "response_time": 0.1}
+        self.client.gemini_client = MagicMock()
+        self.client._generate_with_gemini_api = AsyncMock(return_value=gemini_result)
+        self.client._generate_with_vertex_ai = AsyncMock(side_effect=Exception("Vertex Down"))
+
+        await self.client.generate_response("uno")
+        await self.client.generate_response("dos")
+        breaker = self.client.breakers["vertex:fast"]
+        assert breaker.state == "open"
+
+        # Vertex se ha recuperado: la siguiente petición va a Gemini y lanza la sonda en segundo plano.
+        self.client._generate_with_vertex_ai = AsyncMock(
+            return_value={"response": "vertex", "input_tokens": 1, "output_tokens": 1, "cost": 0.0, "response_time": 0.1}
+        )
+        result = await self.client.generate_response("tres")
+        assert result["response"] == "gemini"
+
+        await asyncio.gather(*self.client._background_tasks)
+        assert breaker.state == "closed"
+        self.client._generate_with_vertex_ai.assert_called_once_with("ping", "fast", 1, 0.0)
+
+        result = await self.client.generate_response("cuatro")
+        assert result["response"] == "vertex"
+
+    @pytest.mark.asyncio
+    async def test_unhealthy_client_reinitializes_in_background(self):
+        """Test that an unhealthy client does not re-run initialize() inside the request."""
+        import asyncio
+        import threading
+
+        self.client._init_attempted = True
+        self.client.is_healthy = False
+        self.client.reinitialize_interval = 0.0
+        release = threading.Event()
+
+        def slow_initialize():
+            release.wait(5)
+            return False
+
+        with patch.object(self.client, "initialize_sync", side_effect=slow_initialize) as mock_init:
+            # La petición falla enseguida aunque la reinicialización siga bloqueada.
+            with pytest.raises(Exception, match="No hay clientes de IA disponibles"):
+                await self.client.generate_response("test")
+            assert len(self.client._background_tasks) == 1
+
+            release.set()
+            await asyncio.gather(*self.client._background_tasks)
+            mock_init.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_hedged_request_uses_faster_gemini_response(self):
+        """Test that a slow Vertex call is hedged to Gemini API and the faster response wins."""
+        import asyncio
+
+        from app.core.metrics import metrics_manager
+
+        metrics_manager.reset_metrics()
+        self.client.initialized = True
+        self.client.is_healthy = True
+        self.client.fallback_active = False
+        self.client.gemini_client = MagicMock()
+        self.client.hedging_settings = {
+            "enabled": True,
+            "percentile": 95,
+            "budget": 1.0,
+            "min_samples": 3,
+            "min_delay_seconds": 0.0,
+        }
+        for _ in range(3):
+            metrics_manager.record_timing("vertex_client_latency_vertex_fast", 0.01)
+
+        vertex_cancelled = asyncio.Event()
+
+        async def slow_vertex(*args, **kwargs):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                vertex_cancelled.set()
+                raise
+
+        self.client._generate_with_vertex_ai = AsyncMock(side_effect=slow_vertex)
+        self.client._generate_with_gemini_api = AsyncMock(
+            return_value={"response": "hedge", "input_tokens": 1, "output_tokens": 1, "cost": 0.0, "response_time": 0.01}
+        )
+
+        result = await asyncio.wait_for(self.client.generate_response("hola"), timeout=2)
+
+        assert result["response"] == "hedge"
+        assert vertex_cancelled.is_set()
+        counters = metrics_manager.get_metrics()["counters"]
+        assert counters["vertex_client_hedges_fired"] == 1
+        assert counters["vertex_client_hedges_won"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_budget_limits_extra_calls(self):
+        """Test that the burst lets hedging start at once and the budget caps the hedges after it."""
+        self.client.hedging_settings = {"budget": 0.05, "burst": 1}
+        assert self.client._hedge_budget_allows()
+        self.client._record_hedge_candidate(True)
+        assert not self.client._hedge_budget_allows()
+
+        for _ in range(19):
+            self.client._record_hedge_candidate(False)
+        assert self.client._hedge_budget_allows()
+        self.client._record_hedge_candidate(True)
+        assert not self.client._hedge_budget_allows()
+
+    def test_hedge_delay_is_cached_between_refreshes(self):
+        """Test that the latency percentile is not recomputed on every request."""
+        from app.core.metrics import metrics_manager
+
+        metrics_manager.reset_metrics()
+        self.client.hedging_settings = {"percentile": 95, "min_samples": 3, "min_delay_seconds": 0.0, "refresh_seconds": 60}
+        assert self.client._hedge_delay("vertex:fast") is None
+        for _ in range(3):
+            metrics_manager.record_timing("vertex_client_latency_vertex_fast", 0.5)
+
+        with patch.object(metrics_manager, "get_timing_stats", wraps=metrics_manager.get_timing_stats) as stats:
+            assert self.client._hedge_delay("vertex:fast") is None
+            stats.assert_not_called()
+            self.client._hedge_delays.clear()
+            assert self.client._hedge_delay("vertex:fast") == 0.5
+            assert self.client._hedge_delay("vertex:fast") == 0.5
+            assert stats.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_gemini_api_uses_usage_metadata_for_tokens(self):
+        """Test that real token counts from usage_metadata replace the local estimate."""
+        response = MagicMock(text="respuesta")
+        response.usage_metadata.prompt_token_count = 42
+        response.usage_metadata.candidates_token_count = 7
+        self.client.gemini_client = MagicMock()
+        self.client.gemini_client.generate_content_async = AsyncMock(return_value=response)
+
+        from app.services.tokenizer import TokenCounter
+
+        with patch("app.config.vertex_client.token_counter", TokenCounter()) as counter:
+            result = await self.client._generate_with_gemini_api("hola")
+            assert counter.observations == 1
+
+        assert result["input_tokens"] == 42
+        assert result["output_tokens"] == 7
+        assert result["tokens_used"] == 49
+
+    @pytest.mark.asyncio
+    async def test_limiter_rejection_does_not_call_or_fail_backends(self):
+        """Test that a local limiter rejection neither reaches the backend nor counts as a breaker failure."""
+        from app.core.adaptive_limiter import AdaptiveLimiter
+        from app.core.retry_policy import RetryPolicy
+
+        self.client.retry_policy = RetryPolicy(max_attempts=1)
+        self.client.initialized = True
+        self.client.is_healthy = True
+        self.client.fallback_active = False
+        self.client.gemini_client = MagicMock()
+        self.client._generate_with_vertex_ai = AsyncMock()
+        self.client._generate_with_gemini_api = AsyncMock()
+        self.client.limiter = AdaptiveLimiter(initial_limit=1)
+        self.client.limiter.acquire()  # el único hueco está ocupado
+
+        with pytest.raises(RuntimeError, match="llamadas simultáneas"):
+            await self.client.generate_response("hola")
+
+        self.client._generate_with_vertex_ai.assert_not_awaited()
+        self.client._generate_with_gemini_api.assert_not_awaited()
+        assert all(breaker.get_stats()["calls"] == 0 for breaker in self.client.breakers.values())
+        assert self.client.limiter.get_stats()["rejections"]["concurrency"] == 2
+
+    @pytest.mark.asyncio
+    async def test_gemini_fallback_retries_transient_errors(self):
+        """Test that the final Gemini API call is retried on transient errors without blocking the loop."""
+        from app.core.retry_policy import RetryPolicy
+
+        self.client.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.001)
+        self.client.initialized = False
+        self.client.is_healthy = True
+        self.client.fallback_active = True
+        self.client.gemini_client = MagicMock()
+        gemini_result = {"response": "ok", "input_tokens": 1, "output_tokens": 1, "cost": 0.0, "response_time": 0.1}
+        self.client._generate_with_gemini_api = AsyncMock(side_effect=[Exception("503 unavailable"), gemini_result])
+
+        result = await self.client.generate_response("hola")
+
+        assert result["response"] == "ok"
+        assert self.client._generate_with_gemini_api.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_fake_backend_serves_requests_offline(self):
+        """Test that FAKE_GEMINI_ENABLED replaces both backends with the simulated model."""
+        from app.config.vertex_ai import VertexAIConfig
+        from app.services.fake_gemini import FakeGenerativeModel
+
+        self.client.config = VertexAIConfig()
+        env = {"FAKE_GEMINI_ENABLED": "True", "FAKE_GEMINI_TTFT_MS": "0", "FAKE_GEMINI_TOKENS_PER_SECOND": "0"}
+        with patch.dict(os.environ, env):
+            assert self.client.initialize_sync()
+
+        assert isinstance(self.client.gemini_client, FakeGenerativeModel)
+        assert not self.client.fallback_active
+        self.mock_genai_configure.assert_not_called()
+
+        result = await self.client.generate_response("hola")
+        assert result["source"] == "vertex_ai"
+        assert result["output_tokens"] > 0
+
+    @pytest.mark.asyncio
+    async def test_gemini_api_sends_image_parts_inline(self):
+        """Test that image parts are sent after the prompt and do not skew the tokenizer calibration."""
+        from vertexai.generative_models import Part
+
+        from app.services.tokenizer import TokenCounter
+
+        response = MagicMock(text="una imagen")
+        response.usage_metadata.prompt_token_count = 300
+        response.usage_metadata.candidates_token_count = 3
+        self.client.gemini_client = MagicMock()
+        self.client.gemini_client.generate_content_async = AsyncMock(return_value=response)
+
+        with patch("app.config.vertex_client.token_counter", TokenCounter()) as counter:
+            await self.client._generate_with_gemini_api("¿Qué es?", parts=[Part.from_data(b"jpeg", mime_type="image/jpeg")])
+            assert counter.observations == 0
+
+        contents = self.client.gemini_client.generate_content_async.await_args.args[0]
+        assert contents == ["¿Qué es?", {"mime_type": "image/jpeg", "data": b"jpeg"}]
@@ -0,0 +1,91 @@
+"""Pruebas para el limitador adaptativo de llamadas al proveedor."""
+
+import pytest
+
+from app.core.adaptive_limiter import AdaptiveLimiter, LimitExceededError
+
+
+def test_rejects_above_concurrency_limit():
+    """Prueba que no se permiten más llamadas simultáneas que el límite actual."""
+    limiter = AdaptiveLimiter(initial_limit=2)
+    limiter.acquire()
+    limiter.acquire()
+
+    with pytest.raises(LimitExceededError) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.reason == "concurrency"
+    assert limiter.get_stats()["rejections"]["concurrency"] == 1
+
+
+def test_enforces_rpm_and_rpd_ceilings():
+    """Prueba los techos de peticiones por minuto y por día."""
+    limiter = AdaptiveLimiter(initial_limit=10, requests_per_minute=2)
+    for _ in range(2):
+        with limiter.lease():
+            pass
+    with pytest.raises(LimitExceededError, match="por minuto"):
+        limiter.acquire()
+
+    limiter = AdaptiveLimiter(initial_limit=10, requests_per_day=1)
+    with limiter.lease():
+        pass
+    with pytest.raises(LimitExceededError, match="diarias"):
+        limiter.acquire()
+
+
+def test_ceilings_are_split_across_workers(monkeypatch):
+    """Prueba que los techos de VertexAIConfig.limits se reparten entre los workers."""
+    monkeypatch.setenv("GUNICORN_WORKERS", "4")
+    limiter = AdaptiveLimiter()
+    limiter.configure_from_limits({"requests_per_minute": 1000, "requests_per_day": 50000}, {"initial_limit": 6})
+
+    stats = limiter.get_stats()
+    assert stats["requests_per_minute"] == 250
+    assert stats["requests_per_day"] == 12500
+    assert stats["limit"] == 6
+
+
+def test_ceilings_default_to_gunicorn_worker_count(monkeypatch):
+    """Prueba que, sin GUNICORN_WORKERS, se reparte entre los workers que arranca gunicorn.conf.py."""
+    monkeypatch.delenv("GUNICORN_WORKERS", raising=False)
+    monkeypatch.setattr("app.core.adaptive_limiter.multiprocessing.cpu_count", lambda: 2)
+    limiter = AdaptiveLimiter()
+    limiter.configure_from_limits({"requests_per_minute": 1000, "requests_per_day": 50000})
+
+    stats = limiter.get_stats()
+    assert stats["requests_per_minute"] == 200
+    assert stats["requests_per_day"] == 10000
+
+
+def test_halves_on_429_and_probes_back_up():
+    """Prueba el AIMD: un 429 reduce a la mitad y las llamadas correctas lo van subiendo."""
+    limiter = AdaptiveLimiter(initial_limit=8, cooldown_seconds=0)
+    limiter.acquire()
+    limiter.release(error=RuntimeError("429 Resource exhausted"))
+    assert limiter.limit == 4
+
+    limiter.acquire()
+    limiter.release(error=RuntimeError("error interno"))
+    assert limiter.limit == 4  # los demás errores son cosa del circuit breaker
+
+    for _ in range(20):
+        for _ in range(4):
+            limiter.acquire()
+        for _ in range(4):
+            limiter.release(latency=0.1)
+    assert limiter.limit > 4
+
+
+def test_backs_off_on_latency_inflation():
+    """Prueba que la latencia reciente muy por encima de la habitual reduce el límite."""
+    limiter = AdaptiveLimiter(initial_limit=16, cooldown_seconds=0, min_latency_samples=5)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    before = limiter.limit
+
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(latency=2.0)
+
+    assert limiter.limit < before
@@ -0,0 +1,80 @@
+"""Pruebas para el event loop persistente (AsyncLoopRunner)."""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.core.async_runner import AsyncLoopRunner
+
+
+@pytest.fixture
+def runner():
+    """Fixture con un runner propio que se detiene al terminar cada prueba."""
+    instance = AsyncLoopRunner(name="test-loop", lag_probe_interval=0.05)
+    yield instance
+    instance.stop()
+
+
+def test_run_returns_coroutine_result(runner):
+    """Prueba que run() ejecuta la corutina y devuelve su resultado."""
+
+    async def add(a, b):
+        await asyncio.sleep(0)
+        return a + b
+
+    assert runner.run(add(2, 3)) == 5
+
+
+def test_loop_is_reused_between_calls(runner):
+    """Prueba que todas las llamadas comparten el mismo loop y el mismo hilo."""
+
+    async def current_loop_and_thread():
+        return asyncio.get_running_loop(), threading.current_thread()
+
+    first = runner.run(current_loop_and_thread())
+    second = runner.run(current_loop_and_thread())
+
+    assert first == second
+    assert first[1] is not threading.current_thread()
+
+
+def test_run_propagates_exceptions(runner):
+    """Prueba que las excepciones de la corutina llegan al llamador."""
+
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        runner.run(fail())
+
+
+def test_run_timeout_cancels_coroutine(runner):
+    """Prueba que un plazo vencido lanza TimeoutError y cancela la tarea en el loop."""
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        runner.run(slow(), timeout=0.05)
+
+    assert cancelled.wait(1)
+    assert runner.get_stats()["pending"] == 0
+
+
+def test_stats_report_running_loop(runner):
+    """Prueba que get_stats refleja el estado del loop."""
+    assert runner.get_stats()["running"] is False
+
+    async def noop():
+        return None
+
+    runner.run(noop())
+    stats = runner.get_stats()
+    assert stats["running"] is True
+    assert stats["pending"] == 0
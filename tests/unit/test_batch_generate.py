@@ -0,0 +1,80 @@
+"""Pruebas para el runner de generación por lotes."""
+
+import asyncio
+import json
+
+from scripts.batch_generate import BatchJob, StubClient, main
+
+
+def _write_prompts(path, count):
+    path.write_text("".join(json.dumps({"id": f"p{i}", "prompt": f"Pregunta {i}"}) + "\n" for i in range(count)))
+
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_runs_all_prompts_against_stub(tmp_path):
+    """Prueba que cada prompt produce una línea de salida y el resumen cuadra."""
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_prompts(source, 20)
+
+    summary = asyncio.run(BatchJob(source, output, StubClient(), concurrency=4).run())
+
+    records = _read(output)
+    assert sorted(r["id"] for r in records) == sorted(f"p{i}" for i in range(20))
+    assert all(r["status"] == "ok" for r in records)
+    assert summary["succeeded"] == 20 and summary["failed"] == 0
+
+
+def test_resumes_after_crash_without_repeating_work(tmp_path):
+    """Prueba que una ejecución interrumpida continúa sin repetir los elementos terminados."""
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_prompts(source, 10)
+
+    class CrashingClient(StubClient):
+        calls = 0
+
+        async def generate_response(self, prompt, **kwargs):
+            CrashingClient.calls += 1
+            if CrashingClient.calls > 4:
+                raise KeyboardInterrupt
+            return await super().generate_response(prompt, **kwargs)
+
+    try:
+        asyncio.run(BatchJob(source, output, CrashingClient(), concurrency=1, checkpoint_every=1).run())
+    except KeyboardInterrupt:
+        pass
+    # Una escritura a medias deja una línea truncada al final de la salida.
+    with output.open("a") as f:
+        f.write('{"id": "p9", "sta')
+
+    client = StubClient()
+    calls = []
+    original = client.generate_response
+
+    async def counting(prompt, **kwargs):
+        calls.append(prompt)
+        return await original(prompt, **kwargs)
+
+    client.generate_response = counting
+    summary = asyncio.run(BatchJob(source, output, client, concurrency=2).run())
+
+    assert len(calls) == 6
+    assert sorted(r["id"] for r in _read(output)) == sorted(f"p{i}" for i in range(10))
+    assert summary["succeeded"] == 10
+
+
+def test_errors_are_recorded_and_retried_on_request(tmp_path):
+    """Prueba que los errores se escriben en la salida y sólo se reintentan con --retry-errors."""
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    source.write_text('{"id": "ok", "prompt": "Hola"}\n{"id": "vacio", "prompt": ""}\n')
+
+    assert main([str(source), str(output), "--stub"]) == 1
+    assert {r["id"]: r["status"] for r in _read(output)} == {"ok": "ok", "vacio": "error"}
+
+    source.write_text('{"id": "ok", "prompt": "Hola"}\n{"id": "vacio", "prompt": "Ahora sí"}\n')
+    summary = asyncio.run(BatchJob(source, output, StubClient(), retry_errors=True).run())
+    assert summary["skipped"] == 1
+    assert summary["succeeded"] == 2 and summary["failed"] == 0
+    assert [r["status"] for r in _read(output)] == ["ok", "error", "ok"]
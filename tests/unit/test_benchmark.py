@@ -0,0 +1,40 @@
+"""Pruebas para la suite de microbenchmarks."""
+
+import json
+
+from scripts.benchmark import BENCHMARKS, compare, main, measure
+
+
+def test_measure_counts_operations_across_threads():
+    """Prueba que la medida agrega las operaciones de todos los hilos."""
+    assert measure(BENCHMARKS["metrics_increment"], threads=4, duration=0.05) > 0
+
+
+def test_compare_flags_only_drops_beyond_threshold():
+    """Prueba que sólo las caídas mayores que el umbral cuentan como regresión."""
+    baseline = {"cache_get": {"1": 1000.0, "4": 1000.0}, "bleach_clean": {"1": 100.0}}
+    results = {"cache_get": {"1": 850.0, "4": 700.0}, "bleach_clean": {"1": 130.0}, "nuevo": {"1": 5.0}}
+
+    regressions = compare(results, baseline, threshold=0.2)
+
+    assert [(r["benchmark"], r["threads"]) for r in regressions] == [("cache_get", 4)]
+    assert regressions[0]["change"] == -0.3
+
+
+def test_main_saves_baseline_and_fails_on_regression(tmp_path):
+    """Prueba el ciclo completo: guardar la línea base y fallar si un benchmark empeora."""
+    baseline = tmp_path / "baseline.json"
+    args = ["--only", "validate_email", "--threads", "1", "--duration", "0.02", "--repeat", "1"]
+    args += ["--baseline", str(baseline), "--output", str(tmp_path / "runs")]
+
+    assert main(args + ["--save-baseline"]) == 0
+    assert main(args + ["--threshold", "0.99"]) == 0
+
+    # Una línea base inalcanzable simula una regresión.
+    data = json.loads(baseline.read_text())
+    data["results"]["validate_email"]["1"] *= 1000
+    baseline.write_text(json.dumps(data))
+
+    assert main(args) == 1
+    report = json.loads(sorted((tmp_path / "runs").glob("benchmark_*.json"))[-1].read_text())
+    assert report["regressions"][0]["benchmark"] == "validate_email"
@@ -0,0 +1,64 @@
+"""Pruebas para el circuit breaker de los backends de IA."""
+
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_stays_closed_below_minimum_calls():
+    """Prueba que no se evalúan umbrales hasta tener suficientes llamadas."""
+    breaker = CircuitBreaker("test", minimum_calls=3)
+    breaker.record_failure()
+    breaker.record_failure()
+
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_on_failure_rate():
+    """Prueba que la tasa de errores de la ventana abre el circuito."""
+    breaker = CircuitBreaker("test", minimum_calls=4, failure_rate_threshold=0.5)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure(RuntimeError("caído"))
+    assert breaker.state == CLOSED
+    breaker.record_failure(RuntimeError("caído"))
+
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.get_stats()["last_error"] == "caído"
+
+
+def test_opens_on_slow_call_rate():
+    """Prueba que las llamadas lentas, aunque tengan éxito, abren el circuito."""
+    breaker = CircuitBreaker("test", minimum_calls=2, slow_call_seconds=1.0, slow_call_rate_threshold=1.0)
+    breaker.record_success(duration=2.0)
+    breaker.record_success(duration=3.0)
+
+    assert breaker.state == OPEN
+
+
+def test_probe_only_after_open_seconds():
+    """Prueba que la sonda sólo se autoriza una vez pasado el tiempo de apertura."""
+    breaker = CircuitBreaker("test", open_seconds=60)
+    breaker.trip()
+
+    assert not breaker.try_begin_probe()
+    breaker.open_seconds = 0
+    assert breaker.try_begin_probe()
+    assert breaker.state == HALF_OPEN
+    # Mientras la sonda está en curso no se lanza otra ni pasa tráfico de usuarios.
+    assert not breaker.try_begin_probe()
+    assert not breaker.allow_request()
+
+
+def test_probe_result_closes_or_reopens():
+    """Prueba las transiciones half_open -> closed y half_open -> open."""
+    breaker = CircuitBreaker("test", open_seconds=0)
+    breaker.trip()
+    breaker.try_begin_probe()
+    breaker.probe_failed(RuntimeError("sigue caído"))
+    assert breaker.state == OPEN
+
+    breaker.try_begin_probe()
+    breaker.probe_succeeded()
+    assert breaker.state == CLOSED
+    assert breaker.get_stats()["calls"] == 0
@@ -0,0 +1,151 @@
+"""Pruebas para el pool de credenciales de Gemini."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services.client_pool import (
+    GEMINI_API,
+    VERTEX_AI,
+    ClientPool,
+    PoolExhaustedError,
+    is_rate_limit_error,
+    parse_vertex_projects,
+)
+
+
+def _pool(keys=("k1", "k2"), **kwargs):
+    pool = ClientPool(**kwargs)
+    pool.configure(api_keys=list(keys))
+    return pool
+
+
+def test_configure_deduplicates_and_parses_projects():
+    """Prueba que las keys repetidas se ignoran y los proyectos se parsean con región por defecto."""
+    pool = ClientPool()
+    pool.configure(api_keys=["a", "b", "a", ""], vertex_projects=parse_vertex_projects("p1:europe-west1, p2"))
+
+    assert pool.size(GEMINI_API) == 2
+    assert pool.size(VERTEX_AI) == 2
+    assert set(pool.get_stats()) == {"gemini_api_0", "gemini_api_1", "vertex_ai_p1_europe_west1", "vertex_ai_p2_us_central1"}
+
+
+def test_acquire_spreads_load_across_credentials():
+    """Prueba que las peticiones concurrentes se reparten entre las keys."""
+    pool = _pool()
+    first = pool.acquire()
+    second = pool.acquire()
+
+    assert first is not second
+    pool.release(first, latency=0.1)
+    pool.release(second, latency=0.1)
+
+
+def test_acquire_prefers_lower_latency():
+    """Prueba que, con la misma cuota, se elige la credencial con menor latencia reciente."""
+    pool = _pool()
+    slow = pool.acquire()
+    fast = pool.acquire()
+    pool.release(slow, latency=5.0)
+    pool.release(fast, latency=0.1)
+
+    assert pool.acquire() is fast
+
+
+def test_rate_limited_credential_enters_cooldown():
+    """Prueba que un 429 saca la credencial de rotación hasta que termina el enfriamiento."""
+    pool = _pool(keys=("k1",), cooldown_seconds=60)
+
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            raise RuntimeError("429 Resource exhausted")
+
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+    stats = pool.get_stats()["gemini_api_0"]
+    assert stats["rate_limited_total"] == 1
+    assert stats["cooldown_remaining_seconds"] > 0
+
+
+def test_non_rate_limit_errors_do_not_cool_down():
+    """Prueba que otros errores se cuentan pero no retiran la credencial."""
+    pool = _pool(keys=("k1",))
+    credential = pool.acquire()
+    pool.release(credential, error=ValueError("bad request"))
+
+    assert pool.acquire() is credential
+    assert pool.get_stats()["gemini_api_0"]["errors_total"] == 1
+
+
+def test_get_stats_reports_utilization():
+    """Prueba que la utilización refleja las peticiones de la ventana respecto a la cuota."""
+    pool = _pool(keys=("k1",), rpm_limit=4)
+    for _ in range(2):
+        with pool.lease():
+            pass
+
+    stats = pool.get_stats()["gemini_api_0"]
+    assert stats["requests_in_window"] == 2
+    assert stats["utilization"] == 0.5
+    assert stats["in_flight"] == 0
+
+
+def test_is_rate_limit_error_detects_api_core_exception():
+    """Prueba la detección de ResourceExhausted del SDK."""
+    from google.api_core import exceptions
+
+    assert is_rate_limit_error(exceptions.ResourceExhausted("quota"))
+    assert not is_rate_limit_error(ValueError("otro error"))
+
+
+@patch("google.generativeai.GenerativeModel")
+def test_gemini_model_uses_credential_key_without_global_configure(mock_model_cls):
+    """Prueba que cada credencial tiene su propio modelo y cliente, sin tocar genai.configure."""
+    pool = _pool()
+    credential = pool.acquire()
+    mock_model_cls.return_value = MagicMock()
+
+    with (
+        patch("google.generativeai.configure") as mock_configure,
+        patch("google.ai.generativelanguage.GenerativeServiceClient") as mock_client,
+        patch("google.ai.generativelanguage.GenerativeServiceAsyncClient"),
+    ):
+        model = pool.gemini_model(credential, "gemini-2.0-flash-001")
+        assert pool.gemini_model(credential, "gemini-2.0-flash-001") is model
+
+    mock_configure.assert_not_called()
+    mock_client.assert_called_once_with(client_options={"api_key": credential.api_key})
+
+
+def test_gemini_model_works_from_worker_threads_without_event_loop():
+    """
+    Prueba con el SDK real que `gemini_model` funciona en un hilo sin bucle de eventos (como los de
+    gunicorn gthread) y que el cliente asíncrono se crea después, dentro del bucle.
+    """
+    import asyncio
+    import threading
+
+    pool = _pool(keys=("k1",))
+    result = {}
+
+    def worker():
+        try:
+            with pool.lease(GEMINI_API) as credential:
+                model = pool.gemini_model(credential, "gemini-2.0-flash-001")
+                result["sync_client"] = model._client
+                result["async_before"] = model._async_client
+                result["async_model"] = asyncio.run(pool.gemini_model_async(credential, "gemini-2.0-flash-001"))
+            result["model"] = model
+        except Exception as e:  # pragma: no cover - el fallo se comprueba abajo
+            result["error"] = e
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join(10)
+
+    assert "error" not in result, result.get("error")
+    assert result["sync_client"] is not None
+    assert result["async_before"] is None
+    assert result["async_model"] is result["model"]
+    assert result["model"]._async_client is not None
+    assert pool.get_stats()["gemini_api_0"]["errors_total"] == 0
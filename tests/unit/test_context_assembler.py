@@ -0,0 +1,66 @@
+"""Pruebas para el ensamblado del historial por presupuesto de tokens."""
+
+from unittest.mock import MagicMock
+
+from app.services.context_assembler import ContextAssembler
+from app.services.tokenizer import TokenCounter
+
+
+def _assembler(budget):
+    config = MagicMock()
+    config.get_context_budget.return_value = budget
+    return ContextAssembler(config=config, counter=TokenCounter())
+
+
+def _msg(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def test_keeps_newest_turns_within_budget():
+    """Prueba que se conservan los turnos más recientes que caben en el presupuesto."""
+    assembler = _assembler(budget=6)
+    history = [_msg("user", "uno dos tres"), _msg("model", "cuatro"), _msg("user", "cinco seis"), _msg("model", "siete")]
+
+    result = assembler.assemble(history)
+
+    assert result == [_msg("user", "cinco seis"), _msg("model", "siete")]
+
+
+def test_reserved_tokens_and_leading_model_turn():
+    """Prueba que se descuenta lo reservado y que el contexto empieza por un turno del usuario."""
+    assembler = _assembler(budget=8)  # hola=1, buenas tardes=4, adiós=2
+    history = [_msg("user", "hola"), _msg("model", "buenas tardes"), _msg("user", "adiós")]
+
+    assert assembler.assemble(history, reserved_tokens=1) == history
+    # Sin sitio para el primer turno del usuario, el turno del modelo inicial se descarta.
+    assert assembler.assemble(history, reserved_tokens=2) == [_msg("user", "adiós")]
+
+
+def test_stops_at_first_message_that_does_not_fit():
+    """Prueba que un mensaje enorme corta el historial en lugar de dejar huecos."""
+    assembler = _assembler(budget=10)
+    history = [_msg("user", "corto"), _msg("model", "palabra " * 50), _msg("user", "último")]
+
+    assert assembler.assemble(history) == [_msg("user", "último")]
+
+
+def test_ignores_malformed_entries():
+    """Prueba que las entradas que no son mensajes se ignoran."""
+    assembler = _assembler(budget=10)
+
+    assert assembler.assemble(["texto suelto", _msg("user", "hola")]) == [_msg("user", "hola")]
+
+
+def test_skips_malformed_client_history():
+    """Prueba que las entradas con `parts` mal formado se descartan en lugar de lanzar TypeError."""
+    assembler = _assembler(budget=100)
+    history = [
+        _msg("user", "hola"),
+        {"role": "model", "parts": 5},
+        {"role": "model", "parts": "texto suelto"},
+        {"role": "model", "parts": ["texto", {"text": 7}, {"text": "vale"}]},
+        "no es un mensaje",
+    ]
+
+    assert assembler.assemble(history) == [history[0], history[3]]
+    assert assembler.message_tokens({"role": "user", "parts": 5}) == 0
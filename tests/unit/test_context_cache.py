@@ -0,0 +1,135 @@
+"""Pruebas para la caché de contexto del proveedor."""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.context_cache import ContextCache
+
+SYSTEM = "Eres un asistente. " * 20
+DOCUMENT = "Texto largo de un PDF con muchas palabras. " * 50
+
+
+class FakeBackend:
+    """Backend en memoria que cuenta las operaciones sobre el proveedor."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+        self.refreshed = []
+        self.deleted = []
+
+    def create(self, model_name, system_instruction, documents, ttl):
+        if self.fail:
+            raise RuntimeError("cache demasiado pequeña")
+        handle = SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+        self.created.append(handle)
+        return handle
+
+    def model_for(self, handle, generation_config=None):
+        return SimpleNamespace(handle=handle)
+
+    def refresh(self, handle, ttl):
+        self.refreshed.append(handle)
+
+    def delete(self, handle):
+        self.deleted.append(handle)
+
+
+def _cache(backend, **kwargs):
+    kwargs.setdefault("min_tokens", 10)
+    return ContextCache(backend=backend, **kwargs)
+
+
+def test_prefix_is_created_once_and_reused():
+    """Prueba que el mismo prefijo se sube una vez y las peticiones siguientes lo reutilizan."""
+    backend = FakeBackend()
+    cache = _cache(backend)
+
+    model, entry = cache.get_model("gemini", SYSTEM, [DOCUMENT])
+    again, same_entry = cache.get_model("gemini", SYSTEM, [DOCUMENT])
+
+    assert len(backend.created) == 1
+    assert again is model and same_entry is entry
+    assert entry.hits == 1
+
+
+def test_small_prefix_is_sent_inline():
+    """Prueba que por debajo del mínimo de tokens no se crea caché."""
+    backend = FakeBackend()
+    cache = _cache(backend, min_tokens=100_000)
+
+    assert cache.get_model("gemini", SYSTEM, [DOCUMENT]) is None
+    assert backend.created == []
+
+
+def test_refresh_near_expiry():
+    """Prueba que el TTL se renueva cuando queda menos que el margen."""
+    backend = FakeBackend()
+    cache = _cache(backend, ttl_seconds=100, refresh_margin_seconds=200)
+
+    cache.get_model("gemini", SYSTEM, [DOCUMENT])
+    cache.get_model("gemini", SYSTEM, [DOCUMENT])
+
+    assert len(backend.refreshed) == 1
+
+
+def test_lru_eviction_deletes_in_provider():
+    """Prueba que al superar max_entries se borra del proveedor la entrada menos usada."""
+    backend = FakeBackend()
+    cache = _cache(backend, max_entries=1)
+
+    _, first = cache.get_model("gemini", SYSTEM, [DOCUMENT])
+    cache.release(first)
+    cache.get_model("gemini", SYSTEM, [DOCUMENT + " otro"])
+
+    assert backend.deleted == [backend.created[0]]
+    assert len(cache.get_stats()["entries"]) == 1
+
+
+def test_evicted_entry_in_use_is_deleted_after_last_release():
+    """Prueba que una entrada expulsada mientras hay peticiones usándola no se borra hasta que terminan."""
+    backend = FakeBackend()
+    cache = _cache(backend, max_entries=1)
+
+    _, first = cache.get_model("gemini", SYSTEM, [DOCUMENT])
+    _, shared = cache.get_model("gemini", SYSTEM, [DOCUMENT])
+    cache.get_model("gemini", SYSTEM, [DOCUMENT + " otro"])
+    assert backend.deleted == []
+
+    cache.release(first)
+    assert backend.deleted == []
+    cache.release(shared)
+    assert backend.deleted == [backend.created[0]]
+
+
+def test_failed_creation_backs_off():
+    """Prueba que tras un fallo no se reintenta la creación hasta pasado el backoff."""
+    backend = FakeBackend(fail=True)
+    cache = _cache(backend)
+    backend.create = MagicMock(side_effect=RuntimeError("error del proveedor"))
+
+    assert cache.get_model("gemini", SYSTEM, [DOCUMENT]) is None
+    assert cache.get_model("gemini", SYSTEM, [DOCUMENT]) is None
+    backend.create.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "usage, expected",
+    [
+        (SimpleNamespace(prompt_token_count=900, cached_content_token_count=800), 800),
+        (SimpleNamespace(prompt_token_count=900), None),
+        (None, 0),
+    ],
+)
+def test_record_usage_accounts_tokens_saved(usage, expected):
+    """Prueba la contabilidad de tokens ahorrados por entrada."""
+    cache = _cache(FakeBackend())
+    _, entry = cache.get_model("gemini", SYSTEM, [DOCUMENT])
+
+    cache.record_usage(entry, SimpleNamespace(usage_metadata=usage))
+
+    expected = entry.tokens if expected is None else expected
+    assert entry.tokens_saved == expected
+    assert cache.get_stats()["total_tokens_saved"] == expected
@@ -49,6 +49,79 @@ class TestConversationMemory(unittest.TestCase):
         self.assertEqual(history[1].role, "model")
         self.assertEqual(history[1].content, "Hola, ¿cómo estás?")
 
+    def test_add_message_fills_tokens(self):
+        """
+        Prueba que los mensajes guardan un recuento de tokens aunque no se indique.
+        """
+        self.memory.add_message("user", "¿Cuál es la capital de Francia?")
+        self.memory.add_message("model", "París.", tokens=3)
+
+        history = self.memory.get_history()
+
+        self.assertGreater(history[0].tokens, 0)
+        self.assertEqual(history[1].tokens, 3)
+
+    def test_get_context_respects_token_budget(self):
+        """
+        Prueba que el contexto se limita por tokens y no por número de mensajes.
+        """
+        from unittest.mock import patch
+
+        self.memory.add_message("user", "palabra " * 100)
+        self.memory.add_message("model", "respuesta larga " * 100)
+        self.memory.add_message("user", "¿Y ahora?")
+        self.memory.add_message("model", "Ahora sí.")
+
+        with patch("app.services.context_assembler.vertex_config.get_context_budget", return_value=20):
+            context = self.memory.get_context()
+
+        self.assertEqual([m["parts"][0]["text"] for m in context], ["¿Y ahora?", "Ahora sí."])
+
+    def test_compaction_summarizes_old_turns_incrementally(self):
+        """
+        Prueba que los turnos antiguos se resumen y que el contexto envía resumen + cola reciente.
+        """
+        from unittest.mock import patch
+
+        prompts = []
+
+        async def fake_summarizer(prompt):
+            prompts.append(prompt)
+            return f"resumen {len(prompts)}"
+
+        self.memory.summarizer = fake_summarizer
+        with (
+            patch("app.services.conversation_memory.COMPACTION_THRESHOLD_TOKENS", 10**6),
+            patch("app.services.conversation_memory.COMPACTION_KEEP_RECENT_TOKENS", 4),
+        ):
+            for i in range(3):
+                self.memory.add_message("user", f"pregunta {i}")
+                self.memory.add_message("model", f"respuesta {i}")
+
+        with (
+            patch("app.services.conversation_memory.COMPACTION_THRESHOLD_TOKENS", 5),
+            patch("app.services.conversation_memory.COMPACTION_KEEP_RECENT_TOKENS", 4),
+        ):
+            self.assertTrue(self.memory.maybe_compact(background=False))
+            self.assertEqual(self.memory.session.summary, "resumen 1")
+            self.assertIn("pregunta 0", prompts[0])
+            self.assertNotIn("pregunta 2", prompts[0])
+
+            context = self.memory.get_context()
+            texts = [m["parts"][0]["text"] for m in context]
+            self.assertIn("resumen 1", texts[0])
+            self.assertEqual(texts[2:], ["pregunta 2", "respuesta 2"])
+
+            # La siguiente compactación parte del resumen anterior y sólo añade lo nuevo.
+            self.memory.add_message("user", "pregunta 3")
+            with patch.object(self.memory, "maybe_compact"):
+                self.memory.add_message("model", "respuesta 3")
+            self.assertTrue(self.memory.maybe_compact(background=False))
+            self.assertIn("resumen 1", prompts[1])
+            self.assertIn("pregunta 2", prompts[1])
+            self.assertNotIn("pregunta 0", prompts[1])
+            self.assertEqual(self.memory.session.summary, "resumen 2")
+
     def test_get_history(self):
         """
         Prueba que el historial se devuelve correctamente.
@@ -0,0 +1,103 @@
+"""Pruebas para el planificador justo de llamadas al modelo."""
+
+import threading
+import time
+
+import pytest
+
+from app.core.fair_scheduler import FairScheduler, SchedulerTimeoutError
+from app.core.metrics import metrics_manager
+
+
+def _enqueue(scheduler, order, owner, role):
+    """Lanza un hilo que espera hueco, anota su turno y lo libera; vuelve cuando ya está en cola."""
+    queued = sum(scheduler.get_stats()["queued_by_role"].values())
+
+    def run():
+        with scheduler.slot(owner, role):
+            order.append(owner)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    deadline = time.monotonic() + 1
+    while sum(scheduler.get_stats()["queued_by_role"].values()) <= queued and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return thread
+
+
+def test_premium_is_served_before_guest():
+    """Prueba que, con cola, el rol de más peso recibe el siguiente hueco aunque llegue después."""
+    scheduler = FairScheduler(max_concurrency=1)
+    order = []
+    scheduler.acquire("holder", "user")
+    threads = [_enqueue(scheduler, order, "invitado", "guest"), _enqueue(scheduler, order, "vip", "premium")]
+
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert order == ["vip", "invitado"]
+
+
+def test_one_user_cannot_monopolize_the_queue():
+    """Prueba que las peticiones de otro usuario se intercalan con las de uno que envía muchas."""
+    scheduler = FairScheduler(max_concurrency=1)
+    order = []
+    scheduler.acquire("holder", "user")
+    threads = [_enqueue(scheduler, order, "ruidoso", "user") for _ in range(3)]
+    threads.append(_enqueue(scheduler, order, "tranquilo", "user"))
+
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert order.index("tranquilo") <= 1
+
+
+def test_per_user_concurrency_cap():
+    """Prueba que un usuario no supera su límite aunque haya capacidad libre."""
+    scheduler = FairScheduler(max_concurrency=10, max_per_user=2)
+    scheduler.acquire("u1")
+    scheduler.acquire("u1")
+
+    with pytest.raises(SchedulerTimeoutError):
+        scheduler.acquire("u1", timeout=0.05)
+    assert scheduler.acquire("u2", timeout=0.05) >= 0
+    assert scheduler.get_stats()["active"] == 3
+
+
+def test_wait_time_is_exported_per_role():
+    """Prueba que la espera en cola se registra como métrica por rol."""
+    metrics_manager.reset_metrics()
+    scheduler = FairScheduler()
+
+    with scheduler.slot("u1", "premium"):
+        pass
+    with scheduler.slot("anon", "desconocido"):
+        pass
+
+    assert metrics_manager.get_timing_stats("scheduler_wait_premium")["count"] == 1
+    assert metrics_manager.get_timing_stats("scheduler_wait_guest")["count"] == 1
+
+
+def test_default_concurrency_leaves_threads_for_the_queue(monkeypatch):
+    """Prueba que, por defecto, la concurrencia es la mitad de los hilos del worker de gunicorn."""
+    monkeypatch.setenv("GUNICORN_THREADS", "4")
+    assert FairScheduler().max_concurrency == 2
+    monkeypatch.setenv("GUNICORN_THREADS", "1")
+    assert FairScheduler().max_concurrency == 1
+
+
+def test_idle_users_are_forgotten_after_release_and_timeout():
+    """Prueba que no quedan etiquetas de usuarios sin peticiones, tampoco tras un timeout en cola."""
+    scheduler = FairScheduler(max_concurrency=1)
+    scheduler.acquire("holder")
+    for i in range(5):
+        with pytest.raises(SchedulerTimeoutError):
+            scheduler.acquire(f"impaciente-{i}", timeout=0.01)
+    scheduler.release("holder")
+    with scheduler.slot("breve"):
+        pass
+
+    assert scheduler._last_finish == {}
+    assert scheduler._queues == {}
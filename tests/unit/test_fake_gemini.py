@@ -0,0 +1,81 @@
+"""Pruebas para el backend simulado de Gemini."""
+
+import asyncio
+import os
+from unittest.mock import patch
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from app.services.fake_gemini import FakeBackendConfig, FakeGenerativeModel
+
+
+def _model(**overrides):
+    config = FakeBackendConfig(ttft_ms=0, tokens_per_second=0, output_tokens=20, chunk_tokens=4, seed=1, **overrides)
+    return FakeGenerativeModel("modelo-falso", config=config)
+
+
+def test_responses_are_deterministic_and_capped():
+    """Prueba que el mismo prompt da la misma respuesta y que se respeta max_output_tokens."""
+    model = _model()
+    first = model.generate_content("Hola")
+    second = _model().generate_content("Hola")
+
+    assert first.text == second.text
+    assert first.text != model.generate_content("Adiós").text
+    assert first.usage_metadata.candidates_token_count == len(first.text.split(" "))
+    assert model.generate_content("Hola", generation_config={"max_output_tokens": 3}).usage_metadata.candidates_token_count == 3
+
+
+def test_stream_and_chat_match_full_response():
+    """Prueba que el streaming reproduce la respuesta completa y que el chat guarda el historial."""
+    model = _model()
+    full = model.start_chat().send_message("Hola").text
+    stream = model.start_chat().send_message("Hola", stream=True)
+
+    assert "".join(chunk.text for chunk in stream) == full
+    assert stream.usage_metadata.candidates_token_count > 0
+
+    chat = model.start_chat()
+    chat.send_message("Hola")
+    assert len(chat.history) == 2
+
+
+@pytest.mark.parametrize(
+    ("overrides", "error"),
+    [
+        ({"error_429_rate": 1.0}, api_exceptions.ResourceExhausted),
+        ({"error_500_rate": 1.0}, api_exceptions.InternalServerError),
+        ({"timeout_rate": 1.0, "timeout_seconds": 0.01}, api_exceptions.DeadlineExceeded),
+    ],
+)
+def test_injects_errors(overrides, error):
+    """Prueba la inyección de 429, 500 y timeouts."""
+    with pytest.raises(error):
+        _model(**overrides).generate_content("Hola")
+
+
+def test_request_timeout_cuts_slow_calls():
+    """Prueba que una llamada más lenta que el timeout de la petición termina en DeadlineExceeded."""
+    model = FakeGenerativeModel(config=FakeBackendConfig(ttft_ms=0, tokens_per_second=1000, output_tokens=200))
+
+    with pytest.raises(api_exceptions.DeadlineExceeded):
+        model.generate_content("Hola", request_options={"timeout": 0.01})
+    with pytest.raises(api_exceptions.DeadlineExceeded):
+        asyncio.run(model.generate_content_async("Hola", request_options={"timeout": 0.01}))
+
+
+def test_gemini_service_uses_fake_backend_without_api_key():
+    """Prueba que GeminiService funciona contra el backend simulado sin API key."""
+    from app.services.gemini_service import GeminiService
+
+    env = {"FAKE_GEMINI_ENABLED": "True", "FAKE_GEMINI_TTFT_MS": "0", "FAKE_GEMINI_TOKENS_PER_SECOND": "0"}
+    with patch.dict(os.environ, env):
+        os.environ.pop("GEMINI_API_KEY", None)
+        os.environ.pop("GOOGLE_API_KEY", None)
+        service = GeminiService()
+        answer = service.generate_response(prompt="Hola")
+
+    assert isinstance(service.model, FakeGenerativeModel)
+    assert answer.startswith("[")
+    assert "".join(service.generate_response_stream(prompt="Hola")) == answer
@@ -259,3 +259,230 @@ class TestGeminiService:
         # Verificar
         # El servicio devuelve "Error en el servicio de IA: API_KEY_INVALID" en caso de excepción
         assert "Error" in result or "autenticación" in result or "API key" in result or "API_KEY_INVALID" in result
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_stream_yields_chunks(self, mock_logger, mock_genai):
+        """Test de streaming: se devuelven los fragmentos con texto y se omiten los vacíos."""
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        mock_model = MagicMock()
+        mock_chat = MagicMock()
+        mock_chat.send_message.return_value = [MagicMock(text="Hola"), MagicMock(text=""), MagicMock(text=" mundo")]
+        mock_model.start_chat.return_value = mock_chat
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        service = GeminiService()
+        chunks = list(service.generate_response_stream(prompt="Hola", history=[{"role": "user", "parts": [{"text": "x"}]}]))
+
+        assert chunks == ["Hola", " mundo"]
+        assert mock_chat.send_message.call_args.kwargs["stream"] is True
+        mock_model.start_chat.assert_called_once_with(history=[{"role": "user", "parts": [{"text": "x"}]}])
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_uses_response_cache(self, mock_logger, mock_genai):
+        """Test de caché: con cache_ttl la segunda petición idéntica no llama al modelo."""
+        from app.core.cache import CacheManager
+        from app.services.response_cache import ResponseCache
+
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        mock_model = MagicMock()
+        mock_chat = MagicMock()
+        mock_chat.send_message.return_value = MagicMock(text="Respuesta cacheable")
+        mock_model.start_chat.return_value = mock_chat
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        service = GeminiService(response_cache=ResponseCache(backend=CacheManager()))
+        first = service.generate_response(prompt="¿Qué es Python?", cache_ttl=60)
+        second = service.generate_response(prompt="¿qué es python?", cache_ttl=60)
+        service.generate_response(prompt="¿Qué es Python?")  # sin cache_ttl: siempre llama al modelo
+
+        assert first == second == "Respuesta cacheable"
+        assert mock_chat.send_message.call_count == 2
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_uses_client_pool(self, mock_logger, mock_genai):
+        """Test del pool de keys: la llamada usa el modelo de la key elegida y registra su uso."""
+        from app.services.client_pool import ClientPool
+
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        pool = ClientPool()
+        pool.configure(api_keys=["key-a", "key-b"])
+        pooled_model = MagicMock()
+        pooled_model.start_chat.return_value.send_message.return_value = MagicMock(text="Respuesta del pool")
+
+        service = GeminiService(client_pool=pool)
+        with patch.object(pool, "gemini_model", return_value=pooled_model) as mock_gemini_model:
+            result = service.generate_response(prompt="Hola")
+
+        assert result == "Respuesta del pool"
+        mock_gemini_model.assert_called_once()
+        service.model.start_chat.assert_not_called()
+        assert sum(stats["requests_total"] for stats in pool.get_stats().values()) == 1
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_uses_context_cache_for_document(self, mock_logger, mock_genai):
+        """Test de caché de contexto: el documento va en el prefijo cacheado y no en el prompt."""
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        cached_model = MagicMock()
+        cached_model.start_chat.return_value.send_message.return_value = MagicMock(text="Según el PDF...")
+        entry = MagicMock()
+        context_cache = MagicMock()
+        context_cache.get_model.return_value = (cached_model, entry)
+
+        service = GeminiService(context_cache=context_cache)
+        result = service.generate_response(prompt="¿De qué trata?", document="Contenido del PDF")
+
+        assert result == "Según el PDF..."
+        context_cache.get_model.assert_called_once_with(service.model_name, service.system_instruction, ["Contenido del PDF"])
+        sent = cached_model.start_chat.return_value.send_message.call_args[0][0]
+        assert sent == "¿De qué trata?"
+        context_cache.record_usage.assert_called_once()
+        context_cache.release.assert_called_once_with(entry)
+
+        # Sin prefijo cacheado el documento se envía en línea.
+        context_cache.get_model.return_value = None
+        service.model.start_chat.return_value.send_message.return_value = MagicMock(text="En línea")
+        service.generate_response(prompt="¿Y el autor?", document="Contenido del PDF")
+        sent = service.model.start_chat.return_value.send_message.call_args[0][0]
+        assert sent == "Contenido del PDF\n\n¿Y el autor?"
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_does_not_retry_invalid_key(self, mock_logger, mock_genai):
+        """Test de reintentos: un error no transitorio no se reintenta."""
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        mock_chat = MagicMock()
+        mock_chat.send_message.side_effect = Exception("API_KEY_INVALID")
+        mock_genai.GenerativeModel.return_value.start_chat.return_value = mock_chat
+
+        result = GeminiService().generate_response(message="Hola")
+
+        assert "API_KEY_INVALID" in result
+        mock_chat.send_message.assert_called_once()
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_uses_model_tier(self, mock_logger, mock_genai):
+        """Test de niveles: model_type elige el modelo del catálogo y limita los tokens de salida."""
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        tier_model = MagicMock()
+        tier_model.start_chat.return_value.send_message.return_value = MagicMock(text="Respuesta básica")
+        service = GeminiService()
+        service._models["modelo-basico"] = tier_model
+        tiers = {"basic": {"name": "modelo-basico", "max_tokens": 512}}
+
+        with patch.dict("app.services.gemini_service.vertex_config.models", tiers, clear=True):
+            result = service.generate_response(prompt="Hola", model_type="basic")
+            mock_genai.types.GenerationConfig.assert_called_with(temperature=0.7, max_output_tokens=512)
+            # Un nivel desconocido usa el modelo por defecto.
+            assert service._resolve_model("desconocido") == (service.model_name, service.generation_config)
+
+        assert result == "Respuesta básica"
+        service.model.start_chat.assert_not_called()
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_stream_stops_when_cancelled(self, mock_logger, mock_genai):
+        """Test de cancelación: el stream se corta al desconectarse el cliente y se mide lo ahorrado."""
+        import threading
+
+        from app.core.metrics import metrics_manager
+
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        metrics_manager.reset_metrics()
+        cancel = threading.Event()
+        upstream = [MagicMock(text="uno"), MagicMock(text="dos"), MagicMock(text="tres")]
+        mock_genai.GenerativeModel.return_value.start_chat.return_value.send_message.return_value = upstream
+
+        service = GeminiService()
+        service._avg_output_tokens = 50.0
+        chunks = []
+        for text in service.generate_response_stream(prompt="Hola", cancel_event=cancel):
+            chunks.append(text)
+            cancel.set()
+
+        assert chunks == ["uno"]
+        counters = metrics_manager.get_metrics()["counters"]
+        assert counters["generations_cancelled_disconnect"] == 1
+        assert 0 < counters["generation_tokens_saved"] < 50
+        metrics_manager.reset_metrics()
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_generate_response_respects_deadline(self, mock_logger, mock_genai):
+        """Test de plazo: la llamada lleva el tiempo restante como timeout y no se hace si ya venció."""
+        import time
+
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        mock_chat = mock_genai.GenerativeModel.return_value.start_chat.return_value
+        mock_chat.send_message.return_value = MagicMock(text="A tiempo")
+        service = GeminiService()
+
+        assert service.generate_response(prompt="Hola", deadline=time.monotonic() + 30) == "A tiempo"
+        assert 0 < mock_chat.send_message.call_args.kwargs["request_options"]["timeout"] <= 30
+
+        mock_chat.send_message.reset_mock()
+        result = service.generate_response(prompt="Otra", deadline=time.monotonic() - 1)
+        assert "Plazo" in result
+        mock_chat.send_message.assert_not_called()
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_image_is_decoded_once_across_retries(self, mock_logger, mock_genai):
+        """Test de imágenes: el data URL se procesa una vez y los reintentos reutilizan los bytes."""
+        import base64
+        import io
+
+        from PIL import Image
+
+        from app.core.retry_policy import RetryPolicy
+        from app.services.image_store import image_store
+
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        buffer = io.BytesIO()
+        Image.new("RGB", (12, 12), "purple").save(buffer, format="PNG")
+        data_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+        model = mock_genai.GenerativeModel.return_value
+        model.generate_content.side_effect = [Exception("503 unavailable"), MagicMock(text="Una imagen morada")]
+        service = GeminiService()
+        service.retry_policy = RetryPolicy(max_attempts=2, base_delay=0.001)
+
+        with patch.object(image_store.pipeline, "process", wraps=image_store.pipeline.process) as process:
+            result = service.generate_response(prompt="¿Qué ves?", image_data=data_url)
+
+        assert result == "Una imagen morada"
+        assert process.call_count <= 1  # 0 si otra prueba ya la guardó en el almacén global
+        contents = model.generate_content.call_args.args[0]
+        assert contents[1] == {"mime_type": "image/png", "data": buffer.getvalue()}
+
+    @patch("app.services.gemini_service.genai")
+    @patch("app.services.gemini_service.logger")
+    def test_image_response_schedules_caption(self, mock_logger, mock_genai):
+        """Test de descripciones: tras responder sobre una imagen se describe una vez con el modelo básico."""
+        import io
+
+        from PIL import Image
+
+        from app.services.image_captions import CaptionCache
+        from app.services.image_store import image_store
+
+        os.environ["GEMINI_API_KEY"] = self.api_key
+        buffer = io.BytesIO()
+        Image.new("RGB", (14, 14), "navy").save(buffer, format="PNG")
+        image = image_store.put(buffer.getvalue())
+        model = mock_genai.GenerativeModel.return_value
+        model.generate_content.side_effect = [MagicMock(text="Es azul marino"), MagicMock(text="Un cuadrado azul marino")]
+        captions = CaptionCache()
+        service = GeminiService(caption_cache=captions)
+
+        futures = []
+        schedule = captions.schedule
+        with patch.object(captions, "schedule", side_effect=lambda *args: futures.append(schedule(*args))):
+            assert service.generate_response(prompt="¿Qué color?", image_data=image) == "Es azul marino"
+
+        futures[0].result(5)
+        assert captions.get(image.digest) == "Un cuadrado azul marino"
+        assert model.generate_content.call_count == 2
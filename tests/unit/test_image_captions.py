@@ -0,0 +1,71 @@
+"""Pruebas para las descripciones de texto de las imágenes."""
+
+import threading
+import time
+
+from app.services.image_captions import CAPTION_MAX_CHARS, CaptionCache, asks_visual_detail, caption_turns
+
+
+def test_schedule_generates_caption_once():
+    """Prueba que la descripción se genera una sola vez aunque se pida varias veces a la vez."""
+    cache = CaptionCache()
+    release = threading.Event()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        release.wait(5)
+        return "  Un gato  naranja\nsobre un sofá azul. "
+
+    future = cache.schedule("abc", generate)
+    assert cache.schedule("abc", generate) is None
+    release.set()
+    future.result(5)
+
+    assert calls == [1]
+    assert cache.get("abc") == "Un gato naranja sobre un sofá azul."
+    assert cache.schedule("abc", generate) is None
+
+
+def test_failed_generation_is_not_cached():
+    """Prueba que un error del modelo no guarda nada y permite reintentarlo después."""
+    cache = CaptionCache()
+
+    def fail():
+        raise RuntimeError("503 unavailable")
+
+    cache.schedule("abc", fail).result(5)
+
+    assert cache.get("abc") is None
+    assert cache.schedule("abc", lambda: "Un perro").result(5) is None
+    assert cache.get("abc") == "Un perro"
+
+
+def test_lru_ttl_and_truncation():
+    """Prueba la expulsión por número de entradas, la caducidad y el recorte de descripciones largas."""
+    cache = CaptionCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", "uno")
+    cache.set("b", "dos")
+    cache.get("a")
+    cache.set("c", "x" * (CAPTION_MAX_CHARS + 100))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "uno"
+    assert len(cache.get("c")) == CAPTION_MAX_CHARS
+
+    cache.configure(ttl_seconds=0.01)
+    cache.set("d", "cuatro")
+    time.sleep(0.02)
+    assert cache.get("d") is None
+
+
+def test_visual_detail_questions_and_caption_turns():
+    """Prueba la detección de preguntas visuales y los turnos que sustituyen a la imagen."""
+    assert asks_visual_detail("¿De qué color es el coche del fondo?")
+    assert asks_visual_detail("Look at the top-left corner")
+    assert not asks_visual_detail("¿Y cuánto costaría algo así?")
+
+    turns = caption_turns("Un gato naranja", "gato.png", "es")
+    assert [turn["role"] for turn in turns] == ["user", "model"]
+    assert "gato.png" in turns[0]["parts"][0]["text"]
+    assert "Un gato naranja" in turns[0]["parts"][0]["text"]
@@ -0,0 +1,112 @@
+"""Pruebas para el pipeline de imágenes multimodales."""
+
+import asyncio
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from app.core.metrics import metrics_manager
+from app.services.image_pipeline import ImageDecodeError, ImagePipeline, read_image_file, read_image_source, size_bucket
+
+
+def _encode(image, fmt, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def test_downscales_and_reencodes_large_photos():
+    """Prueba que una foto grande se reduce al lado máximo y ocupa menos."""
+    raw = _encode(Image.effect_noise((3000, 2000), 64).convert("RGB"), "PNG")
+
+    processed = ImagePipeline(max_side=1000).process(raw)
+
+    assert (processed.width, processed.height) == (1000, 667)
+    assert processed.mime_type == "image/jpeg"
+    assert processed.original_bytes == len(raw)
+    assert processed.bytes_saved > 0
+    assert Image.open(io.BytesIO(processed.data)).size == (1000, 667)
+
+
+def test_keeps_small_supported_images_untouched():
+    """Prueba que una imagen pequeña en un formato soportado se envía tal cual."""
+    raw = _encode(Image.new("RGB", (64, 64), "green"), "JPEG")
+
+    processed = ImagePipeline(max_side=1000).process(raw)
+
+    assert processed.data == raw
+    assert processed.mime_type == "image/jpeg"
+
+
+def test_transparent_images_become_webp():
+    """Prueba que las imágenes con transparencia no pierden el canal alfa."""
+    raw = _encode(Image.new("RGBA", (2000, 100), (255, 0, 0, 128)), "PNG")
+
+    processed = ImagePipeline(max_side=500).process(raw)
+
+    assert processed.mime_type == "image/webp"
+    assert Image.open(io.BytesIO(processed.data)).mode == "RGBA"
+
+
+def test_applies_exif_orientation():
+    """Prueba que se corrige la orientación EXIF antes de enviar la imagen."""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Girada 90 grados
+    raw = _encode(Image.new("RGB", (40, 20)), "JPEG", exif=exif)
+
+    processed = ImagePipeline().process(raw)
+
+    assert (processed.width, processed.height) == (20, 40)
+
+
+def test_read_image_source_never_reads_paths(tmp_path):
+    """Prueba los orígenes admitidos (data URL, base64, bytes) y que una ruta no se lee como archivo."""
+    raw = _encode(Image.new("RGB", (4, 4)), "PNG")
+    path = tmp_path / "img.png"
+    path.write_bytes(raw)
+    encoded = base64.b64encode(raw).decode()
+
+    assert read_image_source(f"data:image/png;base64,{encoded}") == raw
+    assert read_image_source(encoded) == raw
+    assert read_image_source(raw) == raw
+    assert read_image_source("A" * 400) == b"\0" * 300  # base64 largo sin prefijo: sin probar el disco
+    assert read_image_file(path) == raw
+    assert read_image_file(str(path)) == raw
+    with pytest.raises(ImageDecodeError):
+        ImagePipeline().process(str(path))
+    with pytest.raises(ImageDecodeError):
+        read_image_source(path)
+
+
+def test_process_many_runs_in_parallel_and_skips_invalid():
+    """Prueba que el proceso en paralelo conserva el orden y descarta lo que no es una imagen."""
+    metrics_manager.reset_metrics()
+    raws = [_encode(Image.new("RGB", (2000 + i, 100)), "PNG") for i in range(3)]
+
+    results = asyncio.run(ImagePipeline(max_side=500, max_workers=3).process_many([raws[0], b"nope", raws[1], raws[2]]))
+
+    assert results[1] is None
+    assert [r.original_width for r in results if r] == [2000, 2001, 2002]
+    counters = metrics_manager.get_metrics()["counters"]
+    assert counters["image_pipeline_images"] == 3
+    assert counters["image_pipeline_rejected"] == 1
+
+
+def test_invalid_image_raises():
+    """Prueba que un contenido que no es imagen produce ImageDecodeError."""
+    with pytest.raises(ImageDecodeError):
+        ImagePipeline().process(b"no soy una imagen")
+
+
+def test_upstream_latency_is_recorded_per_size_bucket():
+    """Prueba que la latencia del modelo se anota en el tramo del mayor payload."""
+    metrics_manager.reset_metrics()
+    small = ImagePipeline().process(_encode(Image.new("RGB", (8, 8)), "PNG"))
+
+    ImagePipeline.record_upstream_latency([small], 0.5)
+
+    assert size_bucket(len(small.data)) == "lt256k"
+    assert size_bucket(5 * 1024 * 1024) == "gt4m"
+    assert metrics_manager.get_timing_stats("image_pipeline_upstream_latency_lt256k")["count"] == 1
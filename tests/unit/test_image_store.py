@@ -0,0 +1,96 @@
+"""Pruebas para el almacén de imágenes direccionado por contenido."""
+
+import base64
+import io
+import threading
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+from app.services.image_pipeline import ImagePipeline
+from app.services.image_store import ImageNotFoundError, ImageStore
+
+
+def _png(color, size=(16, 16)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _data_url(raw):
+    return "data:image/png;base64," + base64.b64encode(raw).decode()
+
+
+def test_same_image_is_processed_once():
+    """Prueba que una imagen repetida se sirve del almacén sin volver a procesarla."""
+    pipeline = ImagePipeline()
+    store = ImageStore(pipeline=pipeline)
+    raw = _png("red")
+
+    with patch.object(pipeline, "process", wraps=pipeline.process) as process:
+        first = store.put(_data_url(raw))
+        second = store.put(raw)
+
+    assert process.call_count == 1
+    assert first is second
+    assert first.digest == ImageStore.digest(raw)
+    assert store.get(first.digest) is first
+
+
+def test_concurrent_uploads_of_a_new_image_are_coalesced():
+    """Prueba que varias peticiones simultáneas con la misma imagen nueva la procesan una vez."""
+    pipeline = ImagePipeline()
+    store = ImageStore(pipeline=pipeline)
+    raw = _png("blue")
+    release = threading.Event()
+    original = pipeline.process
+
+    def slow_process(source):
+        release.wait(1)
+        return original(source)
+
+    with patch.object(pipeline, "process", side_effect=slow_process) as process:
+        threads = [threading.Thread(target=store.put, args=(raw,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    assert process.call_count == 1
+    assert store.get_stats()["entries"] == 1
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    """Prueba que se expulsa la imagen usada hace más tiempo al superar los límites."""
+    store = ImageStore(max_entries=2)
+    red, green, blue = (store.put(_png(color)) for color in ("red", "green", "blue"))
+
+    assert store.get(red.digest) is None
+    assert store.get(green.digest) is green
+    assert store.get(blue.digest) is blue
+
+    store.configure(max_bytes=len(blue.image.data))
+    assert store.get(green.digest) is None
+    assert store.get_stats()["entries"] == 1
+
+
+def test_entries_expire_after_ttl():
+    """Prueba que una imagen sin usar durante el TTL deja de estar disponible."""
+    store = ImageStore(ttl_seconds=10)
+    with patch("app.services.image_store.time.monotonic", return_value=1000.0):
+        stored = store.put(_png("white"))
+    with patch("app.services.image_store.time.monotonic", return_value=1011.0):
+        assert store.get(stored.digest) is None
+
+
+def test_resolve_image_context():
+    """Prueba que resolve acepta image_data o image_hash y falla con hashes desconocidos."""
+    store = ImageStore()
+    stored = store.resolve({"has_image": True, "image_data": _data_url(_png("black"))})
+
+    assert store.resolve({"has_image": True, "image_hash": stored.digest}) is stored
+    assert store.resolve({"has_image": False, "image_hash": stored.digest}) is None
+    with pytest.raises(ImageNotFoundError):
+        store.resolve({"has_image": True, "image_hash": "0" * 64})
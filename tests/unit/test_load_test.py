@@ -0,0 +1,82 @@
+"""Pruebas para el harness de pruebas de carga."""
+
+import io
+import json
+
+import pytest
+from PyPDF2 import PdfReader
+
+from scripts.load_test import ScenarioStats, _percentile, main, make_pdf, parse_mix
+
+
+def test_percentile_nearest_rank():
+    """Prueba los percentiles por rango más cercano."""
+    values = [float(v) for v in range(1, 101)]
+
+    assert _percentile(values, 0.50) == 50
+    assert _percentile(values, 0.95) == 95
+    assert _percentile(values, 0.99) == 99
+    assert _percentile([7.0], 0.99) == 7
+    assert _percentile([], 0.5) == 0.0
+
+
+def test_scenario_stats_summary():
+    """Prueba que el resumen cuenta errores, estados y throughput sobre la ventana medida."""
+    stats = ScenarioStats()
+    for i in range(9):
+        stats.record(0.1 * (i + 1), "200", True)
+    stats.record(2.0, "503", False)
+
+    summary = stats.summary(window=5.0)
+
+    assert summary["requests"] == 10
+    assert summary["error_rate"] == 0.1
+    assert summary["throughput_rps"] == 1.8
+    assert summary["status_counts"] == {"200": 9, "503": 1}
+    assert summary["latency_ms"]["p50"] == 500.0
+    assert summary["latency_ms"]["max"] == 2000.0
+
+
+def test_parse_mix_rejects_unknown_scenario():
+    """Prueba que la mezcla sólo admite escenarios conocidos."""
+    assert parse_mix("anon_chat=3,stream_chat") == {"anon_chat": 3.0, "stream_chat": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("anon_chat=1,nope=2")
+
+
+def test_make_pdf_is_readable():
+    """Prueba que el PDF generado para el escenario pdf_chat se puede extraer."""
+    reader = PdfReader(io.BytesIO(make_pdf("Ventas del trimestre")))
+
+    assert "Ventas del trimestre" in reader.pages[0].extract_text()
+
+
+def test_serve_run_writes_report(tmp_path, monkeypatch):
+    """Prueba una ejecución corta contra la app en proceso con el backend simulado."""
+    monkeypatch.setenv("FLASK_ENV", "testing")
+    monkeypatch.setenv("FAKE_GEMINI_ENABLED", "True")
+    monkeypatch.setenv("FAKE_GEMINI_TTFT_MS", "0")
+    monkeypatch.setenv("FAKE_GEMINI_TOKENS_PER_SECOND", "0")
+
+    exit_code = main(
+        [
+            "--serve",
+            "--users",
+            "2",
+            "--rate",
+            "20",
+            "--duration",
+            "1",
+            "--mix",
+            "anon_chat=2,auth_chat=1,stream_chat=1,pdf_chat=1",
+            "--output",
+            str(tmp_path),
+        ]
+    )
+
+    assert exit_code == 0
+    report = json.loads(next(tmp_path.glob("load_test_*.json")).read_text())
+    assert report["total"]["requests"] > 0
+    assert report["total"]["errors"] == 0
+    assert set(report["scenarios"]) == {"anon_chat", "auth_chat", "stream_chat", "pdf_chat"}
+    assert {"p50", "p95", "p99"} <= set(report["total"]["latency_ms"])
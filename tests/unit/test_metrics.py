@@ -0,0 +1,54 @@
+"""Pruebas para el gestor de métricas."""
+
+import pytest
+
+from app.core.metrics import MetricsManager, _percentile
+
+
+@pytest.fixture
+def metrics():
+    """Fixture con un MetricsManager limpio para cada prueba."""
+    return MetricsManager(max_history=100)
+
+
+def test_percentile_nearest_rank():
+    """Prueba el cálculo de percentiles por rango más cercano."""
+    values = [float(v) for v in range(1, 101)]
+    assert _percentile(values, 50) == 50.0
+    assert _percentile(values, 95) == 95.0
+    assert _percentile(values, 100) == 100.0
+    assert _percentile([], 50) == 0.0
+
+
+def test_record_timing_summarized_in_metrics(metrics):
+    """Prueba que las duraciones con nombre aparecen resumidas en get_metrics."""
+    for value in (0.1, 0.2, 0.3, 0.4):
+        metrics.record_timing("stream_ttft", value)
+
+    stats = metrics.get_metrics()["timing_stats"]["stream_ttft"]
+    assert stats["count"] == 4
+    assert stats["p50_seconds"] == 0.2
+    assert stats["max_seconds"] == 0.4
+    assert stats["avg_seconds"] == pytest.approx(0.25)
+
+
+def test_record_timing_respects_max_history():
+    """Prueba que cada historial de duraciones está acotado."""
+    metrics = MetricsManager(max_history=3)
+    for value in range(10):
+        metrics.record_timing("chunks", float(value))
+    assert metrics.get_timing_stats("chunks")["count"] == 3
+
+
+def test_reset_clears_timings(metrics):
+    """Prueba que reset_metrics también limpia las duraciones."""
+    metrics.record_timing("stream_ttft", 0.5)
+    metrics.reset_metrics()
+    assert metrics.get_metrics()["timing_stats"] == {}
+
+
+def test_set_gauge_overwrites_value(metrics):
+    """Prueba que los indicadores guardan sólo el último valor."""
+    metrics.set_gauge("loop_runner_pending", 3)
+    metrics.set_gauge("loop_runner_pending", 1)
+    assert metrics.get_metrics()["gauges"] == {"loop_runner_pending": 1}
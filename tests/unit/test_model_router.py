@@ -0,0 +1,83 @@
+"""Pruebas para el enrutador de modelos por complejidad."""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.core.metrics import metrics_manager
+from app.services.model_router import ModelRouter
+from app.services.tokenizer import TokenCounter
+
+
+@pytest.fixture(autouse=True)
+def _reset_metrics():
+    metrics_manager.reset_metrics()
+    yield
+    metrics_manager.reset_metrics()
+
+
+def _router(budgets=None):
+    budgets = budgets or {"basic": 4000, "fast": 16000, "pro": 64000}
+    config = MagicMock()
+    config.models = {tier: {} for tier in budgets}
+    config.get_context_budget.side_effect = lambda model_type: budgets[model_type]
+    config.estimate_cost.return_value = 0.002
+    return ModelRouter(config=config, counter=TokenCounter())
+
+
+def test_short_question_goes_to_basic():
+    """Prueba que una pregunta corta sin adjuntos va al nivel más barato."""
+    decision = _router().route("¿Qué hora es en Madrid?")
+
+    assert decision.model_type == "basic"
+    assert decision.reasons == []
+    assert metrics_manager.get_metrics()["counters"]["router_decisions_basic"] == 1
+
+
+def test_code_and_reasoning_go_to_pro():
+    """Prueba que el código junto con una petición de razonamiento va a 'pro'."""
+    prompt = "Analiza paso a paso por qué falla:\n```python\ndef f(x):\n    return x / 0\n```"
+    decision = _router().route(prompt)
+
+    assert decision.model_type == "pro"
+    assert {"codigo", "razonamiento"} <= set(decision.reasons)
+
+
+def test_attachment_goes_to_fast():
+    """Prueba que un adjunto sube la petición al nivel intermedio."""
+    decision = _router().route("Describe la imagen", has_image=True)
+
+    assert decision.model_type == "fast"
+    assert decision.reasons == ["adjunto"]
+
+
+def test_escalates_when_context_does_not_fit():
+    """Prueba que se sube de nivel si el documento no cabe en el presupuesto del elegido."""
+    decision = _router().route("Resume el documento", has_document=True, context_tokens=20000)
+
+    assert decision.model_type == "pro"
+    assert decision.reasons.count("contexto") == 1
+
+
+def test_override_is_respected_only_for_known_tiers():
+    """Prueba que un nivel impuesto se respeta y uno desconocido se ignora."""
+    router = _router()
+
+    forced = router.route("Hola", override="pro")
+    assert (forced.model_type, forced.overridden) == ("pro", True)
+    assert router.route("Hola", override="ultra").model_type == "basic"
+
+
+def test_record_outcome_separates_shadow_metrics():
+    """Prueba que latencia y coste se registran por nivel, con prefijo propio en modo sombra."""
+    router = _router()
+    decision = router.route("Hola")
+    router.record_outcome(decision, 0.5, "Buenas")
+    decision.applied = False
+    router.record_outcome(decision, 0.25, "Buenas")
+
+    counters = metrics_manager.get_metrics()["counters"]
+    assert counters["router_cost_microusd_basic"] == 2000
+    assert counters["router_shadow_cost_microusd_basic"] == 2000
+    assert metrics_manager.get_timing_stats("router_latency_basic")["count"] == 1
+    assert metrics_manager.get_timing_stats("router_shadow_latency_basic")["count"] == 1
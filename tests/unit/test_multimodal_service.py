@@ -3,9 +3,15 @@ Tests unitarios completos para el servicio multimodal.
 """
 
 import asyncio
+import base64
+import io
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
+from PIL import Image
+
 from app.services.multimodal_service import MultimodalService
 
 
@@ -77,20 +83,43 @@ class TestMultimodalService(unittest.TestCase):
 
         self.assertEqual(response, "Image received.")
 
-    @patch("pathlib.Path.exists", return_value=True)
-    def test_generate_response_with_image_path(self, mock_exists):
+    def test_generate_response_with_image_path(self):
         """Test generating a response with an image file path."""
+        received = {}
 
         async def mock_generate_response(*args, **kwargs):
+            received.update(kwargs)
             return {"response": "Image from path received."}
 
         self.mock_client.generate_response = mock_generate_response
 
-        image_path = "test_image.png"
-        response = self.run_async(self.service.generate_response("Analyze this image.", [image_path]))
+        with tempfile.TemporaryDirectory() as tmp:
+            image_path = os.path.join(tmp, "test_image.png")
+            Image.new("RGB", (8, 8), "red").save(image_path)
+            response = self.run_async(self.service.generate_response("Analyze this image.", [image_path]))
 
         self.assertEqual(response, "Image from path received.")
-        mock_exists.assert_called_once()
+        self.assertEqual(len(received["parts"]), 1)
+
+    def test_generate_response_downscales_large_images(self):
+        """Test that large images are downscaled and attached as parts."""
+        received = {}
+
+        async def mock_generate_response(*args, **kwargs):
+            received.update(kwargs)
+            return {"response": "ok"}
+
+        self.mock_client.generate_response = mock_generate_response
+        buffer = io.BytesIO()
+        Image.new("RGB", (4000, 3000), "blue").save(buffer, format="PNG")
+        data_url = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+        self.run_async(self.service.generate_response("Describe.", [data_url, "data:image/png;base64,bm90IGFuIGltYWdl"]))
+
+        self.assertEqual(len(received["parts"]), 1)
+        inline = received["parts"][0].inline_data
+        self.assertEqual(inline.mime_type, "image/jpeg")
+        self.assertEqual(Image.open(io.BytesIO(inline.data)).size, (1536, 1152))
 
     @patch("pathlib.Path.exists", return_value=False)
     def test_generate_response_with_nonexistent_image_path(self, mock_exists):
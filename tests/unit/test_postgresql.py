@@ -310,3 +310,22 @@ class TestDatabasePerformance:
 
             # Debe completarse en menos de 5 segundos
             assert duration < 5.0
+
+
+class TestSchemaUpgrade:
+    """Tests para la actualización de tablas existentes con columnas nuevas."""
+
+    def test_add_missing_columns_upgrades_existing_tables(self, app):
+        """Test que una tabla creada antes de añadir columnas se actualiza y se puede consultar."""
+        from app.config.database import add_missing_columns
+        from app.models import ChatSession, db
+
+        with db.engine.begin() as connection:
+            connection.execute(text("ALTER TABLE chat_sessions DROP COLUMN summary"))
+            connection.execute(text("ALTER TABLE chat_sessions DROP COLUMN summary_message_id"))
+
+        added = add_missing_columns(db)
+
+        assert sorted(added) == ["chat_sessions.summary", "chat_sessions.summary_message_id"]
+        assert ChatSession.query.count() == 0
+        assert add_missing_columns(db) == []
@@ -0,0 +1,94 @@
+"""Pruebas para la caché de respuestas exactas."""
+
+import threading
+import time
+
+import pytest
+
+from app.core.cache import CacheManager
+from app.services.response_cache import ResponseCache, build_cache_key
+
+
+@pytest.fixture
+def response_cache():
+    """Fixture con una caché de respuestas sobre un CacheManager propio."""
+    return ResponseCache(backend=CacheManager(default_ttl=60))
+
+
+def test_cache_key_normalizes_prompt():
+    """Prueba que espacios y mayúsculas no cambian la clave, pero el resto de campos sí."""
+    base = build_cache_key("¿Qué es Python?", [], "es", "gemini-2.0-flash-001", {"temperature": 0.7})
+
+    assert build_cache_key("  ¿qué es   python? ", [], "es", "gemini-2.0-flash-001", {"temperature": 0.7}) == base
+    assert build_cache_key("¿Qué es Python?", [], "en", "gemini-2.0-flash-001", {"temperature": 0.7}) != base
+    assert build_cache_key("¿Qué es Python?", [], "es", "otro-modelo", {"temperature": 0.7}) != base
+    assert build_cache_key("¿Qué es Python?", [], "es", "gemini-2.0-flash-001", {"temperature": 0.2}) != base
+    history = [{"role": "user", "parts": [{"text": "hola"}]}]
+    assert build_cache_key("¿Qué es Python?", history, "es", "gemini-2.0-flash-001", {"temperature": 0.7}) != base
+
+
+def test_get_or_compute_caches_value(response_cache):
+    """Prueba que la segunda llamada con la misma clave no vuelve a calcular."""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "respuesta"
+
+    assert response_cache.get_or_compute("k", compute, ttl=60) == "respuesta"
+    assert response_cache.get_or_compute("k", compute, ttl=60) == "respuesta"
+    assert len(calls) == 1
+
+
+def test_exceptions_are_not_cached(response_cache):
+    """Prueba que un fallo no se cachea y la siguiente llamada vuelve a intentarlo."""
+
+    def fail():
+        raise RuntimeError("upstream")
+
+    with pytest.raises(RuntimeError):
+        response_cache.get_or_compute("k", fail, ttl=60)
+
+    assert response_cache.get_or_compute("k", lambda: "ok", ttl=60) == "ok"
+
+
+def test_concurrent_misses_make_single_upstream_call(response_cache):
+    """Prueba la protección contra estampidas: N fallos simultáneos, una sola llamada."""
+    calls = []
+    results = []
+
+    def slow_compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "respuesta"
+
+    threads = [
+        threading.Thread(target=lambda: results.append(response_cache.get_or_compute("k", slow_compute, ttl=60)))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["respuesta"] * 10
+    assert response_cache._locks == {}
+
+
+def test_default_backend_is_bounded_lru_with_ttl():
+    """Prueba que el almacén por defecto expulsa por LRU al llenarse y descarta lo caducado."""
+    cache = ResponseCache(max_entries=2)
+
+    cache.get_or_compute("a", lambda: "uno", ttl=60)
+    cache.get_or_compute("b", lambda: "dos", ttl=60)
+    assert cache.get_or_compute("a", lambda: "otro", ttl=60) == "uno"
+    cache.get_or_compute("c", lambda: "tres", ttl=60)
+
+    assert len(cache.backend) == 2
+    assert cache.backend.get("b") is None
+    assert cache.backend.get("a") == "uno"
+
+    cache.backend.set("d", "cuatro", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.backend.get("d") is None
@@ -0,0 +1,173 @@
+"""Pruebas para la política de reintentos compartida."""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.core.adaptive_limiter import LimitExceededError
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.retry_policy import RetryBudget, RetryPolicy, is_retryable_error
+
+
+def _flaky(failures, error=None):
+    error = error or RuntimeError("503 Service Unavailable")
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error
+        return "ok"
+
+    return fn, calls
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (RuntimeError("429 Resource exhausted"), True),
+        (TimeoutError(), True),
+        (LimitExceededError("concurrency", "lleno"), True),
+        (LimitExceededError("rpd", "techo diario"), False),
+        (CircuitOpenError("abierto"), False),
+        (RuntimeError("API_KEY_INVALID"), False),
+        (ValueError("argumento inválido"), False),
+    ],
+)
+def test_classifies_retryable_errors(error, expected):
+    """Prueba qué errores se consideran transitorios."""
+    assert is_retryable_error(error) is expected
+
+
+@patch("app.core.retry_policy.time.sleep")
+def test_retries_transient_errors_with_jitter(mock_sleep):
+    """Prueba que un error transitorio se reintenta con una espera dentro del tope del intento."""
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0)
+    fn, calls = _flaky(2)
+
+    assert policy.call(fn) == "ok"
+    assert len(calls) == 3
+    first, second = (call.args[0] for call in mock_sleep.call_args_list)
+    assert 0 <= first <= 1.0 and 0 <= second <= 2.0
+
+
+@patch("app.core.retry_policy.time.sleep")
+def test_does_not_retry_client_errors(mock_sleep):
+    """Prueba que los errores no transitorios fallan al primer intento."""
+    policy = RetryPolicy()
+    fn, calls = _flaky(1, RuntimeError("API_KEY_INVALID"))
+
+    with pytest.raises(RuntimeError):
+        policy.call(fn)
+    assert len(calls) == 1
+    mock_sleep.assert_not_called()
+
+
+@patch("app.core.retry_policy.time.sleep")
+def test_budget_caps_retries(mock_sleep):
+    """Prueba que, sin fichas en el presupuesto, no se reintenta."""
+    policy = RetryPolicy(budget=RetryBudget(ratio=0.1, min_per_second=0, max_tokens=1))
+    fn, calls = _flaky(10)
+
+    with pytest.raises(RuntimeError):
+        policy.call(fn)
+    # Una ficha disponible: un único reintento.
+    assert len(calls) == 2
+
+
+def test_gives_up_when_the_wait_would_pass_the_deadline():
+    """Prueba que no se reintenta si la espera supera el plazo de la petición."""
+    policy = RetryPolicy(base_delay=5.0)
+    fn, calls = _flaky(1)
+
+    with patch("app.core.retry_policy.random.uniform", return_value=5.0):
+        with pytest.raises(RuntimeError):
+            policy.call(fn, deadline=time.monotonic() + 1.0)
+    assert len(calls) == 1
+
+
+def test_sync_sleeps_stay_within_deadline():
+    """
+    Prueba que, en la versión síncrona (que bloquea el hilo del worker), la suma de esperas entre
+    intentos nunca lleva la petición más allá de su plazo.
+    """
+
+    class FakeClock:
+        now = 1000.0
+        slept = []
+
+        def monotonic(self):
+            return self.now
+
+        def sleep(self, seconds):
+            self.slept.append(seconds)
+            self.now += seconds
+
+    clock = FakeClock()
+    calls = []
+
+    def fail_slowly():
+        calls.append(clock.now)
+        clock.now += 0.3
+        raise RuntimeError("503 unavailable")
+
+    with patch("app.core.retry_policy.time", clock), patch("app.core.retry_policy.random.uniform", lambda low, high: high):
+        policy = RetryPolicy(max_attempts=10, base_delay=1.0, budget=RetryBudget(initial_tokens=100, max_tokens=100))
+        deadline = clock.now + 5.0
+        with pytest.raises(RuntimeError):
+            policy.call(fail_slowly, deadline=deadline)
+
+    assert len(calls) > 1
+    assert sum(clock.slept) <= 5.0
+    # Cada intento empieza antes del plazo: ninguna espera termina después de él.
+    assert all(start < deadline for start in calls)
+
+
+def test_async_path_awaits_instead_of_sleeping():
+    """Prueba que la versión asíncrona espera con asyncio.sleep y crea una corutina por intento."""
+    policy = RetryPolicy(base_delay=0.01)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("reset")
+        return "ok"
+
+    with patch("app.core.retry_policy.time.sleep") as mock_sleep:
+        assert asyncio.run(policy.call_async(fn)) == "ok"
+    assert len(calls) == 2
+    mock_sleep.assert_not_called()
+
+
+def test_retry_ratio_stays_within_budget_under_sustained_failure():
+    """
+    Prueba que, con el proveedor caído, los reintentos se quedan cerca del 10 % de las peticiones
+    aunque el tráfico sea bajo (2 peticiones/s durante 10 minutos), sin ráfaga inicial.
+    """
+
+    class FakeClock:
+        now = 1000.0
+
+        def monotonic(self):
+            return self.now
+
+        def sleep(self, seconds):
+            pass
+
+    clock = FakeClock()
+    with patch("app.core.retry_policy.time", clock):
+        policy = RetryPolicy(max_attempts=3, budget=RetryBudget())
+        requests, retries = 1200, 0
+        for _ in range(requests):
+            fn, calls = _flaky(10, RuntimeError("503 unavailable"))
+            with pytest.raises(RuntimeError):
+                policy.call(fn)
+            retries += len(calls) - 1
+            clock.now += 0.5
+
+    # 10 % del tráfico + la reserva de 0,1/s (60 fichas en 600 s) + las 2 fichas iniciales.
+    assert retries <= 0.1 * requests + 0.1 * 600 + 2
+    assert retries / requests < 0.16
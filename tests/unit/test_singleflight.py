@@ -0,0 +1,135 @@
+"""Pruebas para la coalescencia de llamadas idénticas en vuelo."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def _run_in_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_singleflight_collapses_concurrent_calls():
+    """Prueba que N llamadas simultáneas con la misma clave hacen una sola llamada real."""
+    flight = SingleFlight("test_sf")
+    calls = []
+    results = []
+    barrier = threading.Barrier(8)
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "ok"
+
+    def worker():
+        barrier.wait()
+        results.append(flight.do("k", slow))
+
+    _run_in_threads(worker, 8)
+
+    assert len(calls) == 1
+    assert results == ["ok"] * 8
+    assert flight.inflight_count() == 0
+
+
+def test_singleflight_shares_errors():
+    """Prueba que la excepción de la llamada líder llega a todos los que esperaban."""
+    flight = SingleFlight("test_sf_err")
+    errors = []
+    barrier = threading.Barrier(4)
+
+    def slow_fail():
+        time.sleep(0.2)
+        raise RuntimeError("upstream")
+
+    def worker():
+        barrier.wait()
+        try:
+            flight.do("k", slow_fail)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    _run_in_threads(worker, 4)
+
+    assert errors == ["upstream"] * 4
+
+
+def test_singleflight_follower_waits_only_until_its_own_deadline():
+    """Prueba que quien espera a una llamada líder más lenta se rinde al vencer su propio plazo."""
+    flight = SingleFlight("test_sf_deadline")
+    started = threading.Event()
+    release = threading.Event()
+    leader_result = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "ok"
+
+    leader = threading.Thread(target=lambda: leader_result.append(flight.do("k", slow, deadline=time.monotonic() + 10)))
+    leader.start()
+    started.wait(1)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        flight.do("k", slow, deadline=time.monotonic() + 0.05)
+    assert time.monotonic() - start < 1
+
+    release.set()
+    leader.join(2)
+    assert leader_result == ["ok"]
+
+
+def test_singleflight_sequential_calls_are_not_collapsed():
+    """Prueba que una llamada posterior, ya terminada la primera, vuelve a ejecutarse."""
+    flight = SingleFlight("test_sf_seq")
+    calls = []
+    flight.do("k", lambda: calls.append(1))
+    flight.do("k", lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_singleflight_collapses_concurrent_calls():
+    """Prueba la coalescencia de corutinas idénticas."""
+    flight = AsyncSingleFlight("test_asf")
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"response": "ok"}
+
+    results = await asyncio.gather(*(flight.do("k", slow) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert all(result == {"response": "ok"} for result in results)
+    assert flight.inflight_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_async_singleflight_cancels_only_when_all_waiters_cancel():
+    """Prueba que cancelar un llamador no cancela la llamada compartida mientras otros esperan."""
+    flight = AsyncSingleFlight("test_asf_cancel")
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    first = asyncio.ensure_future(flight.do("k", slow))
+    await started.wait()
+    second = asyncio.ensure_future(flight.do("k", slow))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    assert await second == "ok"
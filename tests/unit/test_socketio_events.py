@@ -0,0 +1,128 @@
+"""Pruebas para el chat en tiempo real por Socket.IO."""
+
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from flask_jwt_extended import create_access_token, create_refresh_token
+
+from app.config.extensions import socketio
+from app.main import events
+
+
+def _events(client, name):
+    return [event["args"][0] for event in client.get_received() if event["name"] == name]
+
+
+def test_message_streams_chunks_and_keeps_history(app):
+    """Prueba que la respuesta llega en trozos y que la conversación se guarda en la conexión."""
+    service = app.config["GEMINI_SERVICE"]
+    service.generate_response_stream.side_effect = lambda **kwargs: iter(["Hola", ", mundo"])
+    client = socketio.test_client(app)
+    client.get_received()
+
+    client.emit("message", {"message": "Saluda", "request_id": "r1"})
+    received = client.get_received()
+    chunks = [event["args"][0] for event in received if event["name"] == "response_chunk"]
+    assert [chunk["text"] for chunk in chunks] == ["Hola", ", mundo"]
+    assert chunks[0]["request_id"] == "r1"
+    assert received[-1]["name"] == "response_done"
+
+    client.emit("message", {"message": "Otra vez"})
+    history = service.generate_response_stream.call_args.kwargs["history"]
+    assert [turn["parts"][0]["text"] for turn in history] == ["Saluda", "Hola, mundo"]
+    client.disconnect()
+
+
+def test_connect_authenticates_jwt_once(app, test_user):
+    """Prueba que un token válido identifica al usuario y uno inválido rechaza la conexión."""
+    from app.models import db
+
+    test_user.status = "active"
+    db.session.commit()
+    token = create_access_token(identity=str(test_user.id))
+    client = socketio.test_client(app, auth={"token": token})
+
+    assert _events(client, "status")[0]["authenticated"] is True
+    connection = next(c for c in events._connections.values() if c.user_id == test_user.id)
+    assert connection.owner == f"user:{test_user.id}"
+    client.disconnect()
+
+    assert not socketio.test_client(app, auth={"token": "no-es-un-token"}).is_connected()
+
+
+def test_connect_rejects_refresh_tokens(app, test_user):
+    """Prueba que un token de refresco no sirve para autenticar el socket."""
+    from app.models import db
+
+    test_user.status = "active"
+    db.session.commit()
+    refresh_token = create_refresh_token(identity=str(test_user.id))
+
+    assert not socketio.test_client(app, auth={"token": refresh_token}).is_connected()
+
+
+def test_slow_client_cancels_generation(app):
+    """Prueba que la generación se corta si la cola de salida del cliente no baja."""
+    closed = []
+
+    def stream(**kwargs):
+        try:
+            yield "uno"
+            yield "dos"
+        finally:
+            closed.append(True)
+
+    app.config["GEMINI_SERVICE"].generate_response_stream.side_effect = stream
+    app.config["SOCKETIO_SLOW_CLIENT_TIMEOUT_SECONDS"] = 0.1
+    client = socketio.test_client(app)
+    client.get_received()
+
+    with patch.object(events, "_pending_packets", return_value=1000):
+        client.emit("message", {"message": "Hola"})
+
+    assert _events(client, "response_error")[0]["message"] == "Cliente demasiado lento."
+    assert closed == [True]
+    client.disconnect()
+
+
+def test_invalid_message_reports_error(app):
+    """Prueba que un mensaje vacío se responde con `response_error`."""
+    client = socketio.test_client(app)
+    client.get_received()
+
+    client.emit("message", {"message": ""})
+
+    assert _events(client, "response_error")[0]["message"] == "El campo 'message' es requerido."
+    client.disconnect()
+
+
+def test_handshake_deadline_header_does_not_apply_to_messages(app):
+    """Prueba que X-Request-Deadline del handshake no fija el plazo de los mensajes siguientes."""
+    service = app.config["GEMINI_SERVICE"]
+    service.generate_response_stream.side_effect = lambda **kwargs: iter(["Hola"])
+    client = socketio.test_client(app, headers={"X-Request-Deadline": str(time.time() + 1)})
+    client.get_received()
+
+    client.emit("message", {"message": "Hola"})
+    remaining = service.generate_response_stream.call_args.kwargs["deadline"] - time.monotonic()
+    assert remaining > 30
+
+    client.emit("message", {"message": "Hola", "timeout": 5})
+    remaining = service.generate_response_stream.call_args.kwargs["deadline"] - time.monotonic()
+    assert 0 < remaining <= 5
+    client.disconnect()
+
+
+def test_pending_packets_falls_back_without_engineio_internals():
+    """Prueba que, sin acceso a la cola de engine.io, no hay contrapresión en lugar de un error."""
+    with patch.object(socketio, "server", SimpleNamespace(manager=None, eio=None)):
+        assert events._pending_packets("sid") == 0
+
+    queue = SimpleNamespace(qsize=lambda: 7)
+    server = SimpleNamespace(
+        manager=SimpleNamespace(eio_sid_from_sid=lambda sid, namespace: "eio-1"),
+        eio=SimpleNamespace(sockets={"eio-1": SimpleNamespace(queue=queue)}),
+    )
+    with patch.object(socketio, "server", server):
+        assert events._pending_packets("sid") == 7
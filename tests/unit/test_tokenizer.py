@@ -0,0 +1,71 @@
+"""Pruebas para el tokenizador local y la lectura de usage_metadata."""
+
+from types import SimpleNamespace
+
+from app.services.tokenizer import SegmentCountCache, TokenCounter, _segment_cache, usage_from_response
+
+
+def test_count_handles_spanish_code_and_numbers():
+    """Prueba que la estimación no depende sólo de los espacios."""
+    counter = TokenCounter()
+
+    assert counter.count("") == 0
+    assert counter.count("Hola") == 1
+    # Sin espacios, pero con muchos símbolos: cada uno cuenta.
+    assert counter.count("foo(bar[1],baz{2});") > 8
+    assert counter.count("1234567890") == 4
+    assert counter.count("internacionalización") > counter.count("casa")
+
+
+def test_count_segments_reuses_cached_segments():
+    """Prueba que los segmentos repetidos salen de la caché LRU."""
+    counter = TokenCounter()
+    system = "Eres un asistente útil y conciso. " * 20
+    counter.count_segments([system, "primera pregunta"])
+    hits_before = _segment_cache.hits
+
+    counter.count_segments([system, "segunda pregunta"])
+
+    assert _segment_cache.hits > hits_before
+    assert counter.get_stats()["cache_hits"] == _segment_cache.hits
+
+
+def test_segment_cache_keeps_long_segments_only_when_they_repeat():
+    """Prueba que los segmentos largos no se guardan a la primera y que la caché está acotada."""
+    cache = SegmentCountCache(max_entries=2, max_chars=100)
+    pdf = "Extracto largo de un PDF. " * 50
+
+    first = cache.count(pdf)
+    assert cache.get_stats()["cache_size"] == 0
+    assert cache.count(pdf) == first
+    assert cache.get_stats()["cache_size"] == 1
+    assert cache.count(pdf) == first
+    assert cache.hits == 1
+
+    for text in ("uno", "dos", "tres"):
+        cache.count(text)
+    assert cache.get_stats()["cache_size"] == 2
+    assert all(isinstance(key, bytes) for key in cache._counts)
+
+
+def test_calibrate_moves_ratio_towards_observed_usage():
+    """Prueba que el factor se ajusta con los recuentos reales y queda acotado."""
+    counter = TokenCounter(alpha=0.5, max_ratio=3.0)
+    text = "una frase de prueba con varias palabras"
+    raw = counter.count(text)
+
+    counter.calibrate([text], raw * 2)
+    assert counter.ratio == 2.0
+    assert counter.count(text) == raw * 2
+
+    counter.calibrate([text], raw * 100)
+    assert counter.ratio == 2.5  # la observación se limita a max_ratio antes de promediar
+
+
+def test_usage_from_response():
+    """Prueba la extracción de tokens de usage_metadata."""
+    response = SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=12, candidates_token_count=30))
+
+    assert usage_from_response(response) == (12, 30)
+    assert usage_from_response(SimpleNamespace()) is None
+    assert usage_from_response(SimpleNamespace(usage_metadata=SimpleNamespace(prompt_token_count=None))) is None